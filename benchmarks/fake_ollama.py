@@ -0,0 +1,320 @@
+"""Serveur HTTP léger imitant Ollama pour les tests de charge et de latence
+
+Implémente /api/tags, /api/generate (streaming NDJSON ou JSON simple, selon le
+champ ``stream``) et /api/embeddings, sans aucun modèle installé :
+
+- latence tirée d'une distribution (``fixed:0.2``, ``uniform:0.1,0.5``,
+  ``normal:0.3,0.05``, ``lognormal:-1.5,0.4`` en secondes) ;
+- ``token_delay`` entre deux fragments streamés (génération lente) ;
+- ``max_parallel`` requêtes traitées à la fois, ``max_queue`` en attente au-delà
+  (503 quand la file est pleine, comme OLLAMA_MAX_QUEUE) ;
+- injection de pannes : ``error_rate`` (HTTP 500), ``timeout_rate`` (réponse
+  retenue ``hang_seconds``), ``malformed_rate`` (texte qui n'est pas du JSON) ;
+- verdicts canoniques : ``verdicts`` associe une sous-chaîne du prompt à un
+  verdict, sinon canned_verdict (les noms « tmp » / « backup » sont supprimables).
+  Les prompts par lot (``[id] Name: ...``) reçoivent un verdict par identifiant.
+
+En ligne de commande : ``python -m benchmarks.fake_ollama --port 11434 --latency lognormal:-1.5,0.4``
+puis ``OLLAMA_URL=http://127.0.0.1:11434 python server.py``.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+BATCH_ID = re.compile(r'^\[(\d+)\] Name:', re.MULTILINE)
+FILE_NAME = re.compile(r'Name:\s*([^|\n]*)')
+EMBEDDING_SIZE = 64
+
+def canned_verdict(prompt: str) -> Dict:
+    """Verdict déterministe : les noms « tmp » / « backup » sont supprimables"""
+    match = FILE_NAME.search(prompt)
+    lowered = (match.group(1) if match else prompt).lower()
+    if 'tmp' in lowered or 'backup' in lowered:
+        return {'can_delete': True, 'reason': 'Fichier temporaire ou copie', 'importance': 'low'}
+    return {'can_delete': False, 'reason': 'Contenu potentiellement utile', 'importance': 'medium'}
+
+def parse_latency(spec) -> Callable[[random.Random], float]:
+    """Distribution de latence depuis ``kind:a,b`` (ou un nombre = latence fixe)"""
+    if ':' not in str(spec):
+        spec = f'fixed:{spec}'
+    kind, _, params = str(spec).partition(':')
+    try:
+        values = [float(v) for v in params.split(',') if v.strip()]
+    except ValueError:
+        raise ValueError(f'Latence invalide: {spec}')
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(*values)
+    if kind == 'normal' and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(*values))
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda rng: rng.lognormvariate(*values)
+    raise ValueError(f'Latence invalide: {spec} (fixed:s, uniform:a,b, normal:mu,sigma, lognormal:mu,sigma)')
+
+class FakeOllama:
+    """Serveur en thread de fond : ``with FakeOllama(latency='uniform:0.05,0.2') as fake: fake.url``"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency=0.0, token_delay: float = 0.0,
+                 max_parallel: int = 0, max_queue: int = 512, error_rate: float = 0.0,
+                 timeout_rate: float = 0.0, hang_seconds: float = 60.0, malformed_rate: float = 0.0,
+                 verdicts: Optional[Dict[str, Dict]] = None, models=('llama3:8b',), seed: Optional[int] = None):
+        self.latency = parse_latency(latency)
+        self.token_delay = token_delay
+        self.max_queue = max_queue
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.malformed_rate = malformed_rate
+        self.verdicts = dict(verdicts or {})
+        self.models = list(models)
+        self.stats = {'requests': 0, 'generate': 0, 'embeddings': 0, 'rejected': 0, 'errors': 0,
+                      'timeouts': 0, 'malformed': 0, 'active': 0, 'max_active': 0, 'waiting': 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_parallel) if max_parallel > 0 else None
+        self._closing = threading.Event()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def requests(self) -> int:
+        """Requêtes /api/generate reçues"""
+        return self.stats['generate']
+
+    def start(self) -> 'FakeOllama':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._closing.set()  # libère les requêtes retenues par timeout_rate
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, key: str, delta: int = 1):
+        with self._lock:
+            self.stats[key] += delta
+            if key == 'active':
+                self.stats['max_active'] = max(self.stats['max_active'], self.stats['active'])
+
+    def _draw(self) -> Dict:
+        """Tirage (sous verrou : random.Random n'est pas partagé sans risque) de la latence et des pannes"""
+        with self._lock:
+            roll = self._rng.random()
+            delay = self.latency(self._rng)
+        fault = None
+        for name, rate in (('error', self.error_rate), ('timeout', self.timeout_rate),
+                           ('malformed', self.malformed_rate)):
+            if roll < rate:
+                fault = name
+                break
+            roll -= rate
+        return {'delay': delay, 'fault': fault}
+
+    def verdict_for(self, prompt: str) -> Dict:
+        for needle, verdict in self.verdicts.items():
+            if needle in prompt:
+                return dict(verdict)
+        return canned_verdict(prompt)
+
+    def respond(self, payload: Dict) -> str:
+        """Texte de la réponse du modèle pour une requête /api/generate"""
+        prompt = payload.get('prompt', '')
+        ids = BATCH_ID.findall(prompt)
+        if ids:
+            entries = re.split(r'^\[\d+\] ', prompt, flags=re.MULTILINE)[1:]
+            return json.dumps([dict(self.verdict_for(entry), id=int(i)) for i, entry in zip(ids, entries)])
+        return json.dumps(self.verdict_for(prompt))
+
+    @staticmethod
+    def embedding(text: str):
+        """Vecteur déterministe et normalisé dérivé du texte"""
+        vector = [b / 255.0 - 0.5 for b in hashlib.shake_256(text.encode()).digest(EMBEDDING_SIZE)]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _acquire(self) -> bool:
+        """Prend un créneau de traitement ; False si la file d'attente est pleine"""
+        if self._slots is None:
+            return True
+        if self._slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            if self.stats['waiting'] >= self.max_queue:
+                self.stats['rejected'] += 1
+                return False
+            self.stats['waiting'] += 1
+        self._slots.acquire()
+        self._count('waiting', -1)
+        return True
+
+    def _release(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = 'application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status: int, body: Dict):
+                self._send(status, json.dumps(body).encode())
+
+            def do_GET(self):
+                fake._count('requests')
+                if self.path == '/api/tags':
+                    self._send_json(200, {'models': [{'name': name, 'model': name} for name in fake.models]})
+                else:
+                    self._send_json(404, {'error': 'not found'})
+
+            def do_POST(self):
+                fake._count('requests')
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    self._send_json(400, {'error': 'invalid JSON'})
+                    return
+                if self.path not in ('/api/generate', '/api/embeddings'):
+                    self._send_json(404, {'error': 'not found'})
+                    return
+                if payload.get('model') and payload['model'] not in fake.models:
+                    self._send_json(404, {'error': f"model '{payload['model']}' not found"})
+                    return
+
+                if not fake._acquire():
+                    self._send_json(503, {'error': 'server busy, please try again'})
+                    return
+                fake._count('active')
+                try:
+                    draw = fake._draw()
+                    if draw['fault'] == 'timeout':
+                        fake._count('timeouts')
+                        fake._closing.wait(fake.hang_seconds)
+                    elif draw['delay']:
+                        time.sleep(draw['delay'])
+                    if draw['fault'] == 'error':
+                        fake._count('errors')
+                        self._send_json(500, {'error': 'injected failure'})
+                    elif self.path == '/api/embeddings':
+                        fake._count('embeddings')
+                        self._send_json(200, {'embedding': fake.embedding(payload.get('prompt', ''))})
+                    else:
+                        fake._count('generate')
+                        self._generate(payload, draw)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client qui coupe dès le verdict complet, ou parti sur timeout
+                finally:
+                    fake._count('active', -1)
+                    fake._release()
+
+            def _generate(self, payload: Dict, draw: Dict):
+                started = time.monotonic()
+                if draw['fault'] == 'malformed':
+                    fake._count('malformed')
+                    text = 'Bien sûr ! Voici mon avis : ce fichier {can_delete: peut-être'
+                else:
+                    # Prompt vide = chargement du modèle (préchauffage)
+                    text = fake.respond(payload) if payload.get('prompt') else ''
+                prompt_tokens = len(payload.get('prompt', '')) // 4
+                final = {'model': payload.get('model'), 'done': True, 'done_reason': 'stop',
+                         'prompt_eval_count': prompt_tokens,
+                         'prompt_eval_duration': int(draw['delay'] * 1e9),
+                         'load_duration': 0}
+                pieces = [text[i:i + 8] for i in range(0, len(text), 8)]
+
+                if not payload.get('stream', True):
+                    if fake.token_delay:
+                        time.sleep(fake.token_delay * len(pieces))
+                    final['total_duration'] = int((time.monotonic() - started + draw['delay']) * 1e9)
+                    self._send_json(200, dict(final, response=text))
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for piece in pieces:
+                    self._chunk({'model': payload.get('model'), 'response': piece, 'done': False})
+                    if fake.token_delay:
+                        time.sleep(fake.token_delay)
+                final['total_duration'] = int((time.monotonic() - started + draw['delay']) * 1e9)
+                self._chunk(dict(final, response=''))
+                self.wfile.write(b'0\r\n\r\n')
+
+            def _chunk(self, obj: Dict):
+                data = json.dumps(obj).encode() + b'\n'
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+
+        return Handler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Faux serveur Ollama (tests de charge)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--latency', default='fixed:0.2', help='fixed:s | uniform:a,b | normal:mu,sigma | lognormal:mu,sigma')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='délai entre fragments streamés (s)')
+    parser.add_argument('--max-parallel', type=int, default=0, help='requêtes traitées à la fois (0 = illimité)')
+    parser.add_argument('--max-queue', type=int, default=512)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    parser.add_argument('--hang-seconds', type=float, default=60.0)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    parser.add_argument('--verdicts', help='fichier JSON {"sous-chaîne du prompt": verdict}')
+    parser.add_argument('--model', action='append', dest='models', help='modèle annoncé (répétable)')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    verdicts = None
+    if args.verdicts:
+        with open(args.verdicts, encoding='utf-8') as f:
+            verdicts = json.load(f)
+    fake = FakeOllama(args.host, args.port, latency=args.latency, token_delay=args.token_delay,
+                      max_parallel=args.max_parallel, max_queue=args.max_queue, error_rate=args.error_rate,
+                      timeout_rate=args.timeout_rate, hang_seconds=args.hang_seconds,
+                      malformed_rate=args.malformed_rate, verdicts=verdicts,
+                      models=args.models or ('llama3:8b',), seed=args.seed)
+    print(f'🤖 Faux Ollama sur {fake.url} (Ctrl+C pour arrêter)')
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake._server.server_close()
+        print(json.dumps(fake.stats, indent=2))
+
+if __name__ == '__main__':
+    main()
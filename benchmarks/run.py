@@ -0,0 +1,351 @@
+"""Suite de benchmarks : scan, classification, règles, aperçus, analyse, suppression et mémoire
+
+Usage :
+    python -m benchmarks.run [--depth 3 --fanout 4 --files-per-dir 20 --repeat 3]
+                             [--only scan,rules] [--output resultats.json] [--compare ancien.json]
+
+Chaque benchmark tourne sur une arborescence synthétique reproductible
+(benchmarks.synthetic_fs) ; l'analyse interroge un faux serveur Ollama local.
+Les résultats sont écrits en JSON (commit, paramètres, durées min/médiane
+par benchmark) pour comparer les runs d'un commit à l'autre.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.fake_ollama import FakeOllama
+from benchmarks.synthetic_fs import build_tree
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+@contextlib.contextmanager
+def _stdout_to_stderr():
+    """Redirige le descripteur 1 vers stderr (y compris pour les processus d'extraction lancés entre-temps)"""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _measure(name: str, run: Callable[[], int], repeat: int, setup: Optional[Callable[[], None]] = None,
+             **extra) -> Dict:
+    """Chronomètre ``run`` (qui retourne le nombre d'opérations) ``repeat`` fois"""
+    durations, ops = [], 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        ops = run()
+        durations.append(time.perf_counter() - started)
+    best = min(durations)
+    result = {
+        'name': name,
+        'ops': ops,
+        'repeat': repeat,
+        'min_s': round(best, 6),
+        'median_s': round(statistics.median(durations), 6),
+        'ops_per_s': round(ops / best, 1) if best > 0 else None
+    }
+    result.update(extra)
+    print(f"  {name:<24} {result['median_s'] * 1000:10.1f} ms  ({ops} ops, {result['ops_per_s']} ops/s)",
+          file=sys.stderr)
+    return result
+
+class Context:
+    """Arborescence, serveur factice et module server partagés par les benchmarks"""
+
+    def __init__(self, args, workdir: Path):
+        self.args = args
+        self.workdir = workdir
+        self.tree_params = {'depth': args.depth, 'fanout': args.fanout,
+                            'files_per_dir': args.files_per_dir, 'seed': args.seed}
+        self.root = workdir / 'tree'
+        self.manifest = build_tree(self.root, **self.tree_params)
+
+        self.fake = FakeOllama(latency=args.llm_latency, max_parallel=args.llm_max_parallel, seed=args.seed).start()
+        # server lit sa configuration à l'import : données temporaires, faux Ollama
+        os.environ['AI_CLEANER_DATA_DIR'] = str(workdir / 'data')
+        os.environ['OLLAMA_URL'] = self.fake.url
+        os.environ['VERDICT_CACHE_ENABLED'] = 'False'
+        sys.path.insert(0, str(REPO_ROOT))
+        import server
+        self.server = server
+        self._candidates = None
+
+    def scan(self, index=None, full=False) -> Dict:
+        server = self.server
+        categories = set(server.CATEGORIES) | {'Autres'}
+        return server.scan_directory(str(self.root), 30, 0, threading.Event(), categories,
+                                     index=index or self.index(), full=full)
+
+    def index(self, name: str = 'index.sqlite3'):
+        return self.server.ScanIndex(self.workdir / name)
+
+    @property
+    def candidates(self) -> List[Dict]:
+        if self._candidates is None:
+            self._candidates = self.scan()['candidates']
+        return self._candidates
+
+    def names(self) -> List[str]:
+        return [name for _, _, files in os.walk(self.root) for name in files]
+
+    def close(self):
+        self.fake.stop()
+
+def bench_scan(ctx: Context, repeat: int) -> List[Dict]:
+    cold_indexes = []
+
+    def fresh_index():
+        cold_indexes.append(ctx.index(f'cold-{len(cold_indexes)}.sqlite3'))
+
+    def cold():
+        return ctx.scan(index=cold_indexes[-1])['total_files']
+
+    warm_index = ctx.index('warm.sqlite3')
+    ctx.scan(index=warm_index)
+    return [
+        _measure('scan_cold', cold, repeat, setup=fresh_index, dirs=ctx.manifest['dirs']),
+        _measure('scan_incremental', lambda: ctx.scan(index=warm_index)['total_files'], repeat),
+        _measure('scan_full_rescan', lambda: ctx.scan(index=warm_index, full=True)['total_files'], repeat),
+    ]
+
+def bench_protected(ctx: Context, repeat: int) -> List[Dict]:
+    names = ctx.names()
+    is_protected = ctx.server.is_protected
+
+    def run():
+        for name in names:
+            is_protected(name)
+        return len(names)
+    return [_measure('is_protected', run, repeat)]
+
+def bench_rules(ctx: Context, repeat: int) -> List[Dict]:
+    candidates = ctx.candidates
+    apply_local_rules = ctx.server.apply_local_rules
+    decided = {'n': 0}
+
+    def run():
+        decided['n'] = sum(1 for c in candidates if apply_local_rules(c, None))
+        return len(candidates)
+    result = _measure('apply_local_rules', run, repeat)
+    result['decided'] = decided['n']
+    return [result]
+
+def bench_previews(ctx: Context, repeat: int) -> List[Dict]:
+    server = ctx.server
+    files = [(os.path.join(root, name), os.path.splitext(name)[1].lower())
+             for root, _, names in os.walk(ctx.root) for name in names]
+    files = [(path, ext) for path, ext in files if ext in server.PREVIEW_EXTRACTORS]
+
+    def run():
+        for path, ext in files:
+            server.extract_text_preview(path, ext)
+        return len(files)
+    return [_measure('extract_text_preview', run, repeat)]
+
+def bench_analyze(ctx: Context, repeat: int) -> List[Dict]:
+    server = ctx.server
+    server.ollama_health.refresh()
+    # Les règles locales tranchent une partie des candidats : seuls les autres vont au modèle
+    candidates = ctx.candidates[:ctx.args.analyze_limit]
+    results = []
+    for batch_size in sorted({1, ctx.args.batch_size}):
+        requests_before = ctx.fake.requests
+
+        def run():
+            return len(server.analyze_batch(candidates, concurrency=ctx.args.concurrency,
+                                            batch_size=batch_size))
+        result = _measure(f'analyze_batch_b{batch_size}', run, repeat, batch_size=batch_size,
+                          concurrency=ctx.args.concurrency, llm_latency=ctx.args.llm_latency)
+        result['llm_requests'] = (ctx.fake.requests - requests_before) // repeat
+        result['llm_max_active'] = ctx.fake.stats['max_active']
+        results.append(result)
+    return results
+
+def bench_delete(ctx: Context, repeat: int) -> List[Dict]:
+    server = ctx.server
+    client = server.app.test_client()
+    done = threading.Event()
+    real_emit = server.socketio.emit
+
+    def emit(event, *args, **kwargs):
+        if event == 'delete_complete':
+            done.set()
+        return real_emit(event, *args, **kwargs)
+    server.socketio.emit = emit
+
+    params = dict(ctx.tree_params, depth=max(1, ctx.args.depth - 1))
+    results = []
+    try:
+        for mode in ('delete', 'quarantine'):
+            target = ctx.workdir / f'delete-{mode}'
+            paths: List[str] = []
+
+            def setup():
+                shutil.rmtree(target, ignore_errors=True)
+                build_tree(target, **params)
+                server.state['last_scan_path'] = str(target)
+                paths[:] = [os.path.join(root, name) for root, _, names in os.walk(target) for name in names]
+                done.clear()
+
+            def run():
+                response = client.post('/api/delete', json={'files': paths, 'mode': mode})
+                assert response.status_code == 200, response.get_json()
+                done.wait(600)
+                return len(paths)
+            results.append(_measure(f'api_delete_{mode}', run, repeat, setup=setup))
+    finally:
+        server.socketio.emit = real_emit
+    return results
+
+def _allocated(build: Callable[[], object]) -> int:
+    """Octets alloués (et encore vivants) par ``build``"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del kept
+    return allocated
+
+def bench_memory(ctx: Context, repeat: int) -> List[Dict]:
+    """Mémoire par fichier des candidats et résultats : un dict par fichier contre les stores en colonnes"""
+    server = ctx.server
+    store = ctx.candidates
+    n = len(store)
+    # Verdicts construits hors mesure : règle (raison partagée) ou LLM (raison propre au fichier)
+    analyses = []
+    for i, candidate in enumerate(store):
+        analyses.append(server.apply_local_rules(candidate, None) or {
+            'can_delete': i % 3 == 0, 'importance': 'low', 'reason': f'Fichier {i} sans valeur',
+            'time_to_verdict_ms': 120.5, 'prompt_eval_ms': 30.2})
+
+    def dict_layout():
+        candidates = list(store)
+        return candidates, [server._make_record(c, a) for c, a in zip(candidates, analyses)]
+
+    def columnar_layout():
+        compact = server.CandidateStore(store)
+        results = server.ResultStore(compact)
+        for i, analysis in enumerate(analyses):
+            results.add(i, analysis)
+        return compact, results
+
+    results = []
+    for name, build in (('dicts', dict_layout), ('columnar', columnar_layout)):
+        result = _measure(f'memory_{name}', lambda: len(build()[0]), repeat)
+        allocated = _allocated(build)
+        result.update(bytes=allocated, bytes_per_file=round(allocated / n, 1) if n else None)
+        print(f"  {'':<24} {result['bytes_per_file']} octets par fichier (candidat + résultat)", file=sys.stderr)
+        results.append(result)
+    return results
+
+BENCHMARKS = {
+    'scan': bench_scan,
+    'protected': bench_protected,
+    'rules': bench_rules,
+    'previews': bench_previews,
+    'analyze': bench_analyze,
+    'delete': bench_delete,
+    'memory': bench_memory,
+}
+
+def compare(current: Dict, baseline: Dict):
+    """Affiche le rapport des médianes (actuel / référence) par benchmark"""
+    before = {r['name']: r for r in baseline.get('results', [])}
+    print(f"\nComparaison avec {baseline.get('commit') or '?'} :", file=sys.stderr)
+    for result in current['results']:
+        old = before.get(result['name'])
+        if old and old.get('median_s') and result.get('median_s'):
+            ratio = result['median_s'] / old['median_s']
+            print(f"  {result['name']:<24} x{ratio:5.2f}  ({old['median_s'] * 1000:.1f} -> "
+                  f"{result['median_s'] * 1000:.1f} ms)", file=sys.stderr)
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description='Benchmarks AI Cleaner')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--files-per-dir', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', default='', help='benchmarks à lancer, séparés par des virgules')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--analyze-limit', type=int, default=200, help='candidats max envoyés à analyze_batch')
+    parser.add_argument('--llm-latency', default='0.02',
+                        help='latence du faux Ollama : secondes ou distribution (uniform:a,b, lognormal:mu,sigma...)')
+    parser.add_argument('--llm-max-parallel', type=int, default=0,
+                        help='requêtes traitées à la fois par le faux Ollama (0 = illimité, cf. OLLAMA_NUM_PARALLEL)')
+    parser.add_argument('--output', help='fichier JSON de sortie (défaut: stdout)')
+    parser.add_argument('--compare', help='résultats JSON de référence')
+    args = parser.parse_args(argv)
+
+    selected = [name.strip() for name in args.only.split(',') if name.strip()] or list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'benchmarks inconnus: {", ".join(sorted(unknown))}')
+
+    workdir = Path(tempfile.mkdtemp(prefix='ai_cleaner_bench_'))
+    try:
+        print(f'🌲 Arborescence synthétique dans {workdir}', file=sys.stderr)
+        # Les print() de server ne doivent pas se mêler au JSON écrit sur stdout
+        with _stdout_to_stderr():
+            ctx = Context(args, workdir)
+            print(f"   {ctx.manifest['files']} fichiers, {ctx.manifest['dirs']} dossiers", file=sys.stderr)
+            results = []
+            try:
+                for name in selected:
+                    results.extend(BENCHMARKS[name](ctx, args.repeat))
+            finally:
+                ctx.close()
+        report = {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'tree': {key: ctx.manifest[key] for key in ('files', 'dirs', 'bytes', 'protected')},
+            'results': results
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+    return report
+
+if __name__ == '__main__':
+    main()
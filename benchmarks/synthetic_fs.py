@@ -0,0 +1,107 @@
+"""Générateur d'arborescences synthétiques reproductibles pour les benchmarks
+
+Même graine + mêmes paramètres = mêmes noms, tailles, âges et contenus. Les
+gros fichiers sont creux (truncate) : leur taille apparente compte pour le scan
+et les règles sans coûter d'écriture disque. Les fichiers texte, PDF et docx
+gardent leur taille réelle (quelques Ko) pour rester lisibles par l'extraction
+d'aperçus.
+"""
+
+import os
+import random
+import time
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+DEFAULT_PROTECTED_KEYWORDS = ('facture', 'contrat', 'passeport', 'invoice', 'rib', 'bulletin de salaire')
+DEFAULT_WORDS = ('rapport', 'photo', 'vacances', 'export', 'notes', 'projet', 'backup', 'draft',
+                 'scan', 'video', 'musique', 'setup', 'archive', 'copie', 'final', 'v2')
+# Extensions et poids relatifs (proportions approximatives d'un dossier personnel)
+DEFAULT_EXTENSIONS = {
+    '.jpg': 20, '.png': 10, '.txt': 8, '.pdf': 8, '.docx': 4, '.csv': 3, '.mp4': 3,
+    '.mp3': 5, '.zip': 4, '.dmg': 1, '.json': 4, '.md': 3, '.bin': 5, '.tmp': 2,
+}
+TEXT_EXTENSIONS = {'.txt', '.csv', '.json', '.md'}
+
+def _pdf_bytes(text: str) -> bytes:
+    content = zlib.compress(f'BT /F1 12 Tf 72 700 Td ({text}) Tj ET'.encode('latin-1', 'replace'))
+    return (b'%%PDF-1.4\n1 0 obj\n<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content)
+            + content + b'\nendstream\nendobj\n%%EOF\n')
+
+def _write_docx(path: Path, text: str):
+    body = ''.join(f'<w:p><w:r><w:t>{text} {i}</w:t></w:r></w:p>' for i in range(50))
+    entry = zipfile.ZipInfo('word/document.xml', date_time=(2020, 1, 1, 0, 0, 0))  # octets identiques d'un run à l'autre
+    entry.compress_type = zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr(entry, f'<w:document><w:body>{body}</w:body></w:document>')
+
+def _make_name(rng: random.Random, words: Sequence[str], keywords: Sequence[str],
+               protected_ratio: float, screenshot_ratio: float, temporary_ratio: float) -> str:
+    roll = rng.random()
+    if roll < protected_ratio:
+        return f'{rng.choice(keywords)}_{rng.randint(2010, 2025)}'
+    roll -= protected_ratio
+    if roll < screenshot_ratio:
+        return f'Screenshot {rng.randint(2015, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+    roll -= screenshot_ratio
+    stem = '_'.join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+    if roll < temporary_ratio:
+        stem += '_tmp'
+    return f'{stem}_{rng.randint(0, 99999)}'
+
+def build_tree(root, depth: int = 3, fanout: int = 4, files_per_dir: int = 20, seed: int = 42,
+               protected_ratio: float = 0.05, screenshot_ratio: float = 0.05, temporary_ratio: float = 0.05,
+               min_size: int = 100, max_size: int = 200 * 1024 * 1024, max_age_days: int = 1500,
+               extensions: Optional[Dict[str, int]] = None, protected_keywords: Sequence[str] = DEFAULT_PROTECTED_KEYWORDS,
+               words: Sequence[str] = DEFAULT_WORDS) -> Dict:
+    """Construit l'arborescence sous ``root`` et retourne son manifeste
+
+    ``depth`` niveaux de ``fanout`` sous-dossiers, ``files_per_dir`` fichiers par
+    dossier. Tailles log-uniformes dans [min_size, max_size] (hors fichiers à
+    contenu), âges uniformes dans [0, max_age_days] jours.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    extensions = extensions or DEFAULT_EXTENSIONS
+    ext_names, ext_weights = list(extensions), list(extensions.values())
+    now = time.time()
+    manifest = {'root': str(root), 'seed': seed, 'dirs': 0, 'files': 0, 'bytes': 0,
+                'protected': 0, 'by_ext': {}}
+
+    def fill(folder: Path, level: int):
+        folder.mkdir(parents=True, exist_ok=True)
+        manifest['dirs'] += 1
+        for _ in range(files_per_dir):
+            ext = rng.choices(ext_names, ext_weights)[0]
+            name = _make_name(rng, words, protected_keywords, protected_ratio, screenshot_ratio, temporary_ratio)
+            path = folder / f'{name}{ext}'
+            size = int(min_size * (max_size / min_size) ** rng.random())
+            age_days = rng.uniform(0, max_age_days)
+
+            if ext in TEXT_EXTENSIONS:
+                path.write_text(f'{name}\n' + 'ligne de données synthétiques\n' * 64)
+            elif ext == '.pdf':
+                path.write_bytes(_pdf_bytes(f'Document {name}'))
+            elif ext == '.docx':
+                _write_docx(path, f'Paragraphe {name}')
+            else:
+                # Fichier creux : taille apparente sans écriture
+                with open(path, 'wb') as f:
+                    f.truncate(size)
+            size = path.stat().st_size
+            mtime = now - age_days * 86400
+            os.utime(path, (mtime, mtime))
+
+            manifest['files'] += 1
+            manifest['bytes'] += size
+            manifest['by_ext'][ext] = manifest['by_ext'].get(ext, 0) + 1
+            if any(keyword in name for keyword in protected_keywords):
+                manifest['protected'] += 1
+        if level < depth:
+            for i in range(fanout):
+                fill(folder / f'{rng.choice(words)}_{level}_{i}', level + 1)
+
+    fill(root, 0)
+    return manifest
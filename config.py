@@ -18,6 +18,85 @@ OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434').rstrip('/')
 OLLAMA_TIMEOUT = int(os.getenv('OLLAMA_TIMEOUT', 30))
 OLLAMA_ENABLED = os.getenv('OLLAMA_ENABLED', 'True').lower() == 'true'
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3:8b')
+# Requêtes /api/generate simultanées (à aligner sur OLLAMA_NUM_PARALLEL côté serveur)
+OLLAMA_CONCURRENCY = int(os.getenv('OLLAMA_CONCURRENCY', 4))
+# Santé Ollama : durée de validité du statut en cache et disjoncteur
+OLLAMA_HEALTH_TTL = float(os.getenv('OLLAMA_HEALTH_TTL', 10))
+OLLAMA_BREAKER_THRESHOLD = int(os.getenv('OLLAMA_BREAKER_THRESHOLD', 3))
+OLLAMA_BREAKER_COOLDOWN = float(os.getenv('OLLAMA_BREAKER_COOLDOWN', 30))
+# Mode par lot : fichiers max par requête (1 = désactivé) et budget de tokens du prompt
+ANALYSIS_BATCH_SIZE = int(os.getenv('ANALYSIS_BATCH_SIZE', 1))
+ANALYSIS_BATCH_TOKENS = int(os.getenv('ANALYSIS_BATCH_TOKENS', 2048))
+# Ordre d'analyse ("priority" : octets récupérables par coût d'abord, "scan" : ordre du parcours)
+# et budgets par défaut d'une analyse (0 = illimité) : durée en secondes, requêtes Ollama
+ANALYSIS_ORDER = os.getenv('ANALYSIS_ORDER', 'priority')
+ANALYSIS_TIME_BUDGET = float(os.getenv('ANALYSIS_TIME_BUDGET', 0))
+ANALYSIS_LLM_BUDGET = int(os.getenv('ANALYSIS_LLM_BUDGET', 0))
+# Réponses en streaming (coupées dès que le verdict JSON est complet) et sortie structurée :
+# "schema" (schéma JSON du verdict), "json" (JSON libre) ou "" (texte nettoyé, anciens serveurs)
+OLLAMA_STREAM = os.getenv('OLLAMA_STREAM', 'True').lower() == 'true'
+OLLAMA_FORMAT = os.getenv('OLLAMA_FORMAT', 'schema').lower()
+# Maintien du modèle en mémoire entre deux requêtes (format Ollama : "30m", "1h", "-1"...)
+# et modèle préchargé au démarrage du serveur (vide = aucun)
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+OLLAMA_WARMUP_MODEL = os.getenv('OLLAMA_WARMUP_MODEL', '')
+OLLAMA_WARMUP_TIMEOUT = 120  # chargement d'un gros modèle depuis le disque
+
+# Données persistantes (index de scan, caches...)
+DATA_DIR = Path(os.getenv('AI_CLEANER_DATA_DIR', str(Path.home() / '.ai_cleaner')))
+INDEX_DB_PATH = Path(os.getenv('AI_CLEANER_INDEX_DB', str(DATA_DIR / 'index.sqlite3')))
+
+# Parcours parallèle : nombre de threads qui listent/stat les dossiers
+SCAN_WORKERS = int(os.getenv('SCAN_WORKERS', 8))
+
+# Diffusion des résultats : taille des paquets Socket.IO
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 500))
+
+# Mode pipeline scan -> analyse : candidats en attente max entre les deux étages
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 256))
+
+# Progression et logs : émissions max par seconde et lignes de log en attente
+EVENT_RATE_HZ = float(os.getenv('EVENT_RATE_HZ', 10))
+LOG_BATCH_MAX = int(os.getenv('LOG_BATCH_MAX', 500))
+
+# Doublons : threads de hachage
+DUPLICATE_WORKERS = int(os.getenv('DUPLICATE_WORKERS', 4))
+# Suppression en tâche de fond : workers d'unlink parallèles et fichiers par paquet
+DELETE_WORKERS = int(os.getenv('DELETE_WORKERS', 8))
+DELETE_CHUNK_SIZE = int(os.getenv('DELETE_CHUNK_SIZE', 256))
+# Mode par défaut de /api/delete : "delete" (définitif) ou "quarantine" (rename réversible, purge différée)
+DELETE_MODE = os.getenv('DELETE_MODE', 'delete')
+# Quarantaine : manifeste, rétention avant purge (jours), intervalle du purgeur (s)
+# et budget d'I/O de la purge (Mo/s, 0 = illimité)
+QUARANTINE_DB_PATH = Path(os.getenv('QUARANTINE_DB_PATH', str(DATA_DIR / 'quarantine.sqlite3')))
+QUARANTINE_RETENTION_DAYS = float(os.getenv('QUARANTINE_RETENTION_DAYS', 7))
+QUARANTINE_PURGE_INTERVAL = float(os.getenv('QUARANTINE_PURGE_INTERVAL', 3600))
+QUARANTINE_PURGE_MBPS = float(os.getenv('QUARANTINE_PURGE_MBPS', 50))
+# Profilage à la demande : dossier des captures (pstats / speedscope) et période d'échantillonnage (s)
+PROFILE_DIR = Path(os.getenv('AI_CLEANER_PROFILE_DIR', str(DATA_DIR / 'profiles')))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))
+# Jobs : workers (dossiers scannés en parallèle, requêtes d'analyse en vol) partagés
+# équitablement entre les jobs actifs, et jobs terminés conservés (candidats, résultats)
+JOB_WORKER_BUDGET = int(os.getenv('JOB_WORKER_BUDGET', 16))
+JOB_HISTORY = int(os.getenv('JOB_HISTORY', 8))
+
+# Cache des verdicts IA
+VERDICT_CACHE_ENABLED = os.getenv('VERDICT_CACHE_ENABLED', 'True').lower() == 'true'
+VERDICT_CACHE_PATH = Path(os.getenv('VERDICT_CACHE_PATH', str(DATA_DIR / 'verdicts.sqlite3')))
+VERDICT_CACHE_MAX_ENTRIES = int(os.getenv('VERDICT_CACHE_MAX_ENTRIES', 200000))
+
+# Règles déclaratives appliquées avant le LLM (JSON ; règles par défaut si absent)
+RULES_PATH = Path(os.getenv('AI_CLEANER_RULES', str(DATA_DIR / 'rules.json')))
+
+# Extraction des aperçus PDF : processus (0 = en ligne), timeout par fichier (s),
+# plafond mémoire par processus (Mo) et fichiers préchargés devant l'analyse
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', 2))
+EXTRACT_TIMEOUT = float(os.getenv('EXTRACT_TIMEOUT', 10))
+EXTRACT_MEMORY_MB = int(os.getenv('EXTRACT_MEMORY_MB', 512))
+EXTRACT_PREFETCH = int(os.getenv('EXTRACT_PREFETCH', 8))
+
+# Aperçus : octets lus au maximum par fichier (PDF, .docx/.odt)
+PREVIEW_MAX_BYTES = int(os.getenv('PREVIEW_MAX_BYTES', 256 * 1024))
 
 # SocketIO
 SOCKETIO_PING_TIMEOUT = int(os.getenv('SOCKETIO_PING_TIMEOUT', 60))
@@ -23,13 +23,39 @@ import unicodedata
 import subprocess
 import time
 import shutil
+import sqlite3
+import errno
+import uuid
+import hashlib
+import re
+import fnmatch
+import bisect
+import cProfile
+import pstats
+import heapq
+import itertools
+import io
+import mmap
+import zipfile
+import zlib
 
-from typing import Dict, List, Optional, Tuple
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from contextlib import contextmanager
 from pathlib import Path
-from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
 import threading
 import json
+import queue
+import multiprocessing
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, CancelledError,
+                                TimeoutError as FuturesTimeout, as_completed, wait)
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource  # plafond mémoire des processus d'extraction (POSIX uniquement)
+except ImportError:
+    resource = None
 
 # --- PDF Libs (Optional) avec meilleure gestion d'erreurs ---
 try:
@@ -43,7 +69,7 @@ except Exception as e:
 import requests
 from flask import Flask, jsonify, request, send_file
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 
 # ============================================================================
 # CONFIG & CONSTANTES
@@ -52,14 +78,105 @@ from flask_socketio import SocketIO, emit
 IGNORED_DIRS = {
     'node_modules', '.git', '.venv', 'venv', '__pycache__',
     'Library', 'VirtualBox VMs', 'Parallels', 'Steam',
-    '.Trash', '.cache', '.npm', 'Applications', 'System'
+    '.Trash', '.cache', '.npm', 'Applications', 'System', '.ai_cleaner_quarantine'
 }
 SKIP_EXTS = {'.DS_Store', '.localized', '.tmp', '.cache', '.log'}
 
+# Données persistantes (index de scan, caches...)
+DATA_DIR = Path(os.getenv('AI_CLEANER_DATA_DIR', str(Path.home() / '.ai_cleaner')))
+INDEX_DB_PATH = Path(os.getenv('AI_CLEANER_INDEX_DB', str(DATA_DIR / 'index.sqlite3')))
+
+# Parcours parallèle : nombre de threads qui listent/stat les dossiers
+SCAN_WORKERS = int(os.getenv('SCAN_WORKERS', 8))
+
+# Progression : émissions Socket.IO max par seconde et lignes de log en attente max
+EVENT_RATE_HZ = float(os.getenv('EVENT_RATE_HZ', 10))
+LOG_BATCH_MAX = int(os.getenv('LOG_BATCH_MAX', 500))
+
+# Diffusion des résultats : taille des paquets Socket.IO et pagination REST
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 500))
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 5000
+
+# Mode pipeline scan -> analyse : candidats en attente max entre les deux étages
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 256))
+
+# Doublons : threads de hachage
+DUPLICATE_WORKERS = int(os.getenv('DUPLICATE_WORKERS', 4))
+# Suppression en tâche de fond : workers d'unlink parallèles et fichiers par paquet
+DELETE_WORKERS = int(os.getenv('DELETE_WORKERS', 8))
+DELETE_CHUNK_SIZE = int(os.getenv('DELETE_CHUNK_SIZE', 256))
+# Mode par défaut de /api/delete : "delete" (définitif) ou "quarantine" (rename réversible, purge différée)
+DELETE_MODE = os.getenv('DELETE_MODE', 'delete')
+
+# Quarantaine : un dossier par périphérique (rename sans copie), manifeste SQLite,
+# rétention avant purge, intervalle du purgeur et budget d'I/O de la purge (Mo/s, 0 = illimité)
+QUARANTINE_DIRNAME = '.ai_cleaner_quarantine'
+QUARANTINE_DB_PATH = Path(os.getenv('QUARANTINE_DB_PATH', str(DATA_DIR / 'quarantine.sqlite3')))
+QUARANTINE_RETENTION_DAYS = float(os.getenv('QUARANTINE_RETENTION_DAYS', 7))
+QUARANTINE_PURGE_INTERVAL = float(os.getenv('QUARANTINE_PURGE_INTERVAL', 3600))
+QUARANTINE_PURGE_MBPS = float(os.getenv('QUARANTINE_PURGE_MBPS', 50))
+QUARANTINE_PURGE_MIN_COST = 64 * 1024  # coût minimal d'un unlink dans le budget (métadonnées)
+
+# Jobs : workers (dossiers scannés en parallèle, requêtes d'analyse en vol) partagés
+# équitablement entre les jobs actifs, et jobs terminés conservés (candidats, résultats)
+JOB_WORKER_BUDGET = int(os.getenv('JOB_WORKER_BUDGET', 16))
+JOB_HISTORY = int(os.getenv('JOB_HISTORY', 8))
+
+# Profilage à la demande : dossier des captures (pstats / speedscope) et période d'échantillonnage (s)
+PROFILE_DIR = Path(os.getenv('AI_CLEANER_PROFILE_DIR', str(DATA_DIR / 'profiles')))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))
+
+# Cache des verdicts IA
+VERDICT_CACHE_ENABLED = os.getenv('VERDICT_CACHE_ENABLED', 'True').lower() == 'true'
+VERDICT_CACHE_PATH = Path(os.getenv('VERDICT_CACHE_PATH', str(DATA_DIR / 'verdicts.sqlite3')))
+VERDICT_CACHE_MAX_ENTRIES = int(os.getenv('VERDICT_CACHE_MAX_ENTRIES', 200000))
+
+# Règles déclaratives appliquées avant le LLM (JSON ; règles par défaut si absent)
+RULES_PATH = Path(os.getenv('AI_CLEANER_RULES', str(DATA_DIR / 'rules.json')))
+
+# Extraction des aperçus PDF hors GIL : processus (0 = en ligne), timeout par fichier,
+# plafond mémoire par processus et nombre de fichiers préchargés devant l'analyse
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', 2))
+EXTRACT_TIMEOUT = float(os.getenv('EXTRACT_TIMEOUT', 10))
+EXTRACT_MEMORY_MB = int(os.getenv('EXTRACT_MEMORY_MB', 512))
+EXTRACT_PREFETCH = int(os.getenv('EXTRACT_PREFETCH', 8))
+
+# Aperçus : caractères envoyés au LLM, octets lus en tête/fin des gros fichiers texte,
+# budget d'octets par fichier (PDF, documents zip) et flux de contenu PDF max
+PREVIEW_CHARS = 600
+PREVIEW_HEAD_BYTES = 4096
+PREVIEW_TAIL_BYTES = 1024
+PREVIEW_MAX_BYTES = int(os.getenv('PREVIEW_MAX_BYTES', 256 * 1024))
+PREVIEW_PDF_PAGES = 2
+
 # Ollama Settings - Configuration améliorée
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434').rstrip('/')
 OLLAMA_TIMEOUT = 30  # Timeout augmenté
 OLLAMA_ENABLED = True  # Peut être désactivé
+# Requêtes /api/generate simultanées (à aligner sur OLLAMA_NUM_PARALLEL côté serveur)
+OLLAMA_CONCURRENCY = int(os.getenv('OLLAMA_CONCURRENCY', 4))
+# Santé Ollama : durée de validité du statut en cache et disjoncteur
+OLLAMA_HEALTH_TTL = float(os.getenv('OLLAMA_HEALTH_TTL', 10))
+OLLAMA_BREAKER_THRESHOLD = int(os.getenv('OLLAMA_BREAKER_THRESHOLD', 3))
+OLLAMA_BREAKER_COOLDOWN = float(os.getenv('OLLAMA_BREAKER_COOLDOWN', 30))
+# Mode par lot : fichiers max par requête (1 = désactivé) et budget de tokens du prompt
+ANALYSIS_BATCH_SIZE = int(os.getenv('ANALYSIS_BATCH_SIZE', 1))
+ANALYSIS_BATCH_TOKENS = int(os.getenv('ANALYSIS_BATCH_TOKENS', 2048))
+# Ordre d'analyse ("priority" : octets récupérables par coût d'abord, "scan" : ordre du parcours)
+# et budgets par défaut d'une analyse (0 = illimité) : durée en secondes, requêtes Ollama
+ANALYSIS_ORDER = os.getenv('ANALYSIS_ORDER', 'priority')
+ANALYSIS_TIME_BUDGET = float(os.getenv('ANALYSIS_TIME_BUDGET', 0))
+ANALYSIS_LLM_BUDGET = int(os.getenv('ANALYSIS_LLM_BUDGET', 0))
+# Réponses en streaming (coupées dès que le verdict JSON est complet) et sortie structurée :
+# "schema" (schéma JSON du verdict), "json" (JSON libre) ou "" (texte nettoyé, anciens serveurs)
+OLLAMA_STREAM = os.getenv('OLLAMA_STREAM', 'True').lower() == 'true'
+OLLAMA_FORMAT = os.getenv('OLLAMA_FORMAT', 'schema').lower()
+# Maintien du modèle en mémoire entre deux requêtes (format Ollama : "30m", "1h", "-1"...)
+# et modèle préchargé au démarrage du serveur (vide = aucun)
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+OLLAMA_WARMUP_MODEL = os.getenv('OLLAMA_WARMUP_MODEL', '')
+OLLAMA_WARMUP_TIMEOUT = 120  # chargement d'un gros modèle depuis le disque
 
 def _ollama_endpoint(path: str) -> str:
     if not path.startswith('/'):
@@ -118,23 +235,23 @@ socketio = SocketIO(
 # Session HTTP avec timeout
 session = requests.Session()
 session.timeout = 10
+# Une connexion par requête en vol
+_ollama_adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, OLLAMA_CONCURRENCY))
+session.mount('http://', _ollama_adapter)
+session.mount('https://', _ollama_adapter)
 
-# Global State
+# Global State (scans et analyses : voir JobManager, un état par job)
 state = {
-    'scanning': False,
-    'analyzing': False,
-    'total_files': 0,
-    'scanned_files': 0,
-    'analyzed_files': 0,
-    'candidates': [],
-    'results': [],
-    'stats': {},
-    'protected_files': [],
     'last_scan_path': None,
-    'ollama_available': False
+    'ollama_available': False,
+    'finding_duplicates': False,
+    'duplicates': None,
+    'deleting': False,
+    'purging': False
 }
-scan_cancel_event = threading.Event()
-analyze_cancel_event = threading.Event()
+duplicates_cancel_event = threading.Event()
+delete_cancel_event = threading.Event()
+purge_cancel_event = threading.Event()
 
 # ============================================================================
 # Fonctions Utilitaires - Version robuste
@@ -146,378 +263,3265 @@ def human_size(size: int) -> str:
         size /= 1024.0
     return f"{size:.1f}TB"
 
-def get_category(ext: str) -> str:
-    for cat, exts in CATEGORIES.items():
-        if ext.lower() in exts: return cat
-    return 'Autres'
-
 def _normalize(text: str) -> str:
     return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').casefold()
 
+class Classification(NamedTuple):
+    protected: bool
+    keyword: Optional[str]
+    screenshot: bool
+    temporary: bool
+    category: str
+
+class FileClassifier:
+    """Classifieur de noms de fichiers compilé une fois depuis la config.
+
+    Les mots-clés (protégés, captures d'écran, temporaires) sont normalisés à la
+    construction et réunis dans une seule regex. Un lookahead permet de trouver
+    les correspondances à chaque position (chevauchements compris) ; l'alternative
+    la plus longue gagne, et les mots-clés qui en sont des préfixes sont déduits
+    d'une table précalculée. Un seul passage sur le nom normalisé suffit.
+    """
+
+    def __init__(self, protected_keywords, screenshot_patterns, temporary_hints, categories):
+        self.ext_to_category: Dict[str, str] = {}
+        for cat, exts in categories.items():
+            for ext in exts:
+                self.ext_to_category.setdefault(ext.lower(), cat)
+
+        # mot-clé normalisé -> genres ; rang du mot-clé protégé dans la liste d'origine
+        kinds: Dict[str, set] = defaultdict(set)
+        self._protected_rank: Dict[str, Tuple[int, str]] = {}
+        for kind, words in (('protected', protected_keywords),
+                            ('screenshot', screenshot_patterns),
+                            ('temporary', temporary_hints)):
+            for rank, word in enumerate(words):
+                key = _normalize(word)
+                if not key:
+                    continue
+                kinds[key].add(kind)
+                if kind == 'protected':
+                    self._protected_rank.setdefault(key, (rank, word))
+
+        # Pour chaque mot-clé : tous les mots-clés qui en sont des préfixes (lui compris)
+        self._closure: Dict[str, Tuple[frozenset, Tuple[str, ...]]] = {}
+        for key in kinds:
+            prefixes = [other for other in kinds if key.startswith(other)]
+            found_kinds = frozenset().union(*(kinds[k] for k in prefixes))
+            protected = tuple(k for k in prefixes if 'protected' in kinds[k])
+            self._closure[key] = (found_kinds, protected)
+
+        alternatives = '|'.join(re.escape(k) for k in sorted(kinds, key=len, reverse=True))
+        self._matcher = re.compile(f'(?=({alternatives}))') if alternatives else None
+
+    def category(self, ext: str) -> str:
+        return self.ext_to_category.get(ext.lower(), 'Autres')
+
+    def classify(self, name: str, ext: Optional[str] = None) -> Classification:
+        if ext is None:
+            ext = os.path.splitext(name)[1]
+        category = self.ext_to_category.get(ext.lower(), 'Autres')
+        if self._matcher is None:
+            return Classification(False, None, False, False, category)
+
+        found = set()
+        best = None
+        for match in self._matcher.finditer(_normalize(name)):
+            found_kinds, protected = self._closure[match.group(1)]
+            found |= found_kinds
+            for key in protected:
+                rank = self._protected_rank[key]
+                if best is None or rank < best:
+                    best = rank
+        return Classification(
+            'protected' in found,
+            best[1] if best else None,
+            'screenshot' in found,
+            'temporary' in found,
+            category
+        )
+
+def _classifier_signature() -> Tuple:
+    return (
+        tuple(PROTECTED_KEYWORDS),
+        tuple(SCREENSHOT_PATTERNS),
+        tuple(TEMPORARY_FILE_HINTS),
+        tuple((cat, tuple(sorted(exts))) for cat, exts in CATEGORIES.items()),
+    )
+
+_classifier: Optional[FileClassifier] = None
+_classifier_sig: Optional[Tuple] = None
+_classifier_lock = threading.Lock()
+
+def refresh_classifier() -> FileClassifier:
+    """Reconstruit le classifieur si la config a changé (appelé au début de chaque tâche)"""
+    global _classifier, _classifier_sig
+    signature = _classifier_signature()
+    with _classifier_lock:
+        if _classifier is None or signature != _classifier_sig:
+            _classifier = FileClassifier(PROTECTED_KEYWORDS, SCREENSHOT_PATTERNS,
+                                         TEMPORARY_FILE_HINTS, CATEGORIES)
+            _classifier_sig = signature
+        return _classifier
+
+def get_classifier() -> FileClassifier:
+    """Classifieur courant, sans vérifier la config (chemin critique)"""
+    return _classifier or refresh_classifier()
+
+def get_category(ext: str) -> str:
+    return get_classifier().category(ext)
+
 def is_protected(filename: str) -> Tuple[bool, Optional[str]]:
-    normalized = _normalize(filename)
-    for k in PROTECTED_KEYWORDS:
-        if _normalize(k) in normalized: return True, k
-    return False, None
+    result = get_classifier().classify(filename)
+    return result.protected, result.keyword
 
 def _looks_like_screenshot(name: str) -> bool:
-    normalized_name = _normalize(name)
-    return any(p in normalized_name for p in SCREENSHOT_PATTERNS)
+    return get_classifier().classify(name).screenshot
 
-def extract_text_preview(path: str, ext: str) -> Optional[str]:
-    """Extrait le texte des fichiers avec gestion robuste des erreurs"""
-    try:
-        # Fichiers texte simples
-        if ext in {'.txt', '.md', '.json', '.csv', '.log'}:
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read(600)
-        
-        # PDF avec gestion d'erreurs renforcée
-        if ext == '.pdf' and PDF_AVAILABLE:
-            try:
-                reader = PdfReader(path)
-                text_parts = []
-                for i, page in enumerate(reader.pages[:2]):  # Maximum 2 pages
-                    try:
-                        text = page.extract_text()
-                        if text and text.strip():
-                            text_parts.append(text.strip())
-                    except Exception as page_error:
-                        print(f"⚠️ Erreur page PDF {i+1} dans {path}: {page_error}")
-                        continue
-                
-                if text_parts:
-                    return " ".join(text_parts)[:600]
-                return None
-                
-            except Exception as pdf_error:
-                print(f"⚠️ Erreur PDF {path}: {pdf_error}")
-                return None
-                
-    except Exception as e:
-        print(f"⚠️ Erreur lecture fichier {path}: {e}")
-    
-    return None
+class ChunkStreamer:
+    """Regroupe des éléments et les émet par paquets de ``chunk_size`` (évite un message géant)"""
 
-def apply_local_rules(file_info: Dict, preview: Optional[str]) -> Optional[Dict]:
-    """Règles locales pour décision automatique"""
-    name = file_info.get('name', '')
-    age = file_info.get('age', 0)
-    ext = file_info.get('ext', '').lower()
-    size = file_info.get('size', 0)
-    normalized_name = _normalize(name)
-    
-    # Captures d'écran
-    if _looks_like_screenshot(name):
-        return { 'importance': 'low', 'can_delete': True, 'reason': 'Capture d\'écran détectée' }
-    
-    # Fichiers temporaires anciens
-    if any(_normalize(hint) in normalized_name for hint in TEMPORARY_FILE_HINTS) and age >= 30:
-        return { 'importance': 'low', 'can_delete': True, 'reason': 'Fichier temporaire/test (+30 jours)' }
-
-    # Fichiers protégés
-    is_protected_flag, keyword = is_protected(name)
-    if is_protected_flag:
-        return {'importance': 'high', 'can_delete': False, 'reason': f'Mot-clé protégé: "{keyword}"'}
-        
-    # Gros fichiers binaires sans aperçu
-    if not preview and size > 50 * 1024 * 1024:
-        return {'importance': 'unknown', 'can_delete': False, 'reason': 'Gros fichier binaire (>50MB) - Revue manuelle requise'}
-    
-    return None
+    def __init__(self, event: str, chunk_size: Optional[int] = None, emit=None):
+        self.event = event
+        self.chunk_size = max(1, int(chunk_size or STREAM_CHUNK_SIZE))
+        self._emit_event = emit or socketio.emit
+        self.sent = 0
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
 
-def check_ollama_availability() -> bool:
-    """Vérifie si Ollama est disponible"""
-    try:
-        resp = session.get(_ollama_endpoint('/api/tags'), timeout=5)
-        if resp.status_code == 200:
-            print("✅ Ollama est disponible")
-            return True
-    except Exception as e:
-        print(f"❌ Ollama non disponible: {e}")
-    return False
+    def add(self, items: List[Dict]):
+        with self._lock:
+            self._buffer.extend(items)
+            while len(self._buffer) >= self.chunk_size:
+                chunk = self._buffer[:self.chunk_size]
+                del self._buffer[:self.chunk_size]
+                self._emit(chunk)
 
-def call_ollama(prompt: str, model: str = "llama3:8b") -> Tuple[Optional[dict], Optional[str]]:
-    """Appel Ollama avec gestion d'erreurs complète"""
-    if not OLLAMA_ENABLED:
-        return None, "Ollama désactivé"
-    
-    try:
-        # Test de connexion d'abord
-        if not check_ollama_availability():
-            return None, "Ollama non disponible - Démarrez le service Ollama"
-        
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.1, 
-                "num_predict": 150,
-                "top_k": 40
-            }
-        }
-        
-        print(f"🔍 Envoi requête Ollama pour modèle: {model}")
-        resp = session.post(
-            _ollama_endpoint('/api/generate'), 
-            json=payload, 
-            timeout=OLLAMA_TIMEOUT
-        )
-        
-        if resp.status_code != 200:
-            return None, f"Erreur HTTP {resp.status_code}: {resp.text}"
-        
-        data = resp.json()
-        text = data.get('response', '').strip()
-        
-        if not text:
-            return None, "Réponse vide d'Ollama"
-        
-        # Nettoyage de la réponse
-        if '```json' in text:
-            text = text.split('```json')[1].split('```')[0].strip()
-        elif '```' in text:
-            text = text.split('```')[1].split('```')[0].strip()
-        
-        # Extraction JSON
+    def flush(self):
+        with self._lock:
+            if self._buffer:
+                chunk, self._buffer = self._buffer, []
+                self._emit(chunk)
+
+    def _emit(self, chunk: List[Dict]):
+        with span('emit'):
+            self._emit_event(self.event, {'items': chunk, 'offset': self.sent})
+        self.sent += len(chunk)
+
+class DirectEvents:
+    """Émission immédiate (comportement historique, hors tâche de fond)"""
+
+    def update(self, event: str, payload):
+        socketio.emit(event, payload() if callable(payload) else payload)
+
+    def log(self, msg: str, type: str = 'info'):
+        socketio.emit('log', {'msg': msg, 'type': type})
+
+    def flush(self):
+        pass
+
+DIRECT_EVENTS = DirectEvents()
+
+class EventAggregator:
+    """Coalesce les événements Socket.IO d'une tâche à ``rate_hz`` émissions max par seconde.
+
+    - ``update(event, payload)`` : seul le dernier état de chaque événement est
+      émis (les états intermédiaires sont abandonnés) ; ``payload`` peut être
+      une fonction, évaluée seulement au moment de l'émission ;
+    - ``log(msg, type)`` : les lignes sont regroupées dans un ``log_batch`` ;
+      au-delà de ``max_logs`` en attente, les plus anciennes sont abandonnées.
+
+    Un thread émet périodiquement ; si une émission est encore en cours
+    (client lent), le tick suivant est sauté et les états continuent de se
+    remplacer. À utiliser comme gestionnaire de contexte (flush final) ; le
+    thread d'émission est rattaché à la tâche (TaskTrace) du thread qui l'ouvre.
+    ``emit`` remplace socketio.emit (ex. Job.emit pour la room d'un job).
+    """
+
+    def __init__(self, rate_hz: Optional[float] = None, max_logs: Optional[int] = None, emit=None):
+        self._emit = emit or socketio.emit
+        self.interval = 1.0 / max(0.1, float(rate_hz or EVENT_RATE_HZ))
+        self.max_logs = max(1, int(max_logs or LOG_BATCH_MAX))
+        self._latest: Dict[str, object] = {}
+        self._logs: List[Dict] = []
+        self._dropped_logs = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._trace: Optional[TaskTrace] = None
+
+    def __enter__(self):
+        self._trace = current_trace()
+        self._thread = threading.Thread(target=self._run, name='events', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _run(self):
+        token = self._trace.attach() if self._trace else None
         try:
-            result = json.loads(text)
-            return result, None
-        except json.JSONDecodeError:
-            # Tentative d'extraction manuelle
-            import re
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                try:
-                    result = json.loads(json_match.group())
-                    return result, None
-                except:
-                    pass
-            
-            return None, f"Réponse JSON invalide: {text[:100]}..."
-            
-    except requests.exceptions.Timeout:
-        return None, f"Timeout après {OLLAMA_TIMEOUT}s - Ollama trop lent"
-    except requests.exceptions.ConnectionError:
-        return None, "Impossible de se connecter à Ollama - Service démarré ?"
-    except Exception as e:
-        return None, f"Erreur Ollama: {str(e)}"
+            while not self._closed.wait(self.interval):
+                self.flush(blocking=False)
+        finally:
+            if token:
+                self._trace.detach(token)
 
-def analyze_file_with_fallback(file_info: Dict, model: str) -> Dict:
-    """Analyse de fichier avec fallback vers règles locales"""
-    name = file_info['name']
-    path = file_info['path']
-    ext = file_info['ext']
-    
-    # Extraction du preview
-    preview = extract_text_preview(path, ext)
-    
-    # Règles locales d'abord
-    local_decision = apply_local_rules(file_info, preview)
-    if local_decision:
-        return local_decision
+    def update(self, event: str, payload):
+        with self._lock:
+            self._latest.pop(event, None)  # garde l'ordre d'arrivée du dernier état
+            self._latest[event] = payload
 
-    # Si Ollama n'est pas disponible, utiliser des règles étendues
-    if not check_ollama_availability():
+    def log(self, msg: str, type: str = 'info'):
+        with self._lock:
+            self._logs.append({'msg': msg, 'type': type})
+            if len(self._logs) > self.max_logs:
+                overflow = len(self._logs) - self.max_logs
+                del self._logs[:overflow]
+                self._dropped_logs += overflow
+
+    def flush(self, blocking: bool = True):
+        if not self._flush_lock.acquire(blocking=blocking):
+            return
+        try:
+            with self._lock:
+                latest, self._latest = self._latest, {}
+                logs, self._logs = self._logs, []
+                dropped, self._dropped_logs = self._dropped_logs, 0
+            with span('emit'):
+                if logs or dropped:
+                    self._emit('log_batch', {'entries': logs, 'dropped': dropped})
+                for event, payload in latest.items():
+                    self._emit(event, payload() if callable(payload) else payload)
+        finally:
+            self._flush_lock.release()
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+
+_page_cache: Dict[Tuple, List[Dict]] = {}
+_page_cache_lock = threading.Lock()
+# Génération des listes paginées (candidats, résultats d'un job), changée à chaque réaffectation
+_page_generations = itertools.count(1)
+# Champs triés numériquement : une valeur absente se range avec 0, les autres avec ''
+NUMERIC_SORT_FIELDS = {'size', 'age', 'age_days', 'time_to_verdict_ms', 'prompt_eval_ms'}
+
+def paginate(items: List[Dict], args, sort_fields: set, filter_fields: set,
+             generation: Optional[int] = None) -> Dict:
+    """Page triée/filtrée d'une liste (offset/limit, sort/order, filtres exacts et ``q`` sur le nom).
+
+    Avec ``generation`` (voir Job), le résultat trié est gardé en cache tant que la
+    liste source n'a été ni remplacée ni allongée, pour que les pages suivantes ne
+    re-trient pas tout ; sans, il est recalculé à chaque appel.
+    """
+    try:
+        offset = max(0, int(args.get('offset', args.get('cursor', 0)) or 0))
+        limit = min(MAX_PAGE_SIZE, max(1, int(args.get('limit', DEFAULT_PAGE_SIZE))))
+    except (TypeError, ValueError):
+        raise ValueError('offset/limit invalides')
+    sort = args.get('sort')
+    if sort and sort not in sort_fields:
+        raise ValueError(f'Tri non supporté: {sort}')
+    descending = args.get('order', 'asc').lower() == 'desc'
+    filters = tuple(sorted((k, args.get(k)) for k in filter_fields if args.get(k)))
+    query = (args.get('q') or '').casefold()
+
+    key = (generation, len(items), sort, descending, filters, query)
+    view = None
+    if generation is not None:
+        with _page_cache_lock:
+            view = _page_cache.get(key)
+    if view is None:
+        # Vue = indices des lignes : les stores en colonnes ne construisent que les dicts de la page
+        view = range(len(items))
+        for field, value in filters:
+            get = column_of(items, field)
+            view = [i for i in view if str(get(i)) == value]
+        if query:
+            get = column_of(items, 'name')
+            view = [i for i in view if query in (get(i) or '').casefold()]
+        if sort:
+            get = column_of(items, sort)
+            missing = 0 if sort in NUMERIC_SORT_FIELDS else ''
+
+            def sort_key(i):
+                value = get(i)
+                return (value is None, missing if value is None else value)
+            view = sorted(view, key=sort_key, reverse=descending)
+        if not isinstance(view, range):
+            view = array('I', view)
+        if generation is not None:
+            with _page_cache_lock:
+                _page_cache.clear()
+                _page_cache[key] = view
+
+    page = [items[i] for i in view[offset:offset + limit]]
+    next_offset = offset + len(page)
+    return {
+        'ok': True,
+        'items': page,
+        'total': len(view),
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset if next_offset < len(view) else None
+    }
+
+# ============================================================================
+# Stockage compact des candidats et résultats
+# ============================================================================
+
+class Interner:
+    """Table de codes des valeurs répétées (dossiers, catégories, extensions, décisions...)
+
+    Lecture sans verrou quand la valeur est connue ; l'ajout d'une valeur nouvelle
+    est sérialisé (la valeur est rangée avant que son code soit publié).
+    """
+
+    def __init__(self):
+        self.values: List = []
+        self._codes: Dict = {}
+        self._lock = threading.Lock()
+
+    def code(self, value) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None:
+                    code = len(self.values)
+                    self.values.append(value)
+                    self._codes[value] = code
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+# Tables globales : quelques dizaines de valeurs, partagées par tous les stores
+CATEGORY_CODES = Interner()
+EXTENSION_CODES = Interner()
+DECISION_CODES = Interner()
+IMPORTANCE_CODES = Interner()
+RULE_CODES = Interner()
+
+def column_of(items, field: str):
+    """Accès ``i -> valeur`` à un champ d'une liste de dicts ou d'un store en colonnes"""
+    if hasattr(items, 'column'):
+        return items.column(field)
+    return lambda i: items[i].get(field)
+
+class CandidateStore:
+    """Candidats en colonnes plutôt qu'un dict par fichier
+
+    Un chemin est (code du dossier, nom) : chaque dossier n'est stocké qu'une fois,
+    dans la table ``dirs`` du store. Tailles et âges sont dans des array, catégories
+    et extensions sont des codes. Les dicts {path, name, size, age, ext, category}
+    ne sont construits qu'à la lecture (``store[i]``, itération) : API, événements
+    Socket.IO, analyse d'un fichier. Ajouts par un seul thread ; les lectures
+    concurrentes voient les lignes complètes seulement.
+    """
+
+    def __init__(self, items=()):
+        self.dirs = Interner()
+        self._dir = array('I')
+        self._name: List[str] = []
+        self._size = array('q')
+        self._age = array('i')
+        self._ext = array('I')
+        self._category = array('H')  # rempli en dernier : sa longueur est celle du store
+        self._paths: Dict[int, str] = {}  # chemins qui ne finissent pas par le nom (rares)
+        self.extend(items)
+
+    @classmethod
+    def of(cls, items) -> 'CandidateStore':
+        return items if isinstance(items, cls) else cls(items)
+
+    def add_rows(self, directory: str, rows):
+        """Fichiers d'un même dossier : tuples (nom, taille, âge, extension, catégorie)"""
+        dir_code = self.dirs.code(directory)
+        for name, size, age, ext, category in rows:
+            self._dir.append(dir_code)
+            self._name.append(name)
+            self._size.append(size)
+            self._age.append(age)
+            self._ext.append(EXTENSION_CODES.code(ext))
+            self._category.append(CATEGORY_CODES.code(category))
+
+    def append(self, candidate: Dict):
+        path, name = candidate['path'], candidate['name']
+        directory, base = os.path.split(path)
+        if base != name:
+            self._paths[len(self)] = path
+        self.add_rows(directory, ((name, candidate['size'], candidate['age'], candidate['ext'],
+                                   candidate['category']),))
+
+    def extend(self, items):
+        for candidate in items:
+            self.append(candidate)
+
+    def path(self, i: int) -> str:
+        if self._paths and i in self._paths:
+            return self._paths[i]
+        return os.path.join(self.dirs.values[self._dir[i]], self._name[i])
+
+    def column(self, field: str):
+        """Accès ``i -> valeur`` sans construire de dict (tri, filtres, doublons)"""
+        if field == 'path':
+            return self.path
+        if field in ('name', 'size', 'age'):
+            return getattr(self, '_' + field).__getitem__
+        if field in ('ext', 'category'):
+            values = (EXTENSION_CODES if field == 'ext' else CATEGORY_CODES).values
+            codes = getattr(self, '_' + field)
+            return lambda i: values[codes[i]]
+        return lambda i: None
+
+    def __len__(self) -> int:
+        return len(self._category)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
         return {
-            'importance': 'unknown',
-            'can_delete': False,
-            'reason': 'Ollama indisponible - Utilisez les règles automatiques'
+            'path': self.path(i),
+            'name': self._name[i],
+            'size': self._size[i],
+            'age': self._age[i],
+            'ext': EXTENSION_CODES.values[self._ext[i]],
+            'category': CATEGORY_CODES.values[self._category[i]]
         }
 
-    # Préparation du prompt pour Ollama
-    parent_folder = Path(path).parent.name
-    preview_section = f"Aperçu:\n{preview}\n" if preview else "Aperçu: Aucun (fichier binaire probable)"
-    
-    prompt = f"""
-Analyze this file for cleanup. Respond ONLY with a JSON object.
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
 
-Metadata:
-- Name: {name}
-- Age: {file_info['age']} days  
-- Size: {human_size(file_info['size'])}
-- Category: {file_info['category']}
-- Parent folder: {parent_folder}
+    def __eq__(self, other):
+        return list(self) == list(other)
 
-{preview_section}
+    __hash__ = None
 
-Rules:
-- DELETE: installers, temp files, duplicates, random screenshots, old drafts
-- KEEP: personal documents, legal, financial, important work files
+def _decision(analysis: Dict) -> str:
+    if analysis.get('importance') == 'unknown':
+        return 'REVIEW'
+    return 'DELETE' if analysis.get('can_delete') else 'KEEP'
 
-JSON response only:
-{{ 
-  "can_delete": true/false,
-  "reason": "short explanation",
-  "importance": "low"/"medium"/"high"
-}}
-"""
+class ResultStore:
+    """Résultats d'analyse en colonnes, chaque ligne renvoyant à une ligne du CandidateStore analysé
 
-    socketio.emit('ai_thinking', {'file': name})
-    
-    result, error_message = call_ollama(prompt, model)
-    
-    if result:
-        socketio.emit('ai_result', {'file': name, 'result': result})
-        return result
-    else:
-        # Fallback vers règles automatiques en cas d'erreur Ollama
-        fallback_reason = f"IA indisponible - {error_message}"
-        
-        # Règles automatiques basées sur l'extension et l'âge
-        if ext in {'.tmp', '.temp', '.log'} and file_info['age'] > 30:
-            decision = {'importance': 'low', 'can_delete': True, 'reason': 'Fichier temporaire ancien'}
-        elif ext in {'.dmg', '.pkg', '.exe', '.msi'} and file_info['age'] > 90:
-            decision = {'importance': 'medium', 'can_delete': True, 'reason': 'Installeur ancien'}
+    Chemin, nom, taille, âge et catégorie ne sont pas recopiés : ils sont lus dans
+    ``candidates``. Décision, importance, règle et raison sont des codes (table des
+    raisons propre au store : celles des règles se répètent d'un fichier à l'autre),
+    les durées des float (NaN = absente). ``store[i]`` construit le dict de l'API
+    (voir _make_record).
+    """
+
+    def __init__(self, candidates: Optional[CandidateStore] = None):
+        self.candidates = candidates if candidates is not None else CandidateStore()
+        self.reasons = Interner()
+        self._decision = array('B')
+        self._importance = array('B')
+        self._reason = array('I')
+        self._rule = array('H')
+        self._verdict_ms = array('d')
+        self._prompt_ms = array('d')
+        self._row = array('I')  # rempli en dernier : sa longueur est celle du store
+
+    def add(self, row: int, analysis: Dict) -> int:
+        """Range le verdict du candidat ``row`` ; retourne l'indice du résultat"""
+        reason = analysis.get('reason', 'N/A')
+        verdict_ms, prompt_ms = analysis.get('time_to_verdict_ms'), analysis.get('prompt_eval_ms')
+        self._decision.append(DECISION_CODES.code(_decision(analysis)))
+        self._importance.append(IMPORTANCE_CODES.code(analysis.get('importance', 'unknown')))
+        self._reason.append(self.reasons.code(reason if isinstance(reason, str) else str(reason)))
+        self._rule.append(RULE_CODES.code(analysis.get('rule')))
+        self._verdict_ms.append(float('nan') if verdict_ms is None else verdict_ms)
+        self._prompt_ms.append(float('nan') if prompt_ms is None else prompt_ms)
+        self._row.append(row)
+        return len(self._row) - 1
+
+    def analysis(self, i: int) -> Dict:
+        """Verdict du résultat ``i`` au format des fonctions d'analyse"""
+        decision = DECISION_CODES.values[self._decision[i]]
+        analysis = {
+            'can_delete': decision == 'DELETE',
+            'importance': IMPORTANCE_CODES.values[self._importance[i]],
+            'reason': self.reasons.values[self._reason[i]],
+            'rule': RULE_CODES.values[self._rule[i]]
+        }
+        for key, values in (('time_to_verdict_ms', self._verdict_ms), ('prompt_eval_ms', self._prompt_ms)):
+            if values[i] == values[i]:
+                analysis[key] = values[i]
+        return analysis
+
+    def sort_by_row(self):
+        """Remet les résultats dans l'ordre des candidats (ils arrivent dans l'ordre des réponses)"""
+        order = sorted(range(len(self)), key=self._row.__getitem__)
+        for name in ('_decision', '_importance', '_reason', '_rule', '_verdict_ms', '_prompt_ms', '_row'):
+            values = getattr(self, name)
+            setattr(self, name, array(values.typecode, (values[k] for k in order)))
+
+    def column(self, field: str):
+        """Accès ``i -> valeur`` sans construire de dict (tri, filtres, statistiques)"""
+        rows = self._row
+        if field in ('file', 'name', 'size', 'age_days', 'category'):
+            get = self.candidates.column({'file': 'path', 'age_days': 'age'}.get(field, field))
+            return lambda i: get(rows[i])
+        codes = {'decision': (self._decision, DECISION_CODES), 'importance': (self._importance, IMPORTANCE_CODES),
+                 'rule': (self._rule, RULE_CODES), 'reason': (self._reason, self.reasons)}
+        if field in codes:
+            values, table = codes[field]
+            return lambda i: table.values[values[i]]
+        return lambda i: self[i].get(field)
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        return _make_record(self.candidates[self._row[i]], self.analysis(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    __hash__ = None
+
+# ============================================================================
+# Métriques (format texte Prometheus)
+# ============================================================================
+
+class _Metric:
+    """Série de valeurs par combinaison de labels ; mise à jour sous un verrou propre à la métrique"""
+
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def _label_text(self, values: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{k}="{_escape_label(v)}"' for k, v in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{self._label_text(labels)} {_format_value(v)}' for labels, v in items]
+
+class Gauge(_Metric):
+    """Valeur instantanée, fixée par set() ou lue à la collecte par ``collect()`` -> {labels: valeur}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), collect=None):
+        super().__init__(name, help_text, labels)
+        self._collect = collect
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._collect:
+            values.update(self._collect())
+        return [f'{self.name}{self._label_text(labels)} {_format_value(v)}' for labels, v in sorted(values.items())]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            series = self._values.get(labels)
+            return series[2] if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items())
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                bucket_label = f'le="{le}"'
+                lines.append(f'{self.name}_bucket{self._label_text(labels, bucket_label)} {cumulative}')
+            lines.append(f'{self.name}_sum{self._label_text(labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{self._label_text(labels)} {count}')
+        return lines
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not float(value).is_integer() else str(int(value))
+
+def render_metrics() -> str:
+    """Toutes les métriques au format d'exposition texte Prometheus 0.0.4"""
+    return '\n'.join(metric.render() for metric in METRICS) + '\n'
+
+METRICS: List[_Metric] = []
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+EXTRACTION_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 15)
+
+files_scanned_total = Counter('ai_cleaner_files_scanned_total', 'Fichiers vus par le scan (listés ou relus depuis l\'index)')
+scan_stat_errors_total = Counter('ai_cleaner_scan_stat_errors_total', 'Erreurs de stat/lecture pendant le scan')
+scan_dirs_total = Counter('ai_cleaner_scan_dirs_total', 'Dossiers visités, par origine (listed = relistés, index = repris de l\'index)', ('source',))
+scan_dirs_pruned_total = Counter('ai_cleaner_scan_dirs_pruned_total', 'Dossiers ignorés (IGNORED_DIRS, liens symboliques)')
+scan_files_per_second = Gauge('ai_cleaner_scan_files_per_second', 'Débit du dernier scan terminé')
+queue_depth = Gauge('ai_cleaner_queue_depth', 'Profondeur des files (pipeline, analyse en attente / en vol, aperçus préchargés)', ('queue',),
+                    collect=lambda: {('preview_prefetch',): preview_extractor.pending()})
+ollama_request_seconds = Histogram('ai_cleaner_ollama_request_duration_seconds', 'Durée des requêtes /api/generate',
+                                   ('model', 'outcome'), LATENCY_BUCKETS)
+decisions_total = Counter('ai_cleaner_decisions_total', 'Décisions par origine (rule, llm, cache, fallback)', ('source', 'decision'))
+preview_extraction_seconds = Histogram('ai_cleaner_preview_extraction_seconds', 'Durée d\'extraction des aperçus (attente comprise)',
+                                       ('ext',), EXTRACTION_BUCKETS)
+deleted_files_total = Counter('ai_cleaner_deleted_files_total', 'Fichiers supprimés ou mis en quarantaine', ('mode',))
+deleted_bytes_total = Counter('ai_cleaner_deleted_bytes_total', 'Octets supprimés ou mis en quarantaine', ('mode',))
+quarantine_purged_bytes_total = Counter('ai_cleaner_quarantine_purged_bytes_total', 'Octets libérés par la purge de la quarantaine')
+
+# ============================================================================
+# Profilage à la demande et traces de phases
+# ============================================================================
+
+PHASES = ('walk', 'classify', 'emit', 'extract', 'infer', 'parse')
+PROFILE_MODES = ('cprofile', 'sampling')
+
+_trace_local = threading.local()
+
+class _StatsSnapshot:
+    """Statistiques figées d'un cProfile.Profile, acceptées par pstats.Stats sans le désactiver"""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class TaskProfiler:
+    """Capture d'une tâche en cours : cProfile ou échantillonnage des piles
+
+    - ``cprofile`` : un profileur par thread, activé le temps de chaque unité de
+      travail de la tâche (dossier scanné, requête d'analyse) ; les unités déjà
+      commencées à l'activation ne sont pas profilées. Export pstats.
+    - ``sampling`` : un thread relève ``sys._current_frames()`` des threads de la
+      tâche toutes les ``interval`` secondes, sans ralentir le code profilé ;
+      actif immédiatement. Export speedscope (https://www.speedscope.app).
+    """
+
+    def __init__(self, trace: 'TaskTrace', mode: str, interval: Optional[float] = None):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'Mode de profilage inconnu: {mode}')
+        self.trace = trace
+        self.mode = mode
+        self.interval = max(0.001, float(interval or PROFILE_SAMPLE_INTERVAL))
+        self.started = time.monotonic()
+        self.samples = 0
+        self.result: Optional[Dict] = None
+        self._profiles: Dict[int, cProfile.Profile] = {}
+        self._enabled = set()
+        self._stacks: Dict[Tuple, int] = {}
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+        if mode == 'sampling':
+            self._thread = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+            self._thread.start()
+
+    def enter(self) -> Optional[cProfile.Profile]:
+        """Active le profileur du thread courant (cProfile) ; None s'il n'y a rien à faire"""
+        if self.mode != 'cprofile' or self._stopped.is_set():
+            return None
+        ident = threading.get_ident()
+        with self._cond:
+            if ident in self._enabled:
+                return None
+            profile = self._profiles.setdefault(ident, cProfile.Profile())
+            try:
+                profile.enable()
+            except ValueError:
+                return None  # autre profileur déjà actif sur ce thread
+            self._enabled.add(ident)
+        return profile
+
+    def exit(self, profile: cProfile.Profile):
+        # disable() agit sur le thread courant : toujours appelé par le thread qui a activé
+        profile.disable()
+        with self._cond:
+            self._enabled.discard(threading.get_ident())
+            self._cond.notify_all()
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in self.trace.thread_ids():
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                key = (ident, tuple(reversed(stack)))
+                self._stacks[key] = self._stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def _speedscope(self, duration: float) -> Dict:
+        frames: List[Dict] = []
+        frame_ids: Dict[Tuple, int] = {}
+        profiles: Dict[int, Dict] = {}
+        names = self.trace.thread_names()
+        for (ident, stack), count in self._stacks.items():
+            ids = []
+            for frame in stack:
+                if frame not in frame_ids:
+                    frame_ids[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                ids.append(frame_ids[frame])
+            profile = profiles.setdefault(ident, {
+                'type': 'sampled', 'name': names.get(ident, str(ident)), 'unit': 'seconds',
+                'startValue': 0, 'endValue': 0, 'samples': [], 'weights': []
+            })
+            profile['samples'].append(ids)
+            profile['weights'].append(count * self.interval)
+            profile['endValue'] += count * self.interval
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': f'{self.trace.task} ({duration:.1f}s)',
+            'exporter': 'ai-cleaner',
+            'shared': {'frames': frames},
+            'profiles': sorted(profiles.values(), key=lambda p: -p['endValue'])
+        }
+
+    def stop(self) -> Dict:
+        """Arrête la capture et l'écrit dans PROFILE_DIR ; retourne sa description"""
+        if self.result is not None:
+            return self.result
+        self._stopped.set()
+        duration = time.monotonic() - self.started
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        if self.mode == 'sampling':
+            self._thread.join(timeout=5)
+            path = PROFILE_DIR / f'{self.trace.task}-{stamp}.speedscope.json'
+            path.write_text(json.dumps(self._speedscope(duration)))
+            details = {'samples': self.samples, 'interval_s': self.interval}
         else:
-            decision = {'importance': 'unknown', 'can_delete': False, 'reason': fallback_reason}
-        
-        socketio.emit('ai_result', {'file': name, 'result': decision})
-        return decision
+            # Les unités en cours désactivent elles-mêmes leur profileur
+            with self._cond:
+                self._cond.wait_for(lambda: not self._enabled, timeout=5)
+                snapshots = []
+                for ident, profile in self._profiles.items():
+                    if ident not in self._enabled:
+                        profile.snapshot_stats()
+                        snapshots.append(_StatsSnapshot(profile.stats))
+            path = PROFILE_DIR / f'{self.trace.task}-{stamp}.prof'
+            if snapshots:
+                pstats.Stats(*snapshots).dump_stats(str(path))
+            else:
+                pstats.Stats(_StatsSnapshot({})).dump_stats(str(path))
+            details = {'threads': len(snapshots)}
+        self.result = dict(details, mode=self.mode, duration_s=round(duration, 3), file=path.name,
+                           download=f'/api/profile/{self.trace.task}')
+        self.trace.last_capture = path
+        return self.result
+
+class TaskTrace:
+    """Traces d'une tâche (scan, analyse, pipeline) : durées par phase, compteurs et profilage
+
+    Un thread rattaché à la tâche (``attach``/``detach``, ou ``run`` pour une
+    unité soumise à un pool) ajoute ses spans (voir ``span``) aux durées de la
+    tâche et devient visible du profileur. Les durées des threads parallèles
+    s'additionnent : la somme peut dépasser la durée de la tâche. Les compteurs
+    (``count_usage`` : cache, aperçus, règles, requêtes IA) et latences
+    (``observe_latency``) restent propres à la tâche quand plusieurs jobs tournent.
+    """
+
+    def __init__(self, task: str):
+        self.task = task
+        self.running = True
+        self.profiler: Optional[TaskProfiler] = None
+        self.last_capture: Optional[Path] = None
+        self._totals: Dict[str, float] = defaultdict(float)
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._usage: Dict[str, int] = defaultdict(int)
+        self._latencies: Dict[str, LatencyStats] = {}
+        self._threads: Dict[int, int] = {}
+        self._names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float, count: int = 1):
+        with self._lock:
+            self._totals[phase] += seconds
+            self._counts[phase] += count
+
+    def count(self, key: str, n: int = 1):
+        with self._lock:
+            self._usage[key] += n
+
+    def usage(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._usage)
+
+    def latency(self, name: str) -> LatencyStats:
+        with self._lock:
+            stats = self._latencies.get(name)
+            if stats is None:
+                stats = self._latencies[name] = LatencyStats()
+            return stats
+
+    def attach(self) -> Tuple:
+        """Rattache le thread courant ; retourne le jeton à passer à ``detach``"""
+        ident = threading.get_ident()
+        previous = getattr(_trace_local, 'trace', None)
+        _trace_local.trace = self
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+            self._names[ident] = threading.current_thread().name
+        profiler = self.profiler
+        return previous, profiler, profiler.enter() if profiler else None
+
+    def detach(self, token: Tuple):
+        previous, profiler, profile = token
+        if profile is not None:
+            profiler.exit(profile)
+        ident = threading.get_ident()
+        with self._lock:
+            remaining = self._threads.get(ident, 1) - 1
+            if remaining:
+                self._threads[ident] = remaining
+            else:
+                self._threads.pop(ident, None)
+        _trace_local.trace = previous
+
+    def run(self, func, *args):
+        token = self.attach()
+        try:
+            return func(*args)
+        finally:
+            self.detach(token)
+
+    def thread_ids(self) -> List[int]:
+        with self._lock:
+            return list(self._threads)
+
+    def thread_names(self) -> Dict[int, str]:
+        with self._lock:
+            return dict(self._names)
+
+    def start_profile(self, mode: str, interval: Optional[float] = None) -> TaskProfiler:
+        with self._lock:
+            if self.profiler is not None and self.profiler.result is None:
+                raise RuntimeError('Profilage déjà actif pour cette tâche')
+            self.profiler = TaskProfiler(self, mode, interval)
+            return self.profiler
+
+    def stop_profile(self) -> Optional[Dict]:
+        profiler = self.profiler
+        return profiler.stop() if profiler else None
+
+    def spans(self) -> Dict[str, Dict]:
+        """{phase: {seconds, count}} des phases observées, dans l'ordre de PHASES"""
+        with self._lock:
+            return {phase: {'seconds': round(self._totals[phase], 4), 'count': self._counts[phase]}
+                    for phase in PHASES + tuple(sorted(set(self._totals) - set(PHASES)))
+                    if self._counts.get(phase)}
+
+    def finish(self) -> Dict:
+        """Fin de tâche : arrête la capture éventuelle ; retourne spans et profil"""
+        self.running = False
+        return {'spans': self.spans(), 'profile': self.stop_profile()}
+
+# Dernière trace de chaque tâche ("scan", "analyze", "pipeline") : profilage et téléchargement
+task_traces: Dict[str, TaskTrace] = {}
+
+def start_trace(task: str, profile: Optional[str] = None) -> TaskTrace:
+    trace = TaskTrace(task)
+    if profile:
+        trace.start_profile(profile)
+    task_traces[task] = trace
+    return trace
+
+def current_trace() -> Optional[TaskTrace]:
+    return getattr(_trace_local, 'trace', None)
+
+@contextmanager
+def span(phase: str):
+    """Ajoute la durée du bloc à la phase ``phase`` de la tâche du thread courant (sans tâche : rien)"""
+    trace = getattr(_trace_local, 'trace', None)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add(phase, time.perf_counter() - started)
+
+def count_usage(key: str, n: int = 1):
+    """Ajoute ``n`` au compteur ``key`` de la tâche du thread courant (sans tâche : rien)"""
+    trace = getattr(_trace_local, 'trace', None)
+    if trace is not None:
+        trace.count(key, n)
+
+def observe_latency(name: str, seconds: float):
+    """Mesure de latence de la tâche du thread courant (``verdict``, ``prompt_eval``)"""
+    trace = getattr(_trace_local, 'trace', None)
+    if trace is not None:
+        trace.latency(name).add(seconds)
+
+# ============================================================================
+# Extraction des aperçus
+# ============================================================================
+
+class Preview(NamedTuple):
+    text: Optional[str]
+    bytes_read: int
+
+class _CountingFile(io.FileIO):
+    """Fichier binaire qui compte les octets réellement lus"""
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data or b'')
+        return data
+
+    def readinto(self, buffer):
+        count = super().readinto(buffer)
+        self.bytes_read += count or 0
+        return count
+
+# Registre extension -> extracteur ; chaque extracteur lit au plus PREVIEW_MAX_BYTES
+PREVIEW_EXTRACTORS: Dict[str, object] = {}
+# Extensions dont l'extraction (parsing, décompression) part dans le pool de processus
+ISOLATED_PREVIEW_EXTENSIONS: set = set()
+
+def register_extractor(*extensions: str, isolated: bool = False):
+    """Décorateur : enregistre ``func(path) -> Preview`` pour ces extensions"""
+    def decorator(func):
+        for ext in extensions:
+            PREVIEW_EXTRACTORS[ext] = func
+            if isolated:
+                ISOLATED_PREVIEW_EXTENSIONS.add(ext)
+        return func
+    return decorator
+
+def _clean_preview(text: str) -> Optional[str]:
+    text = ' '.join(text.split())
+    return text[:PREVIEW_CHARS] or None
+
+@register_extractor('.txt', '.md', '.json', '.csv', '.tsv', '.log', '.xml', '.yaml', '.yml', '.ini', '.html')
+def _extract_plain_text(path: str) -> Preview:
+    """Début du fichier ; pour les gros fichiers, début + fin via mmap (jamais le fichier entier)"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= PREVIEW_HEAD_BYTES + PREVIEW_TAIL_BYTES:
+            data = f.read(size)
+            return Preview(data.decode('utf-8', errors='ignore')[:PREVIEW_CHARS] or None, len(data))
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            head = mapped[:PREVIEW_HEAD_BYTES]
+            tail = mapped[size - PREVIEW_TAIL_BYTES:]
+    tail_chars = PREVIEW_CHARS // 4
+    head_text = head.decode('utf-8', errors='ignore')[:PREVIEW_CHARS - tail_chars]
+    # La fin peut commencer au milieu d'une ligne : on repart de la ligne suivante si possible
+    tail_text = tail.decode('utf-8', errors='ignore')
+    tail_text = tail_text.split('\n', 1)[-1][-tail_chars:]
+    return Preview(f"{head_text}\n[…]\n{tail_text}", len(head) + len(tail))
+
+_PDF_STREAM_RE = re.compile(rb'stream\r?\n')
+_PDF_TEXT_BLOCK_RE = re.compile(rb'BT\b(.*?)\bET\b', re.S)
+_PDF_TEXT_TOKEN_RE = re.compile(rb'\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]+>|\b(?:Td|TD|Tm)\b|T\*|\'|"', re.S)
+_PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+def _pdf_string(token: bytes) -> str:
+    """Décode une chaîne littérale ``(...)`` ou hexadécimale ``<...>`` d'un flux de contenu"""
+    if token.startswith(b'<'):
+        digits = re.sub(rb'\s', b'', token[1:-1])
+        if len(digits) % 2:
+            digits += b'0'  # chiffre final manquant : complété par 0 (spécification PDF)
+        raw = bytes.fromhex(digits.decode())
+    else:
+        raw = re.sub(rb'\\([0-7]{1,3}|.)',
+                     lambda m: (bytes([int(m.group(1), 8) & 0xFF]) if m.group(1)[:1].isdigit()
+                                else _PDF_ESCAPES.get(m.group(1), m.group(1))),
+                     token[1:-1], flags=re.S)
+    if raw.startswith(b'\xfe\xff') or (len(raw) > 1 and raw[0] == 0):
+        text = raw.decode('utf-16-be', errors='ignore')
+    else:
+        text = raw.decode('latin-1')
+    # Polices à encodage propre (identifiants de glyphes) : illisible, on ignore
+    printable = sum(ch.isprintable() for ch in text)
+    return text if text and printable >= len(text) * 0.8 else ''
+
+def _pdf_stream_text(content: bytes) -> str:
+    parts = []
+    for block in _PDF_TEXT_BLOCK_RE.findall(content):
+        for token in _PDF_TEXT_TOKEN_RE.findall(block):
+            if token[:1] in (b'(', b'<'):
+                try:
+                    parts.append(_pdf_string(token))
+                except ValueError:
+                    continue  # jeton illisible : on garde le reste du texte
+            else:
+                parts.append(' ')
+        parts.append(' ')
+    return ''.join(parts)
+
+@register_extractor('.pdf', isolated=True)
+def _extract_pdf(path: str) -> Preview:
+    """Texte des premiers flux de contenu, lus dans une fenêtre de PREVIEW_MAX_BYTES en tête de fichier
+
+    Pas de lecture de la table xref ni des objets du document entier. Si rien
+    n'est trouvé et que le fichier tient dans la fenêtre, PyPDF2 (si présent)
+    est essayé sur cette même fenêtre en mémoire.
+    """
+    with _CountingFile(path, 'r') as f:
+        size = os.fstat(f.fileno()).st_size
+        window = f.read(PREVIEW_MAX_BYTES)
+        bytes_read = f.bytes_read
+
+    texts = []
+    for match in _PDF_STREAM_RE.finditer(window):
+        start = match.end()
+        end = window.find(b'endstream', start)
+        if end < 0:
+            break
+        header = window[max(0, window.rfind(b'obj', 0, match.start())):match.start()]
+        if any(marker in header for marker in (b'/Image', b'/XObject', b'/FontFile', b'/Metadata', b'/ObjStm')):
+            continue
+        data = window[start:end]
+        if b'/Filter' in header:
+            if b'/FlateDecode' not in header:
+                continue
+            try:
+                data = zlib.decompressobj().decompress(data, PREVIEW_MAX_BYTES)
+            except zlib.error:
+                continue
+        text = _pdf_stream_text(data).strip()
+        if text:
+            texts.append(text)
+            if len(texts) >= PREVIEW_PDF_PAGES or sum(map(len, texts)) >= PREVIEW_CHARS:
+                break
+
+    preview = _clean_preview(' '.join(texts))
+    if preview is None and PDF_AVAILABLE and size <= len(window):
+        reader = PdfReader(io.BytesIO(window))
+        preview = _clean_preview(' '.join(page.extract_text() or '' for page in reader.pages[:PREVIEW_PDF_PAGES]))
+    return Preview(preview, bytes_read)
+
+_XML_TAG_RE = re.compile(r'<[^>]*>')
+_XML_BREAK_RE = re.compile(r'</(?:w:p|text:p|text:h|a:p)>')
+
+def _zip_member_text(path: str, member: str) -> Preview:
+    """Texte d'un membre XML d'une archive, décompressé en flux jusqu'à PREVIEW_MAX_BYTES"""
+    with _CountingFile(path, 'r') as f:
+        with zipfile.ZipFile(f) as archive, archive.open(member) as stream:
+            chunks, decompressed = [], 0
+            while decompressed < PREVIEW_MAX_BYTES:
+                chunk = stream.read(min(16384, PREVIEW_MAX_BYTES - decompressed))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                decompressed += len(chunk)
+                # Le texte extrait suffit déjà (une balise coupée en fin de morceau est sans effet)
+                xml = b''.join(chunks).decode('utf-8', errors='ignore')
+                text = _XML_TAG_RE.sub('', _XML_BREAK_RE.sub(' ', xml))
+                if len(' '.join(text.split())) >= PREVIEW_CHARS:
+                    break
+        bytes_read = f.bytes_read
+    xml = b''.join(chunks).decode('utf-8', errors='ignore')
+    return Preview(_clean_preview(_XML_TAG_RE.sub('', _XML_BREAK_RE.sub(' ', xml))), bytes_read)
+
+@register_extractor('.docx', isolated=True)
+def _extract_docx(path: str) -> Preview:
+    return _zip_member_text(path, 'word/document.xml')
+
+@register_extractor('.odt', isolated=True)
+def _extract_odt(path: str) -> Preview:
+    return _zip_member_text(path, 'content.xml')
+
+def extract_preview(path: str, ext: str) -> Preview:
+    """Aperçu texte borné en I/O via le registre d'extracteurs (texte None si non géré ou illisible)"""
+    extractor = PREVIEW_EXTRACTORS.get(ext)
+    if extractor is None:
+        return Preview(None, 0)
+    try:
+        return extractor(path)
+    except Exception as e:
+        print(f"⚠️ Erreur lecture fichier {path}: {e}")
+        return Preview(None, 0)
+
+def extract_text_preview(path: str, ext: str) -> Optional[str]:
+    """Extrait le texte des fichiers avec gestion robuste des erreurs"""
+    return extract_preview(path, ext).text
+
+def _extract_worker_init(memory_mb: int):
+    """Initialisation d'un processus d'extraction : plafond d'espace d'adressage"""
+    if resource is not None and memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass
+
+EXTRACTION_STATS = ('extracted', 'bytes_read', 'prefetched', 'prefetch_hits', 'timeouts', 'crashes')
+
+class PreviewExtractor:
+    """Extraction des aperçus coûteux (PDF) dans un pool de processus.
+
+    Le parsing PyPDF2 est du Python pur qui garde le GIL : il tourne ici dans
+    des processus séparés, avec un timeout dur par fichier (le pool est tué et
+    recréé si un fichier bloque) et un plafond mémoire par processus. ``prefetch``
+    lance l'extraction à l'avance ; ``extract`` réutilise alors le résultat.
+    Les formats simples (texte) restent lus en ligne.
+    """
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None,
+                 memory_mb: Optional[int] = None, prefetch_depth: Optional[int] = None,
+                 extensions: Optional[set] = None, target=None):
+        self.workers = max(0, int(EXTRACT_WORKERS if workers is None else workers))
+        self.timeout = float(timeout or EXTRACT_TIMEOUT)
+        self.memory_mb = int(EXTRACT_MEMORY_MB if memory_mb is None else memory_mb)
+        self.prefetch_depth = max(0, int(EXTRACT_PREFETCH if prefetch_depth is None else prefetch_depth))
+        self.extensions = extensions if extensions is not None else ISOLATED_PREVIEW_EXTENSIONS
+        self.target = target or extract_preview
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._generation = 0
+        self._pending: Dict[str, Tuple[object, int]] = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(int)
+
+    def handles(self, ext: str) -> bool:
+        return self.workers > 0 and ext in self.extensions
+
+    def _submit(self, path: str, ext: str):
+        with self._lock:
+            if self._pool is None:
+                # spawn : pas de fork d'un processus multi-thread (verrous hérités)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_extract_worker_init,
+                    initargs=(self.memory_mb,)
+                )
+            return self._pool.submit(self.target, path, ext), self._generation
+
+    def _recycle(self, generation: int):
+        """Tue les processus du pool (fichier bloqué ou processus mort) ; le suivant sera recréé"""
+        with self._lock:
+            if generation != self._generation or self._pool is None:
+                return
+            pool, self._pool = self._pool, None
+            self._generation += 1
+            self._pending.clear()
+        # ProcessPoolExecutor ne sait pas interrompre une tâche : on termine ses processus
+        for process in list((getattr(pool, '_processes', None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def prefetch(self, path: str, ext: str):
+        if not self.handles(ext):
+            return
+        with self._lock:
+            if path in self._pending or len(self._pending) >= max(1, self.prefetch_depth) * 4:
+                return
+        entry = self._submit(path, ext)
+        with self._lock:
+            self._pending.setdefault(path, entry)
+            self._stats['prefetched'] += 1
+        count_usage('extraction:prefetched')
+
+    def extract(self, path: str, ext: str) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            with span('extract'):
+                return self._extract(path, ext)
+        finally:
+            preview_extraction_seconds.observe(time.perf_counter() - started, ext or 'none')
+
+    def _extract(self, path: str, ext: str) -> Optional[str]:
+        if not self.handles(ext):
+            return self._record(extract_preview(path, ext))
+        with self._lock:
+            entry = self._pending.pop(path, None)
+            if entry:
+                self._stats['prefetch_hits'] += 1
+        if entry:
+            count_usage('extraction:prefetch_hits')
+        for _ in range(2):
+            future, generation = entry or self._submit(path, ext)
+            entry = None
+            try:
+                return self._record(future.result(timeout=self.timeout))
+            except FuturesTimeout:
+                self._count('timeouts')
+                print(f"⏱️ Extraction abandonnée après {self.timeout:.0f}s: {path}")
+                self._recycle(generation)
+                return None
+            except (BrokenProcessPool, CancelledError):
+                # Processus tué (mémoire) ou pool recyclé pour un autre fichier : un nouvel essai
+                self._recycle(generation)
+            except Exception as e:
+                print(f"⚠️ Erreur extraction {path}: {e}")
+                return None
+        self._count('crashes')
+        return None
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+        count_usage('extraction:' + key)
+
+    def _record(self, preview: Preview) -> Optional[str]:
+        with self._lock:
+            self._stats['extracted'] += 1
+            self._stats['bytes_read'] += preview.bytes_read
+        count_usage('extraction:extracted')
+        count_usage('extraction:bytes_read', preview.bytes_read)
+        return preview.text
+
+    def pending(self) -> int:
+        """Préchargements en attente de consommation"""
+        with self._lock:
+            return len(self._pending)
+
+    def discard_pending(self):
+        """Abandonne les préchargements non consommés (fin ou annulation d'analyse)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {key: self._stats[key] for key in EXTRACTION_STATS}
+
+    def shutdown(self):
+        self.discard_pending()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+preview_extractor = PreviewExtractor()
+
+# Règles par défaut (utilisées sans fichier de règles). Ordre = priorité : la première qui correspond décide.
+# stage "local" : avant le LLM ; stage "fallback" : quand la requête IA a échoué.
+DEFAULT_RULES = [
+    {'id': 'screenshot', 'when': {'screenshot': True},
+     'decision': {'importance': 'low', 'can_delete': True, 'reason': 'Capture d\'écran détectée'}},
+    {'id': 'old-temporary', 'when': {'temporary': True, 'min_age_days': 30},
+     'decision': {'importance': 'low', 'can_delete': True, 'reason': 'Fichier temporaire/test (+30 jours)'}},
+    {'id': 'protected-keyword', 'when': {'protected': True},
+     'decision': {'importance': 'high', 'can_delete': False, 'reason': 'Mot-clé protégé: "{keyword}"'}},
+    {'id': 'large-binary', 'when': {'no_preview': True, 'min_size_mb': 50},
+     'decision': {'importance': 'unknown', 'can_delete': False,
+                  'reason': 'Gros fichier binaire (>50MB) - Revue manuelle requise'}},
+    {'id': 'fallback-old-temporary', 'stage': 'fallback',
+     'when': {'ext': ['.tmp', '.temp', '.log'], 'min_age_days': 31},
+     'decision': {'importance': 'low', 'can_delete': True, 'reason': 'Fichier temporaire ancien'}},
+    {'id': 'fallback-old-installer', 'stage': 'fallback',
+     'when': {'ext': ['.dmg', '.pkg', '.exe', '.msi'], 'min_age_days': 91},
+     'decision': {'importance': 'medium', 'can_delete': True, 'reason': 'Installeur ancien'}},
+]
+
+RULE_STAGES = ('local', 'fallback')
+RULE_CONDITIONS = {'ext', 'category', 'name', 'parent', 'path_glob', 'min_age_days', 'max_age_days',
+                   'min_size_mb', 'max_size_mb', 'screenshot', 'temporary', 'protected', 'no_preview'}
+
+_PREVIEW_UNKNOWN = object()
+
+def _as_list(value) -> List[str]:
+    return [value] if isinstance(value, str) else list(value)
+
+class _LazyNames(dict):
+    """Nom et dossier parent normalisés, calculés au premier besoin puis partagés entre règles"""
+
+    def __init__(self, file_info: Dict):
+        super().__init__()
+        self.file_info = file_info
+
+    def __missing__(self, key: str) -> str:
+        if key == 'name':
+            value = _normalize(self.file_info.get('name', ''))
+        else:
+            value = _normalize(os.path.basename(os.path.dirname(self.file_info.get('path', ''))))
+        self[key] = value
+        return value
+
+class _CompiledRule:
+    """Une règle validée : conditions converties en ensembles, regex et bornes numériques"""
+
+    __slots__ = ('id', 'stage', 'decision', 'exts', 'categories', 'name_re', 'parent_re', 'path_re',
+                 'min_age', 'max_age', 'min_size', 'max_size', 'flags', 'no_preview')
+
+    def __init__(self, index: int, raw: Dict):
+        self.id = str(raw.get('id') or f'rule-{index + 1}')
+        self.stage = raw.get('stage', 'local')
+        when = raw.get('when') or {}
+        decision = raw.get('decision') or {}
+        unknown = set(when) - RULE_CONDITIONS
+        if unknown:
+            raise ValueError(f'{self.id}: conditions inconnues {sorted(unknown)}')
+        if self.stage not in RULE_STAGES:
+            raise ValueError(f'{self.id}: stage inconnu "{self.stage}"')
+        if 'can_delete' not in decision:
+            raise ValueError(f'{self.id}: decision.can_delete manquant')
+        for key in ('importance', 'reason'):
+            if key in decision and not isinstance(decision[key], str):
+                raise ValueError(f'{self.id}: decision.{key} doit être une chaîne')
+        self.decision = {
+            'importance': decision.get('importance', 'low' if decision['can_delete'] else 'medium'),
+            'can_delete': bool(decision['can_delete']),
+            'reason': decision.get('reason', f'Règle {self.id}')
+        }
+
+        # Types vérifiés au chargement : une règle mal écrite ne doit pas échouer pendant l'analyse
+        def strings(key) -> List[str]:
+            values = _as_list(when[key]) if isinstance(when[key], (str, list)) else None
+            if values is None or not all(isinstance(v, str) for v in values):
+                raise ValueError(f'{self.id}: {key} doit être une chaîne ou une liste de chaînes')
+            return values
+
+        def number(key):
+            value = when.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f'{self.id}: {key} doit être un nombre')
+            return value
+
+        def alternation(key, translate=None):
+            if not when.get(key):
+                return None
+            parts = []
+            for pattern in strings(key):
+                part = translate(pattern) if translate else f'(?:{pattern})'
+                try:
+                    re.compile(part)
+                except re.error as e:
+                    raise ValueError(f'{self.id}: regex invalide dans {key} "{pattern}": {e}')
+                parts.append(part)
+            return re.compile('|'.join(parts))
+
+        # Noms et dossiers parents : regex cherchées dans le nom normalisé (sans accents, minuscules)
+        self.exts = frozenset(e.lower() for e in strings('ext')) if 'ext' in when else None
+        self.categories = frozenset(strings('category')) if 'category' in when else None
+        self.name_re = alternation('name')
+        self.parent_re = alternation('parent')
+        self.path_re = alternation('path_glob', fnmatch.translate)
+        self.min_age = number('min_age_days')
+        self.max_age = number('max_age_days')
+        self.min_size = number('min_size_mb') * 1024 * 1024 if 'min_size_mb' in when else None
+        self.max_size = number('max_size_mb') * 1024 * 1024 if 'max_size_mb' in when else None
+        self.flags = tuple((flag, bool(when[flag])) for flag in ('screenshot', 'temporary', 'protected')
+                           if flag in when)
+        self.no_preview = when.get('no_preview')
+
+    def matches(self, file_info: Dict, classification: Classification, preview,
+                names: Dict[str, str]) -> Optional[bool]:
+        """True/False, ou None si la règle dépend d'un aperçu pas encore extrait"""
+        age = file_info.get('age', 0)
+        size = file_info.get('size', 0)
+        if self.min_age is not None and age < self.min_age:
+            return False
+        if self.max_age is not None and age > self.max_age:
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.categories is not None and classification.category not in self.categories:
+            return False
+        for flag, expected in self.flags:
+            if getattr(classification, flag) != expected:
+                return False
+        if self.name_re is not None and not self.name_re.search(names['name']):
+            return False
+        if self.parent_re is not None and not self.parent_re.search(names['parent']):
+            return False
+        if self.path_re is not None and not self.path_re.match(file_info.get('path', '')):
+            return False
+        if self.no_preview is not None:
+            if preview is _PREVIEW_UNKNOWN:
+                return None
+            return (not preview) == bool(self.no_preview)
+        return True
+
+class RuleEngine:
+    """Règles déclaratives compilées une fois, évaluées dans l'ordre (la première qui correspond décide).
+
+    Les règles sont indexées par extension : pour chaque extension, la liste
+    ordonnée des règles applicables est calculée une fois, les autres ne sont
+    jamais évaluées. Chaque décision est comptée par règle, pour régler le
+    fichier et faire baisser la part des fichiers envoyés au LLM.
+    """
+
+    def __init__(self, rules: List[Dict], source: str = 'défaut'):
+        self.source = source
+        self.rules = [_CompiledRule(i, raw) for i, raw in enumerate(rules)]
+        ids = [rule.id for rule in self.rules]
+        if len(set(ids)) != len(ids):
+            raise ValueError('identifiants de règles en double')
+        self._by_ext: Dict[Tuple[str, str], Tuple[_CompiledRule, ...]] = {}
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _rules_for(self, stage: str, ext: str) -> Tuple[_CompiledRule, ...]:
+        key = (stage, ext)
+        rules = self._by_ext.get(key)
+        if rules is None:
+            rules = tuple(rule for rule in self.rules
+                          if rule.stage == stage and (rule.exts is None or ext in rule.exts))
+            self._by_ext[key] = rules
+        return rules
+
+    def decide(self, file_info: Dict, preview=_PREVIEW_UNKNOWN, stage: str = 'local',
+               classification: Optional[Classification] = None) -> Optional[Dict]:
+        """Décision de la première règle qui correspond, ou None (sans aperçu : s'arrête aux règles qui en dépendent)"""
+        name = file_info.get('name', '')
+        ext = (file_info.get('ext') or os.path.splitext(name)[1]).lower()
+        if classification is None:
+            classification = get_classifier().classify(name, ext)
+        names = _LazyNames(file_info)
+        for rule in self._rules_for(stage, ext):
+            matched = rule.matches(file_info, classification, preview, names)
+            if matched is None:
+                return None
+            if matched:
+                with self._lock:
+                    self._counts[rule.id] += 1
+                count_usage('rule:' + rule.id)
+                decision = dict(rule.decision, rule=rule.id)
+                if '{' in decision['reason']:
+                    try:
+                        decision['reason'] = decision['reason'].format(
+                            keyword=classification.keyword or '', name=name, ext=ext,
+                            age=file_info.get('age', 0), category=classification.category)
+                    except (KeyError, IndexError, ValueError):
+                        pass
+                return decision
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {rule.id: self._counts[rule.id] for rule in self.rules}
+
+    def describe(self) -> List[Dict]:
+        counts = self.stats()
+        return [{'id': rule.id, 'stage': rule.stage, 'decision': rule.decision, 'decided': counts[rule.id]}
+                for rule in self.rules]
+
+def load_rules(path: Path) -> RuleEngine:
+    """Règles du fichier JSON (liste ou {"rules": [...]}) ; règles par défaut si absent ou invalide"""
+    if not path.exists():
+        return RuleEngine(DEFAULT_RULES)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        rules = data.get('rules', []) if isinstance(data, dict) else data
+        return RuleEngine(rules, source=str(path))
+    except (OSError, ValueError, TypeError, AttributeError, re.error) as e:
+        print(f"⚠️ Règles invalides dans {path}: {e} - règles par défaut utilisées")
+        return RuleEngine(DEFAULT_RULES)
+
+_rule_engine: Optional[RuleEngine] = None
+_rule_engine_sig = None
+_rule_engine_lock = threading.Lock()
+
+def refresh_rules() -> RuleEngine:
+    """Recompile les règles si le fichier a changé (appelé au début de chaque analyse)"""
+    global _rule_engine, _rule_engine_sig
+    try:
+        stat = RULES_PATH.stat()
+        signature = (str(RULES_PATH), stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        signature = (str(RULES_PATH), None, None)
+    with _rule_engine_lock:
+        if _rule_engine is None or signature != _rule_engine_sig:
+            _rule_engine = load_rules(RULES_PATH)
+            _rule_engine_sig = signature
+        return _rule_engine
+
+def get_rule_engine() -> RuleEngine:
+    return _rule_engine or refresh_rules()
+
+def apply_local_rules(file_info: Dict, preview: Optional[str],
+                      classification: Optional[Classification] = None) -> Optional[Dict]:
+    """Règles locales pour décision automatique"""
+    return get_rule_engine().decide(file_info, preview, classification=classification)
+
+def check_ollama_availability(verbose: bool = True) -> bool:
+    """Vérifie si Ollama est disponible (sonde /api/tags directe, non mise en cache)"""
+    try:
+        resp = session.get(_ollama_endpoint('/api/tags'), timeout=5)
+        if resp.status_code == 200:
+            if verbose:
+                print("✅ Ollama est disponible")
+            return True
+    except Exception as e:
+        if verbose:
+            print(f"❌ Ollama non disponible: {e}")
+    return False
+
+class OllamaHealthMonitor:
+    """État de santé Ollama mis en cache (TTL) et disjoncteur.
+
+    - fermé : les requêtes passent, les échecs consécutifs sont comptés ;
+    - ouvert : après ``failure_threshold`` échecs, tout échoue immédiatement
+      (bascule sur les règles locales) pendant ``cooldown`` secondes ;
+    - semi-ouvert : une seule requête d'essai passe ; succès -> fermé,
+      échec -> ouvert à nouveau. L'essai est libéré par ``release_trial`` quelle
+      que soit l'issue de la requête ; une sonde réussie referme aussi le disjoncteur.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, ttl: float, failure_threshold: int, cooldown: float):
+        self.ttl = ttl
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._available = False
+        self._checked_at: Optional[float] = None
+        self._breaker = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_owner: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _probe(self) -> bool:
+        return check_ollama_availability(verbose=False)
+
+    def refresh(self) -> bool:
+        """Sonde /api/tags et met à jour le cache"""
+        ok = self._probe()
+        with self._lock:
+            was_available = self._available
+            self._available = ok
+            self._checked_at = time.monotonic()
+            if not ok and self._breaker == self.CLOSED:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open()
+            elif ok and self._breaker == self.HALF_OPEN:
+                self._close()
+        if ok != was_available:
+            print("✅ Ollama est disponible" if ok else "❌ Ollama non disponible")
+        return ok
+
+    def _open(self):
+        self._breaker = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def _close(self):
+        self._failures = 0
+        self._breaker = self.CLOSED
+        self._trial_in_flight = False
+
+    def _update_breaker(self):
+        if self._breaker == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._breaker = self.HALF_OPEN
+            self._trial_in_flight = False
+
+    def is_available(self) -> bool:
+        """Statut en cache ; une seule sonde à la fois quand le TTL est expiré"""
+        with self._lock:
+            stale = self._checked_at is None or time.monotonic() - self._checked_at >= self.ttl
+        if stale and self._probe_lock.acquire(blocking=self._checked_at is None):
+            try:
+                self.refresh()
+            finally:
+                self._probe_lock.release()
+        with self._lock:
+            self._update_breaker()
+            return self._available and self._breaker != self.OPEN
+
+    def allow_request(self) -> bool:
+        """Autorise un appel /api/generate selon l'état du disjoncteur"""
+        with self._lock:
+            self._update_breaker()
+            if self._breaker == self.CLOSED:
+                return True
+            if self._breaker == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                self._trial_owner = threading.get_ident()
+                return True
+            return False
+
+    def release_trial(self):
+        """Libère l'essai semi-ouvert pris par ce thread s'il n'a été ni réussi ni échoué"""
+        with self._lock:
+            if self._trial_in_flight and self._trial_owner == threading.get_ident():
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._close()
+            self._available = True
+            self._checked_at = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._breaker == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open()
+                self._available = False
+                self._checked_at = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._available = False
+            self._checked_at = None
+            self._breaker = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            self._update_breaker()
+            age = None if self._checked_at is None else round(time.monotonic() - self._checked_at, 1)
+            return {
+                'available': self._available and self._breaker != self.OPEN,
+                'breaker': self._breaker,
+                'consecutive_failures': self._failures,
+                'checked_seconds_ago': age
+            }
+
+    def start(self):
+        """Rafraîchissement périodique en arrière-plan (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='ollama-health', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self._probe_lock:
+                    self.refresh()
+            except Exception as e:
+                print(f"Erreur sonde Ollama: {e}")
+            time.sleep(self.ttl)
+
+ollama_health = OllamaHealthMonitor(OLLAMA_HEALTH_TTL, OLLAMA_BREAKER_THRESHOLD, OLLAMA_BREAKER_COOLDOWN)
+
+# Sortie structurée Ollama (format=schema) : la génération est contrainte à ce JSON
+VERDICT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'can_delete': {'type': 'boolean'},
+        'reason': {'type': 'string'},
+        'importance': {'type': 'string', 'enum': ['low', 'medium', 'high']}
+    },
+    'required': ['can_delete', 'reason', 'importance']
+}
+BATCH_VERDICT_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': dict(VERDICT_SCHEMA['properties'], id={'type': 'integer'}),
+        'required': ['id'] + VERDICT_SCHEMA['required']
+    }
+}
+
+class LatencyStats:
+    """Durées récentes (fenêtre bornée) et cumuls : moyenne, percentiles, max"""
+
+    def __init__(self, window: int = 4096):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+
+    def mark(self) -> int:
+        """Repère à passer à ``summary`` pour ne résumer que les mesures suivantes"""
+        with self._lock:
+            return self._count
+
+    def summary(self, since: int = 0) -> Dict:
+        with self._lock:
+            recent = min(self._count - since, len(self._samples))
+            samples = sorted(list(self._samples)[len(self._samples) - recent:]) if recent > 0 else []
+        if not samples:
+            return {'count': 0}
+
+        def percentile(q):
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1)
+
+        return {
+            'count': len(samples),
+            'avg_ms': round(sum(samples) / len(samples) * 1000, 1),
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': round(samples[-1] * 1000, 1)
+        }
+
+class _JsonStreamScanner:
+    """Repère la fin du premier objet (ou tableau) JSON dans un texte reçu par fragments.
+
+    Suit la profondeur des accolades/crochets hors chaînes ; chaque caractère
+    n'est examiné qu'une fois, quel que soit le découpage des fragments.
+    """
+
+    def __init__(self, opener: str = '{'):
+        self.opener = opener
+        self.closer = '}' if opener == '{' else ']'
+        self._parts: List[str] = []
+        self._length = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, fragment: str) -> Optional[str]:
+        """Ajoute un fragment ; retourne le texte JSON complet dès qu'il est fermé"""
+        offset = self._length
+        self._parts.append(fragment)
+        self._length += len(fragment)
+        for pos, ch in enumerate(fragment, offset):
+            if self._start is None:
+                if ch == self.opener:
+                    self._start, self._depth = pos, 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    return ''.join(self._parts)[self._start:pos + 1]
+        return None
+
+    def text(self) -> str:
+        return ''.join(self._parts)
+
+def _generation_timings(chunk: Dict, timings: Dict):
+    """Durées rapportées par Ollama dans la réponse finale (nanosecondes -> secondes)"""
+    for key in ('load_duration', 'prompt_eval_duration', 'eval_duration'):
+        if chunk.get(key) is not None:
+            timings[key.replace('_duration', '')] = chunk[key] / 1e9
+    if chunk.get('prompt_eval_count') is not None:
+        timings['prompt_eval_count'] = chunk['prompt_eval_count']
+
+def _read_streamed_response(resp, expect_list: bool, started: float, timings: Dict) -> Tuple[str, bool]:
+    """Lit les fragments NDJSON de /api/generate et coupe la requête dès que le JSON est complet.
+
+    Retourne (texte, coupé_tôt). Fermer la connexion arrête la génération côté Ollama.
+    Le délai du premier fragment (chargement + évaluation du prompt) est noté
+    dans ``timings['first_token']`` ; les durées exactes d'Ollama n'arrivent
+    qu'avec le dernier fragment, absent si la requête est coupée.
+    """
+    scanner = _JsonStreamScanner('[' if expect_list else '{')
+    try:
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('error'):
+                raise ValueError(chunk['error'])
+            timings.setdefault('first_token', time.monotonic() - started)
+            if chunk.get('done'):
+                _generation_timings(chunk, timings)
+            complete = scanner.feed(chunk.get('response', ''))
+            if complete is not None:
+                return complete, not chunk.get('done', False)
+            if chunk.get('done'):
+                break
+    finally:
+        resp.close()
+    return scanner.text(), False
+
+def call_ollama(prompt: str, model: str = "llama3:8b", expect_list: bool = False,
+                timings: Optional[Dict] = None, system: Optional[str] = None) -> Tuple[Optional[dict], Optional[str]]:
+    """Appel Ollama avec gestion d'erreurs complète
+
+    En streaming, la réponse est lue fragment par fragment et la requête est
+    fermée dès que l'objet JSON du verdict est complet. ``timings`` (dict
+    optionnel) reçoit ``time_to_verdict`` et ``prompt_eval`` en secondes et
+    ``stopped_early``. ``system`` porte les consignes communes à tous les fichiers.
+    """
+    timings = {} if timings is None else timings
+    if not OLLAMA_ENABLED:
+        return None, "Ollama désactivé"
+    
+    # Disjoncteur : échec immédiat si Ollama est tombé récemment
+    if not ollama_health.allow_request():
+        return None, "Ollama non disponible - Démarrez le service Ollama"
+    count_usage('llm_calls')  # budget de requêtes de la tâche (llm_budget)
+
+    started = None
+    parse_started = None
+    responded = False
+    outcome = 'error'
+    try:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": OLLAMA_STREAM,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {
+                "temperature": 0.1, 
+                "num_predict": 150,
+                "top_k": 40
+            }
+        }
+        if system:
+            payload["system"] = system
+        # Sortie JSON contrainte par Ollama : pas de nettoyage de texte à faire
+        if OLLAMA_FORMAT == 'schema':
+            payload["format"] = BATCH_VERDICT_SCHEMA if expect_list else VERDICT_SCHEMA
+        elif OLLAMA_FORMAT == 'json':
+            payload["format"] = "json"
+        
+        print(f"🔍 Envoi requête Ollama pour modèle: {model}")
+        started = time.monotonic()
+        resp = session.post(
+            _ollama_endpoint('/api/generate'), 
+            json=payload, 
+            timeout=OLLAMA_TIMEOUT,
+            stream=OLLAMA_STREAM
+        )
+        responded = True
+        
+        if resp.status_code >= 500:
+            ollama_health.record_failure()
+            outcome = 'http_error'
+            return None, f"Erreur HTTP {resp.status_code}: {resp.text}"
+        ollama_health.record_success()
+        if resp.status_code != 200:
+            outcome = 'http_error'
+            return None, f"Erreur HTTP {resp.status_code}: {resp.text}"
+        
+        if 'ndjson' in str(resp.headers.get('Content-Type', '')):
+            text, timings['stopped_early'] = _read_streamed_response(resp, expect_list, started, timings)
+        else:
+            data = resp.json()
+            _generation_timings(data, timings)
+            text = data.get('response', '')
+        parse_started = time.monotonic()
+        text = text.strip()
+        timings['time_to_verdict'] = parse_started - started
+        observe_latency('verdict', timings['time_to_verdict'])
+        # Évaluation du prompt : durée exacte d'Ollama, sinon délai du premier fragment
+        prompt_eval = timings.get('prompt_eval', timings.get('first_token'))
+        if prompt_eval is not None:
+            timings['prompt_eval'] = prompt_eval
+            observe_latency('prompt_eval', prompt_eval)
+        
+        if not text:
+            outcome = 'empty'
+            return None, "Réponse vide d'Ollama"
+        
+        if 'format' not in payload:
+            # Sans sortie contrainte (anciens serveurs) : nettoyage de la réponse
+            if '```json' in text:
+                text = text.split('```json')[1].split('```')[0].strip()
+            elif '```' in text:
+                text = text.split('```')[1].split('```')[0].strip()
+            json_match = re.search(r'\[.*\]' if expect_list else r'\{.*\}', text, re.DOTALL)
+            if json_match:
+                text = json_match.group()
+        
+        # Extraction JSON
+        try:
+            result = json.loads(text)
+        except json.JSONDecodeError:
+            outcome = 'invalid_json'
+            return None, f"Réponse JSON invalide: {text[:100]}..."
+        outcome = 'ok'
+        return result, None
+            
+    except requests.exceptions.Timeout:
+        ollama_health.record_failure()
+        outcome = 'timeout'
+        return None, f"Timeout après {OLLAMA_TIMEOUT}s - Ollama trop lent"
+    except requests.exceptions.ConnectionError:
+        ollama_health.record_failure()
+        outcome = 'connection_error'
+        return None, "Impossible de se connecter à Ollama - Service démarré ?"
+    except Exception as e:
+        if not responded:
+            # Requête partie sans réponse (redirections, URL invalide...) : échec pour le disjoncteur
+            ollama_health.record_failure()
+        return None, f"Erreur Ollama: {str(e)}"
+    finally:
+        ollama_health.release_trial()
+        if started is not None:
+            ended = time.monotonic()
+            ollama_request_seconds.observe(ended - started, model, outcome)
+            trace = current_trace()
+            if trace is not None:
+                # infer : requête et lecture de la réponse ; parse : nettoyage et décodage du verdict
+                trace.add('infer', (parse_started or ended) - started)
+                if parse_started is not None:
+                    trace.add('parse', ended - parse_started)
+
+_model_warmups: Dict[str, Dict] = {}
+
+def warm_model(model: str, keep_alive: Optional[str] = None) -> Dict:
+    """Charge le modèle (prompt vide) et le garde en mémoire ``keep_alive`` ; mesure le démarrage à froid"""
+    info = {'model': model, 'ok': False, 'keep_alive': keep_alive or OLLAMA_KEEP_ALIVE}
+    if not OLLAMA_ENABLED or not ollama_health.allow_request():
+        info['error'] = 'Ollama non disponible'
+        return info
+    started = time.monotonic()
+    try:
+        resp = session.post(
+            _ollama_endpoint('/api/generate'),
+            json={'model': model, 'prompt': '', 'stream': False, 'keep_alive': info['keep_alive']},
+            timeout=OLLAMA_WARMUP_TIMEOUT
+        )
+        # Comme call_ollama : toute réponse sous 500 (404 modèle absent compris) prouve qu'Ollama répond
+        if resp.status_code >= 500:
+            ollama_health.record_failure()
+        else:
+            ollama_health.record_success()
+        if resp.status_code != 200:
+            info['error'] = f"Erreur HTTP {resp.status_code}: {resp.text[:200]}"
+            return info
+        data = resp.json()
+        info.update({
+            'ok': True,
+            'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+            'load_ms': round((data.get('load_duration') or 0) / 1e6, 1)
+        })
+        _model_warmups[model] = info
+    except requests.exceptions.RequestException as e:
+        ollama_health.record_failure()
+        info['error'] = str(e)
+    except ValueError as e:
+        info['error'] = f'Réponse JSON invalide: {e}'
+    finally:
+        ollama_health.release_trial()
+    return info
+
+# Modèles de prompt : toute modification change PROMPT_VERSION et invalide le cache des verdicts.
+# Les consignes fixes vont dans le prompt "system", identique d'un fichier à l'autre :
+# Ollama réutilise son cache de prompt et seul le prompt propre au fichier est évalué.
+ANALYSIS_SYSTEM_PROMPT = """
+You analyze files for cleanup. Respond ONLY with a JSON object.
+
+Rules:
+- DELETE: installers, temp files, duplicates, random screenshots, old drafts
+- KEEP: personal documents, legal, financial, important work files
+
+JSON response only:
+{ 
+  "can_delete": true/false,
+  "reason": "short explanation",
+  "importance": "low"/"medium"/"high"
+}
+"""
+
+ANALYSIS_PROMPT_TEMPLATE = """
+Metadata:
+- Name: {name}
+- Age: {age} days  
+- Size: {size}
+- Category: {category}
+- Parent folder: {parent_folder}
+
+{preview_section}
+"""
+
+# Mode par lot : plusieurs fichiers par requête
+BATCH_SYSTEM_PROMPT = """
+You analyze files for cleanup. Respond ONLY with a JSON array, one object per file.
+
+Rules:
+- DELETE: installers, temp files, duplicates, random screenshots, old drafts
+- KEEP: personal documents, legal, financial, important work files
+
+JSON response only, one entry per file id:
+[
+  { "id": 1, "can_delete": true/false, "reason": "short explanation", "importance": "low"/"medium"/"high" }
+]
+"""
+BATCH_PROMPT_TEMPLATE = """
+Files:
+{entries}
+"""
+BATCH_ENTRY_TEMPLATE = "[{id}] Name: {name} | Age: {age} days | Size: {size} | Category: {category} | Parent folder: {parent_folder}\n{preview_section}"
+BATCH_PREVIEW_CHARS = 300
+
+PROMPT_VERSION = hashlib.sha1(
+    (ANALYSIS_SYSTEM_PROMPT + ANALYSIS_PROMPT_TEMPLATE + BATCH_SYSTEM_PROMPT
+     + BATCH_PROMPT_TEMPLATE + BATCH_ENTRY_TEMPLATE).encode('utf-8')
+).hexdigest()[:12]
+
+# ============================================================================
+# Cache persistant des verdicts IA
+# ============================================================================
+
+FINGERPRINT_BLOCK = 64 * 1024
+
+def file_fingerprint(path: str) -> Optional[str]:
+    """Identité d'un fichier : taille, mtime et hash des premiers/derniers 64KB"""
+    try:
+        st = os.stat(path)
+        digest = hashlib.blake2b(f'{st.st_size}:{st.st_mtime_ns}'.encode(), digest_size=16)
+        with open(path, 'rb') as f:
+            digest.update(f.read(FINGERPRINT_BLOCK))
+            if st.st_size > 2 * FINGERPRINT_BLOCK:
+                f.seek(-FINGERPRINT_BLOCK, os.SEEK_END)
+                digest.update(f.read(FINGERPRINT_BLOCK))
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+class VerdictCache:
+    """Cache SQLite des verdicts Ollama, clé = (empreinte fichier, modèle, version du prompt).
+
+    Éviction LRU quand ``max_entries`` est dépassé ; les entrées d'une ancienne
+    version du prompt sont purgées à l'ouverture.
+    """
+
+    def __init__(self, db_path, max_entries: int, prompt_version: str = PROMPT_VERSION):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(1, max_entries)
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                fingerprint TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (fingerprint, model, prompt_version)
+            );
+            CREATE INDEX IF NOT EXISTS verdicts_lru ON verdicts(last_used);
+        """)
+        self._conn.execute('DELETE FROM verdicts WHERE prompt_version != ?', (prompt_version,))
+        self._conn.commit()
+        self._count = self._conn.execute('SELECT COUNT(*) FROM verdicts').fetchone()[0]
+
+    def get(self, fingerprint: Optional[str], model: str) -> Optional[Dict]:
+        if fingerprint is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT verdict FROM verdicts WHERE fingerprint = ? AND model = ? AND prompt_version = ?',
+                (fingerprint, model, self.prompt_version)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                count_usage('cache:misses')
+                return None
+            self.hits += 1
+            count_usage('cache:hits')
+            self._conn.execute(
+                'UPDATE verdicts SET last_used = ? WHERE fingerprint = ? AND model = ? AND prompt_version = ?',
+                (time.time(), fingerprint, model, self.prompt_version)
+            )
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, fingerprint: Optional[str], model: str, verdict: Dict):
+        if fingerprint is None:
+            return
+        with self._lock:
+            cur = self._conn.execute(
+                'INSERT OR REPLACE INTO verdicts(fingerprint, model, prompt_version, verdict, last_used) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (fingerprint, model, self.prompt_version, json.dumps(verdict), time.time())
+            )
+            self._count += 1
+            if self._count > self.max_entries:
+                self._count = self._conn.execute('SELECT COUNT(*) FROM verdicts').fetchone()[0]
+                excess = self._count - self.max_entries
+                if excess > 0:
+                    self._conn.execute(
+                        'DELETE FROM verdicts WHERE rowid IN '
+                        '(SELECT rowid FROM verdicts ORDER BY last_used ASC LIMIT ?)', (excess,)
+                    )
+                    self._count -= excess
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': self._count}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_verdict_cache: Optional[VerdictCache] = None
+_verdict_cache_lock = threading.Lock()
+
+def get_verdict_cache() -> Optional[VerdictCache]:
+    """Cache partagé, ouvert à la première utilisation (None si désactivé)"""
+    global _verdict_cache
+    if not VERDICT_CACHE_ENABLED:
+        return None
+    with _verdict_cache_lock:
+        if _verdict_cache is None:
+            _verdict_cache = VerdictCache(VERDICT_CACHE_PATH, VERDICT_CACHE_MAX_ENTRIES)
+        return _verdict_cache
+
+def _prepare_analysis(file_info: Dict, model: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """Étapes sans LLM : retourne (décision, None) ou (None, contexte pour la requête IA)"""
+    path = file_info['path']
+    
+    # Extraction du preview (pool de processus pour les PDF, éventuellement déjà préchargée)
+    preview = preview_extractor.extract(path, file_info['ext'])
+    
+    # Règles locales d'abord
+    local_decision = apply_local_rules(file_info, preview)
+    if local_decision:
+        return local_decision, None
+
+    # Verdict déjà calculé pour ce fichier, ce modèle et ce prompt
+    cache = get_verdict_cache()
+    fingerprint = file_fingerprint(path) if cache else None
+    if cache:
+        cached = cache.get(fingerprint, model)
+        if cached:
+            return cached, None
+
+    # Si Ollama n'est pas disponible, utiliser des règles étendues
+    if not ollama_health.is_available():
+        return {
+            'importance': 'unknown',
+            'can_delete': False,
+            'reason': 'Ollama indisponible - Utilisez les règles automatiques'
+        }, None
+
+    return None, {'file_info': file_info, 'preview': preview, 'fingerprint': fingerprint}
+
+def _fallback_decision(file_info: Dict, error_message: Optional[str]) -> Dict:
+    """Règles automatiques (stage "fallback") en cas d'erreur Ollama"""
+    decision = get_rule_engine().decide(file_info, stage='fallback')
+    if decision:
+        return decision
+    return {'importance': 'unknown', 'can_delete': False, 'reason': f"IA indisponible - {error_message}"}
+
+def _accept_verdict(context: Dict, model: str, result: Dict, events=None,
+                    timings: Optional[Dict] = None) -> Dict:
+    cache = get_verdict_cache()
+    if cache:
+        cache.put(context['fingerprint'], model, result)
+    if timings and 'time_to_verdict' in timings:
+        # Mesures propres à cette requête : ajoutées après la mise en cache
+        result = dict(result, time_to_verdict_ms=round(timings['time_to_verdict'] * 1000, 1))
+        if 'prompt_eval' in timings:
+            result['prompt_eval_ms'] = round(timings['prompt_eval'] * 1000, 1)
+    (events or DIRECT_EVENTS).update('ai_result', {'file': context['file_info']['name'], 'result': result})
+    return result
+
+def _query_single(context: Dict, model: str, events=None) -> Dict:
+    """Requête Ollama pour un seul fichier"""
+    events = events or DIRECT_EVENTS
+    file_info = context['file_info']
+    preview = context['preview']
+    name = file_info['name']
+
+    # Préparation du prompt pour Ollama
+    parent_folder = Path(file_info['path']).parent.name
+    preview_section = f"Aperçu:\n{preview}\n" if preview else "Aperçu: Aucun (fichier binaire probable)"
+    
+    prompt = ANALYSIS_PROMPT_TEMPLATE.format(
+        name=name,
+        age=file_info['age'],
+        size=human_size(file_info['size']),
+        category=file_info['category'],
+        parent_folder=parent_folder,
+        preview_section=preview_section
+    )
+
+    events.update('ai_thinking', {'file': name})
+    
+    timings = {}
+    result, error_message = call_ollama(prompt, model, timings=timings, system=ANALYSIS_SYSTEM_PROMPT)
+    
+    # Comme en mode lot : une réponse incomplète n'entre pas dans le cache, règles de repli
+    verdict = _valid_verdict(result)
+    if verdict:
+        return _accept_verdict(context, model, verdict, events, timings)
+    if result is not None:
+        error_message = 'Réponse IA invalide'
+
+    decision = _fallback_decision(file_info, error_message)
+    events.update('ai_result', {'file': name, 'result': decision})
+    return decision
+
+def analyze_file_with_fallback(file_info: Dict, model: str, events=None) -> Dict:
+    """Analyse de fichier avec fallback vers règles locales"""
+    decision, context = _prepare_analysis(file_info, model)
+    if decision:
+        return decision
+    return _query_single(context, model, events)
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def _batch_entry(entry_id: int, context: Dict) -> str:
+    file_info = context['file_info']
+    preview = context['preview']
+    if preview:
+        preview_section = 'Preview: ' + ' '.join(preview[:BATCH_PREVIEW_CHARS].split())
+    else:
+        preview_section = 'Preview: none (binary file)'
+    return BATCH_ENTRY_TEMPLATE.format(
+        id=entry_id,
+        name=file_info['name'],
+        age=file_info['age'],
+        size=human_size(file_info['size']),
+        category=file_info['category'],
+        parent_folder=Path(file_info['path']).parent.name,
+        preview_section=preview_section
+    )
+
+def _pack_batches(contexts: List[Tuple[int, Dict]], token_budget: int) -> List[List[Tuple[int, Dict]]]:
+    """Regroupe les fichiers en requêtes sous le budget de tokens (estimation ~4 caractères/token)"""
+    base = _estimate_tokens(BATCH_SYSTEM_PROMPT + BATCH_PROMPT_TEMPLATE)
+    batches, current, used = [], [], base
+    for item in contexts:
+        cost = _estimate_tokens(_batch_entry(len(current) + 1, item[1])) + 1
+        if current and used + cost > token_budget:
+            batches.append(current)
+            current, used = [], base
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def _valid_verdict(item) -> Optional[Dict]:
+    if not isinstance(item, dict) or not isinstance(item.get('can_delete'), bool):
+        return None
+    importance = item.get('importance')
+    return {
+        'can_delete': item['can_delete'],
+        'reason': str(item.get('reason') or 'N/A'),
+        'importance': importance if importance in {'low', 'medium', 'high'} else 'unknown'
+    }
+
+def analyze_group_batched(file_infos: List[Dict], model: str, token_budget: Optional[int] = None,
+                          events=None) -> List[Dict]:
+    """Analyse un groupe de fichiers en regroupant plusieurs fichiers par requête.
+
+    Les fichiers tranchés sans LLM (règles locales, cache) sont exclus des lots ;
+    les entrées absentes ou invalides de la réponse sont ré-interrogées une par une.
+    """
+    token_budget = token_budget or ANALYSIS_BATCH_TOKENS
+    decisions: List[Optional[Dict]] = [None] * len(file_infos)
+    pending = []
+    for i, file_info in enumerate(file_infos):
+        decision, context = _prepare_analysis(file_info, model)
+        if decision:
+            decisions[i] = decision
+        else:
+            pending.append((i, context))
+
+    for batch in _pack_batches(pending, token_budget):
+        if len(batch) == 1:
+            i, context = batch[0]
+            decisions[i] = _query_single(context, model, events)
+            continue
+
+        entries = '\n\n'.join(_batch_entry(n, context) for n, (_, context) in enumerate(batch, 1))
+        (events or DIRECT_EVENTS).update('ai_thinking', {'file': batch[0][1]['file_info']['name']})
+        timings = {}
+        result, _error = call_ollama(BATCH_PROMPT_TEMPLATE.format(entries=entries), model, expect_list=True,
+                                     timings=timings, system=BATCH_SYSTEM_PROMPT)
+
+        by_id = {}
+        if isinstance(result, dict):
+            result = result.get('verdicts') or result.get('files') or [result]
+        if isinstance(result, list):
+            for item in result:
+                if isinstance(item, dict) and isinstance(item.get('id'), int):
+                    by_id.setdefault(item['id'], item)
+
+        for n, (i, context) in enumerate(batch, 1):
+            verdict = _valid_verdict(by_id.get(n))
+            if verdict:
+                decisions[i] = _accept_verdict(context, model, verdict, events, timings)
+            else:
+                decisions[i] = _query_single(context, model, events)
+
+    return decisions
+
+# ============================================================================
+# Index de scan persistant (SQLite)
+# ============================================================================
+
+def _rules_signature() -> str:
+    """Empreinte des règles qui influencent le contenu de l'index"""
+    payload = json.dumps({
+        'ignored': sorted(IGNORED_DIRS),
+        'skip': sorted(SKIP_EXTS),
+        'protected': PROTECTED_KEYWORDS,
+        'categories': {cat: sorted(exts) for cat, exts in CATEGORIES.items()},
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+class ScanIndex:
+    """Index SQLite des fichiers scannés (chemin, taille, mtime, inode, catégorie, protection).
+
+    Un dossier dont le mtime n'a pas bougé depuis le dernier passage n'est ni
+    relisté ni re-stat : ses fichiers et sous-dossiers sont relus depuis l'index.
+    Le mtime d'un dossier change quand une entrée est ajoutée, supprimée ou
+    renommée, mais pas quand le contenu d'un fichier existant est modifié :
+    les seuls fichiers re-stat sont alors ceux qui passent le filtre des
+    candidats (``full=True`` force un re-stat complet).
+    """
+
+    COMMIT_EVERY = 200  # dossiers entre deux commits
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime REAL NOT NULL,
+                file_count INTEGER NOT NULL,
+                scanned_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                inode INTEGER,
+                ext TEXT,
+                category TEXT,
+                protected INTEGER NOT NULL DEFAULT 0,
+                keyword TEXT
+            );
+            CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+        """)
+        self._conn.commit()
+
+    def ensure_signature(self, signature: str) -> bool:
+        """Vide l'index si les règles ont changé. Retourne True si l'index a été vidé."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'rules'").fetchone()
+            if row and row[0] == signature:
+                return False
+            self._conn.execute('DELETE FROM files')
+            self._conn.execute('DELETE FROM dirs')
+            self._conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('rules', ?)", (signature,))
+            self._conn.commit()
+            return row is not None
+
+    def get_dir(self, path: str) -> Optional[Tuple[float, int]]:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT mtime, file_count FROM dirs WHERE path = ?', (path,)
+            ).fetchone()
+
+    def subdirs(self, path: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute('SELECT path FROM dirs WHERE parent = ?', (path,)).fetchall()
+        return [r[0] for r in rows]
+
+    def files_in(self, path: str) -> List[Tuple]:
+        """Lignes (name, size, mtime, inode, ext, category, protected, keyword) d'un dossier"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT name, size, mtime, inode, ext, category, protected, keyword '
+                'FROM files WHERE dir = ?', (path,)
+            ).fetchall()
+
+    def _purge_tree(self, path: str):
+        prefix = path.rstrip(os.sep) + os.sep
+        self._conn.execute('DELETE FROM files WHERE dir = ? OR substr(dir, 1, ?) = ?',
+                           (path, len(prefix), prefix))
+        self._conn.execute('DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?',
+                           (path, len(prefix), prefix))
+
+    def replace_dir(self, path: str, parent: Optional[str], mtime: float, file_count: int,
+                    rows: List[Tuple], subdirs: List[str]):
+        """Remplace le contenu indexé d'un dossier et purge les sous-dossiers disparus"""
+        with self._lock:
+            known = {r[0] for r in self._conn.execute('SELECT path FROM dirs WHERE parent = ?', (path,))}
+            for gone in known - set(subdirs):
+                self._purge_tree(gone)
+            self._conn.execute('DELETE FROM files WHERE dir = ?', (path,))
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO files(path, dir, name, size, mtime, inode, ext, category, protected, keyword) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(os.path.join(path, r[0]), path) + tuple(r) for r in rows]
+            )
+            self._conn.execute(
+                'INSERT OR REPLACE INTO dirs(path, parent, mtime, file_count, scanned_at) VALUES (?, ?, ?, ?, ?)',
+                (path, parent, mtime, file_count, time.time())
+            )
+            self._pending += 1
+            if self._pending >= self.COMMIT_EVERY:
+                self._conn.commit()
+                self._pending = 0
+
+    def update_files(self, path: str, rows: List[Tuple]):
+        """Met à jour des fichiers re-stat d'un dossier inchangé (mêmes colonnes que files_in)"""
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO files(path, dir, name, size, mtime, inode, ext, category, protected, keyword) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(os.path.join(path, r[0]), path) + tuple(r) for r in rows]
+            )
+
+    def forget_dir(self, path: str):
+        """Retire un dossier (et son sous-arbre) de l'index"""
+        with self._lock:
+            self._purge_tree(path)
+
+    def forget_files(self, paths):
+        """Retire des fichiers supprimés de l'index"""
+        with self._lock:
+            self._conn.executemany('DELETE FROM files WHERE path = ?', [(str(p),) for p in paths])
+            self._conn.commit()
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+_scan_index: Optional[ScanIndex] = None
+_scan_index_lock = threading.Lock()
+
+def get_scan_index() -> ScanIndex:
+    """Index partagé, ouvert à la première utilisation"""
+    global _scan_index
+    with _scan_index_lock:
+        if _scan_index is None:
+            _scan_index = ScanIndex(INDEX_DB_PATH)
+        return _scan_index
+
+def _list_directory(dir_path: str, classifier: FileClassifier, cancel_event=None,
+                    timings: Optional[Dict[str, float]] = None) -> Tuple[int, List[Tuple], List[str], List[str]]:
+    """Liste et stat un dossier modifié. Retourne (nb_fichiers, lignes, sous-dossiers, erreurs)
+
+    Les informations de type viennent du DirEntry (d_type, sans appel système) ;
+    ``entry.stat()`` est mis en cache par l'entrée et n'est fait qu'une fois.
+    ``timings['classify']`` (dict optionnel) reçoit le temps passé à classer les noms.
+    """
+    file_count = 0
+    classify_time = 0.0
+    pruned = 0
+    rows = []
+    subdirs = []
+    errors = []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            name = entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                # Comme os.walk : les liens vers des dossiers ne sont pas suivis
+                if name.lower() not in IGNORED_DIRS and not entry.is_symlink():
+                    subdirs.append(entry.path)
+                else:
+                    pruned += 1
+                continue
+
+            file_count += 1
+            ext = os.path.splitext(name)[1].lower()
+            if ext in SKIP_EXTS:
+                continue
+            try:
+                st = entry.stat()
+                classify_started = time.perf_counter()
+                info = classifier.classify(name, ext)
+                classify_time += time.perf_counter() - classify_started
+                rows.append((name, st.st_size, st.st_mtime, st.st_ino, ext,
+                             info.category, int(info.protected), info.keyword))
+            except Exception as e:
+                errors.append(f'{name}: {e}')
+    # Une mise à jour par dossier, pas par fichier
+    if pruned:
+        scan_dirs_pruned_total.inc(pruned)
+    if errors:
+        scan_stat_errors_total.inc(len(errors))
+    if timings is not None:
+        timings['classify'] = timings.get('classify', 0.0) + classify_time
+    return file_count, rows, subdirs, errors
+
+def _merge_counters(counters: List[Dict[str, int]]) -> Dict[str, int]:
+    merged = defaultdict(int)
+    for c in counters:
+        for key, value in list(c.items()):
+            merged[key] += value
+    return dict(merged)
+
+def scan_directory(path, min_age, min_size, cancel_event, allowed_categories, index=None, full=False,
+                   workers=None, on_candidates=None, events=None, trace=None, max_parallel=None):
+    """Scan incrémental et parallèle de répertoire appuyé sur l'index persistant
+
+    Chaque dossier est une tâche indépendante : un pool de ``workers`` threads
+    liste/stat les dossiers et renvoie leurs sous-dossiers, qui sont à leur tour
+    soumis au pool. Chaque thread tient ses propres compteurs, fusionnés à la fin.
+    La progression et les logs passent par un EventAggregator (fréquence bornée).
+    Les durées par phase (walk, classify, emit) vont dans ``trace`` (TaskTrace).
+    ``max_parallel`` (fonction) borne les dossiers en cours : part du budget de
+    workers du job, relue à chaque soumission. Candidats et fichiers protégés sont
+    retournés en CandidateStore ; ``on_candidates`` reçoit des dicts.
+    """
+    index = index or get_scan_index()
+    index.ensure_signature(_rules_signature())
+    classifier = refresh_classifier()
+    workers = max(1, int(workers or SCAN_WORKERS))
+
+    min_size_bytes = min_size * 1024 * 1024
+    now = time.time()
+    started = time.monotonic()
+
+    trace = trace or current_trace() or TaskTrace('scan')
+    worker_local = threading.local()
+    worker_counters: List[Dict[str, int]] = []
+    counters_lock = threading.Lock()
+
+    def visit(dir_path: str, parent: Optional[str]):
+        counters = getattr(worker_local, 'counters', None)
+        if counters is None:
+            counters = worker_local.counters = defaultdict(int)
+            with counters_lock:
+                worker_counters.append(counters)
+
+        candidates, protected_files, logs = [], [], []
+        timings = {}
+        walk_started = time.perf_counter()
+        try:
+            dir_mtime = os.stat(dir_path).st_mtime
+        except OSError as e:
+            index.forget_dir(dir_path)
+            scan_stat_errors_total.inc()
+            logs.append(f'{os.path.basename(dir_path)}: {e}')
+            return [], candidates, protected_files, logs
+
+        cached = None if full else index.get_dir(dir_path)
+        reused = bool(cached and cached[0] == dir_mtime)
+        if reused:
+            file_count = cached[1]
+            rows = index.files_in(dir_path)
+            subdirs = index.subdirs(dir_path)
+            counters['reused_dirs'] += 1
+            scan_dirs_total.inc(1, 'index')
+        else:
+            try:
+                file_count, rows, subdirs, errors = _list_directory(dir_path, classifier, cancel_event, timings)
+            except OSError as e:
+                if parent is None:
+                    raise
+                scan_stat_errors_total.inc()
+                logs.append(f'{os.path.basename(dir_path)}: {e}')
+                return [], candidates, protected_files, logs
+            logs.extend(errors)
+            if cancel_event.is_set():
+                # Listing partiel : ne pas l'enregistrer comme à jour
+                return [], candidates, protected_files, logs
+            index.replace_dir(dir_path, parent, dir_mtime, file_count, rows, subdirs)
+            counters['rescanned_dirs'] += 1
+            scan_dirs_total.inc(1, 'listed')
+
+        classify_started = time.perf_counter()
+        listing_classify = timings.get('classify', 0.0)
+        trace.add('walk', classify_started - walk_started - listing_classify)
+        counters['total_files'] += file_count
+        files_scanned_total.inc(file_count)
+        def eligible(size, age_days, category):
+            return size >= min_size_bytes and age_days >= min_age and category in allowed_categories
+
+        changed, gone = [], []
+        for name, size, mtime, inode, ext, category, protected_flag, keyword in rows:
+            age_days = int((now - mtime) // 86400)
+            if reused and not protected_flag and eligible(size, age_days, category):
+                # Fichier modifié sur place : le mtime du dossier n'a pas bougé, on re-stat le candidat
+                try:
+                    st = os.stat(os.path.join(dir_path, name))
+                except OSError:
+                    gone.append(os.path.join(dir_path, name))
+                    continue
+                if (st.st_size, st.st_mtime) != (size, mtime):
+                    size, mtime = st.st_size, st.st_mtime
+                    changed.append((name, size, mtime, st.st_ino, ext, category, protected_flag, keyword))
+                    age_days = int((now - mtime) // 86400)
+            # Tuple compact : rangé dans le CandidateStore par le thread principal
+            file_info = (name, size, age_days, ext, category)
+            if protected_flag:
+                protected_files.append((file_info, keyword))
+            elif eligible(size, age_days, category):
+                candidates.append(file_info)
+            counters['cat:' + category] += 1
+        if changed:
+            index.update_files(dir_path, changed)
+        if gone:
+            index.forget_files(gone)
+
+        trace.add('classify', listing_classify + time.perf_counter() - classify_started)
+        return subdirs, candidates, protected_files, logs
+
+    candidates = CandidateStore()
+    protected_files = CandidateStore()
+    trace_token = trace.attach()
+    own_events = events is None
+    if own_events:
+        events = EventAggregator().__enter__()
+
+    def progress_payload():
+        merged = _merge_counters(worker_counters)
+        return {
+            'total_files': merged.get('total_files', 0),
+            'candidates_count': len(candidates),
+            'stats': {k[4:]: v for k, v in merged.items() if k.startswith('cat:')}
+        }
+
+    root_path = os.path.abspath(str(path))
+    pending_dirs = [(root_path, None)]
+    in_flight = {}
+    max_in_flight = workers * 4
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+    try:
+        while pending_dirs or in_flight:
+            if cancel_event.is_set():
+                break
+            limit = min(max_in_flight, max_parallel()) if max_parallel else max_in_flight
+            while pending_dirs and len(in_flight) < limit:
+                dir_path, parent = pending_dirs.pop()
+                in_flight[executor.submit(trace.run, visit, dir_path, parent)] = dir_path
+
+            done, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_path = in_flight.pop(future)
+                subdirs, found, protected_part, logs = future.result()
+                start = len(candidates)
+                candidates.add_rows(dir_path, found)
+                if found and on_candidates:
+                    on_candidates(candidates[start:])
+                for file_info, keyword in protected_part:
+                    protected_files.add_rows(dir_path, (file_info,))
+                    events.log(f'🛡️ Protégé: {file_info[0]} ({keyword})', 'info')
+                for err in logs:
+                    events.log(f'❌ Erreur {err}', 'warn')
+                pending_dirs.extend((d, dir_path) for d in reversed(subdirs))
+
+            # Mise à jour de progression (calculée seulement à l'émission)
+            if done:
+                events.update('scan_update', progress_payload)
+
+    except Exception as e:
+        events.log(f'❌ Erreur scan répertoire: {e}', 'error')
+        raise
+    finally:
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown(wait=True)
+        index.commit()
+        if own_events:
+            events.close()
+        trace.detach(trace_token)
+
+    merged = _merge_counters(worker_counters)
+    total = merged.get('total_files', 0)
+    elapsed = time.monotonic() - started
+    if elapsed > 0 and not cancel_event.is_set():
+        scan_files_per_second.set(round(total / elapsed, 1))
+    return {
+        'total_files': total,
+        'stats': {k[4:]: v for k, v in merged.items() if k.startswith('cat:')},
+        'candidates': candidates,
+        'protected': protected_files,
+        'reused_dirs': merged.get('reused_dirs', 0),
+        'rescanned_dirs': merged.get('rescanned_dirs', 0),
+        'workers': workers,
+        'elapsed': round(elapsed, 3),
+        'files_per_sec': round(total / elapsed, 1) if elapsed > 0 else 0.0,
+        'spans': trace.spans()
+    }
+
+def _decision_source(analysis: Dict) -> str:
+    """Origine d'une décision pour les métriques : règle, LLM, cache de verdicts ou repli"""
+    if analysis.get('rule'):
+        return 'rule'
+    if 'time_to_verdict_ms' in analysis:
+        return 'llm'
+    if analysis.get('importance') == 'unknown':
+        return 'fallback'
+    return 'cache'
+
+def _make_record(candidate: Dict, analysis: Dict) -> Dict:
+    return {
+        'file': candidate['path'],
+        'name': candidate['name'],
+        'size': candidate['size'],
+        'size_h': human_size(candidate['size']),
+        'age_days': candidate['age'],
+        'category': candidate['category'],
+        'decision': _decision(analysis),
+        'reason': analysis.get('reason', 'N/A'),
+        'importance': analysis.get('importance', 'unknown'),
+        'rule': analysis.get('rule'),
+        'time_to_verdict_ms': analysis.get('time_to_verdict_ms'),
+        'prompt_eval_ms': analysis.get('prompt_eval_ms')
+    }
+
+class CandidateQueue:
+    """File bornée entre le scan (producteur) et l'analyse (consommateur).
+
+    ``put`` bloque quand la file est pleine : le parcours ralentit au rythme de
+    l'analyse et la mémoire en transit reste bornée. Les deux côtés abandonnent
+    dès qu'un des ``cancel_events`` est levé.
+    """
+
+    _END = object()
+
+    def __init__(self, maxsize: int = 0, cancel_events: Tuple[threading.Event, ...] = ()):
+        self._queue = queue.Queue(maxsize=max(0, maxsize))
+        self._cancel_events = cancel_events
+        self._finished = False
+
+    @property
+    def cancelled(self) -> bool:
+        return any(event.is_set() for event in self._cancel_events)
+
+    def _put(self, item) -> bool:
+        while not self.cancelled:
+            try:
+                self._queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def put(self, items: List[Dict]):
+        for item in items:
+            if not self._put(item):
+                return
+
+    def close(self):
+        self._put(self._END)
+
+    def take(self, max_items: int, timeout: float = 0) -> Tuple[List[Dict], bool]:
+        """Jusqu'à ``max_items`` candidats (attente max ``timeout`` pour le premier) et fin de flux"""
+        items = []
+        if self._finished:
+            return items, True
+        try:
+            item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            while True:
+                if item is self._END:
+                    self._finished = True
+                    break
+                items.append(item)
+                if len(items) >= max_items:
+                    break
+                item = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        return items, self._finished
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+def _analysis_priority(candidate: Dict) -> float:
+    """Octets récupérables attendus par unité de coût d'analyse (plus grand = analysé plus tôt)
+
+    La probabilité de suppression croît avec l'âge ; les formats dont l'aperçu
+    demande un parsing (PDF, documents zip) coûtent plus cher à analyser.
+    """
+    likelihood = min(1.0, 0.2 + candidate.get('age', 0) / 730)
+    cost = 2.0 if candidate.get('ext') in ISOLATED_PREVIEW_EXTENSIONS else 1.0
+    return candidate.get('size', 0) * likelihood / cost
+
+def analyze_batch(candidates, model="llama3:8b", concurrency=None, batch_size=None, on_results=None,
+                  events=None, order=None, time_budget=None, llm_budget=None, report=None, trace=None,
+                  cancel_event=None, max_parallel=None):
+    """Analyse concurrente : jusqu'à ``concurrency`` requêtes en vol à la fois.
+
+    ``candidates`` est une liste ou une CandidateQueue alimentée pendant le scan
+    (mode pipeline). Les règles déclaratives passent d'abord sur les candidats
+    reçus (toute la liste d'un coup hors pipeline) : seuls les fichiers qu'elles
+    ne tranchent pas vont au LLM, par ordre de priorité (``order="priority"`` :
+    octets récupérables attendus par coût, voir _analysis_priority ; ``"scan"`` :
+    ordre du parcours). Avec ``batch_size`` > 1, chaque tâche regroupe plusieurs
+    fichiers dans une même requête (voir analyze_group_batched).
+
+    ``time_budget`` (secondes) et ``llm_budget`` (requêtes Ollama) arrêtent
+    proprement la soumission : les requêtes en vol se terminent. ``max_parallel``
+    (fonction) abaisse ``concurrency`` à la part de workers du job. ``report``
+    (dict optionnel) reçoit la couverture en octets, le budget épuisé et les
+    durées par phase de ``trace`` (TaskTrace : classify, extract, infer, parse,
+    emit). Les résultats (ResultStore, adossé aux candidats) sont rangés dans l'ordre
+    des candidats. À l'annulation (``cancel_event``), plus rien n'est soumis et les
+    requêtes déjà parties sont abandonnées.
+    """
+    refresh_classifier()
+    rules = refresh_rules()
+    concurrency = max(1, int(concurrency or OLLAMA_CONCURRENCY))
+    batch_size = max(1, int(batch_size or ANALYSIS_BATCH_SIZE))
+    by_priority = (order or ANALYSIS_ORDER) == 'priority'
+    deadline = time.monotonic() + time_budget if time_budget else None
+    pipeline = isinstance(candidates, CandidateQueue)
+    source = candidates if pipeline else CandidateQueue()
+    # Hors pipeline, les candidats déjà en colonnes (store d'un job) sont lus sur place
+    received = CandidateStore() if pipeline else CandidateStore.of(candidates)
+    results = ResultStore(received)
+    name_of, size_of = received.column('name'), received.column('size')
+    path_of, ext_of = received.column('path'), received.column('ext')
+    decision_of = results.column('decision')
+    pending: List[Tuple[float, int]] = []  # tas (-priorité, indice) des fichiers en attente du LLM
+    ready = deque()  # prochains fichiers sortis du tas, dans l'ordre (préchargés)
+    exhausted = not pipeline
+    analyzed = 0
+    coverage = {'files': 0, 'bytes': 0, 'files_total': 0, 'bytes_total': 0}
+    report = {} if report is None else report
+    report['budget_exhausted'] = None
+    cancel_event = cancel_event or threading.Event()
+    trace = trace or current_trace() or TaskTrace('analyze')
+    trace_token = trace.attach()
+    # Compteurs de la tâche (et non du processus) : un autre job en parallèle ne s'y mêle pas
+    usage_at_start = trace.usage()
+
+    def llm_calls() -> int:
+        return trace.usage().get('llm_calls', 0) - usage_at_start.get('llm_calls', 0)
+    latency_marks = {name: trace.latency(name).mark() for name in ('verdict', 'prompt_eval')}
+    
+    own_events = events is None
+    if own_events:
+        events = EventAggregator().__enter__()
+    
+    # Vérification Ollama au début
+    ollama_ok = ollama_health.is_available()
+    if not ollama_ok:
+        events.log('⚠️ Ollama non disponible - Utilisation des règles automatiques', 'warn')
+
+    def cancelled():
+        return cancel_event.is_set() or source.cancelled
+
+    def capacity() -> int:
+        return max(1, min(concurrency, max_parallel())) if max_parallel else concurrency
 
-def scan_directory(path, min_age, min_size, cancel_event, allowed_categories):
-    """Scan de répertoire avec gestion d'erreurs améliorée"""
-    candidates = []
-    protected_files = []
-    stats = defaultdict(int)
-    total = 0
-    min_size_bytes = min_size * 1024 * 1024
+    def budget_exhausted():
+        if deadline is not None and time.monotonic() >= deadline:
+            return 'time'
+        # Chaque tâche en vol fera au moins une requête
+        if llm_budget and llm_calls() + len(in_flight) >= llm_budget:
+            return 'llm'
+        return None
 
-    try:
-        for root, dirs, files in os.walk(path):
-            if cancel_event.is_set(): 
+    def record(i, analysis):
+        nonlocal analyzed
+        k = results.add(i, analysis)
+        decisions_total.inc(1, _decision_source(analysis), decision_of(k))
+        if on_results:
+            on_results([results[k]])
+        analyzed += 1
+        coverage['files'] += 1
+        coverage['bytes'] += size_of(i)
+        events.update('analyze_update', {
+            'analyzed_files': analyzed,
+            'total_candidates': len(received),
+            'queued': source.qsize(),
+            'source_complete': exhausted,
+            'bytes_covered': coverage['bytes'],
+            'bytes_total': coverage['bytes_total'],
+            'current_file': name_of(i)
+        })
+
+    def waiting() -> int:
+        return len(pending) + len(ready)
+
+    def admit(items, start):
+        # Passe des règles en bloc, avant tout appel LLM (sans aperçu : les règles
+        # qui en dépendent sont réévaluées après extraction)
+        decided = []
+        with span('classify'):
+            for i, candidate in enumerate(items, start):
+                coverage['files_total'] += 1
+                coverage['bytes_total'] += candidate.get('size', 0)
+                decision = rules.decide(candidate)
+                if decision:
+                    decided.append((i, decision))
+                else:
+                    heapq.heappush(pending, (-_analysis_priority(candidate) if by_priority else i, i))
+        for i, decision in decided:
+            record(i, decision)
+
+    def receive(target, timeout=0):
+        # Tire de la source jusqu'à avoir ``target`` fichiers en attente du LLM (sans attendre si timeout=0)
+        nonlocal exhausted
+        while not exhausted and waiting() < target:
+            items, exhausted = source.take(target - waiting(), timeout)
+            if not items:
                 break
-            
-            # Filtrage des dossiers ignorés
-            dirs[:] = [d for d in dirs if d.lower() not in IGNORED_DIRS]
+            start = len(received)
+            received.extend(items)
+            admit(items, start)
 
-            for name in files:
-                if cancel_event.is_set(): 
+    def take_ready(count):
+        while len(ready) < count and pending:
+            ready.append(heapq.heappop(pending)[1])
+
+    def analyze_unit(indices):
+        if cancelled():
+            return []
+        if len(indices) == 1:
+            return [(indices[0], analyze_file_with_fallback(received[indices[0]], model, events=events))]
+        return list(zip(indices, analyze_group_batched([received[i] for i in indices], model,
+                                                       events=events)))
+
+    def prefetch_ahead():
+        # L'extraction des fichiers N+1..N+k chevauche la requête Ollama du fichier N
+        depth = preview_extractor.prefetch_depth
+        receive(depth)
+        take_ready(depth)
+        for i in itertools.islice(ready, depth):
+            preview_extractor.prefetch(path_of(i), ext_of(i))
+
+    if not pipeline:
+        admit(received, 0)
+    in_flight = {}
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='analyze')
+    try:
+        while True:
+            while len(in_flight) < capacity() and not cancelled():
+                report['budget_exhausted'] = budget_exhausted()
+                if report['budget_exhausted']:
                     break
-                
-                total += 1
-                file_path = Path(root) / name
-                
-                ext = file_path.suffix.lower()
-                if ext in SKIP_EXTS: 
-                    continue
+                # Sans requête en vol, on attend un peu les candidats du scan
+                receive(batch_size, timeout=0 if in_flight else 0.2)
+                # Lot incomplet : on attend la suite du scan tant que d'autres requêtes tournent
+                if not waiting() or (waiting() < batch_size and in_flight and not exhausted):
+                    break
+                take_ready(batch_size)
+                indices = [ready.popleft() for _ in range(min(batch_size, len(ready)))]
+                in_flight[executor.submit(trace.run, analyze_unit, indices)] = indices
+                prefetch_ahead()
+
+            if cancelled() or (not in_flight and (report['budget_exhausted'] or (exhausted and not waiting()))):
+                break
+            if not in_flight:
+                continue
 
+            queue_depth.set(source.qsize(), 'pipeline')
+            queue_depth.set(waiting(), 'analysis_pending')
+            queue_depth.set(len(in_flight), 'analysis_in_flight')
+            done, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                indices = in_flight.pop(future)
                 try:
-                    stat = file_path.stat()
-                    size = stat.st_size
-                    mtime = stat.st_mtime
-                    age_days = (datetime.now() - datetime.fromtimestamp(mtime)).days
-                    category = get_category(ext)
-                    
-                    is_protected_flag, keyword = is_protected(name)
-                    
-                    file_info = {
-                        'path': str(file_path),
-                        'name': name,
-                        'size': size,
-                        'age': age_days,
-                        'ext': ext,
-                        'category': category
-                    }
-                    
-                    if is_protected_flag:
-                        protected_files.append(file_info)
-                        socketio.emit('log', {'msg': f'🛡️ Protégé: {name} ({keyword})', 'type': 'info'})
-                    elif size >= min_size_bytes and age_days >= min_age and category in allowed_categories:
-                        candidates.append(file_info)
-
-                    stats[category] += 1
-
-                    # Mise à jour de progression
-                    if total % 50 == 0:
-                        socketio.emit('scan_update', {
-                            'total_files': total,
-                            'candidates_count': len(candidates),
-                            'stats': dict(stats)
-                        })
-                        
+                    unit_results = future.result()
                 except Exception as e:
-                    socketio.emit('log', {'msg': f'❌ Erreur {name}: {e}', 'type': 'warn'})
+                    names = ', '.join(name_of(i) for i in indices)
+                    events.log(f'❌ Erreur analyse {names}: {e}', 'error')
                     continue
-                    
-    except Exception as e:
-        socketio.emit('log', {'msg': f'❌ Erreur scan répertoire: {e}', 'type': 'error'})
-        raise
+                for i, analysis in unit_results:
+                    if analysis:
+                        record(i, analysis)
+
+        if report['budget_exhausted'] and not cancelled():
+            label = 'temps' if report['budget_exhausted'] == 'time' else 'requêtes IA'
+            events.log(f'⏳ Budget {label} épuisé : {waiting()} fichiers non analysés', 'warn')
+    finally:
+        executor.shutdown(wait=not cancelled(), cancel_futures=True)
+        preview_extractor.discard_pending()
+        for name in ('pipeline', 'analysis_pending', 'analysis_in_flight'):
+            queue_depth.set(0, name)
+        if own_events:
+            events.close()
+        trace.detach(trace_token)
+
+    report['coverage'] = dict(
+        coverage,
+        ratio=round(coverage['bytes'] / coverage['bytes_total'], 4) if coverage['bytes_total'] else 1.0
+    )
+    report['llm_calls'] = llm_calls()
+    report['spans'] = trace.spans()
+    usage = {key: count - usage_at_start.get(key, 0) for key, count in trace.usage().items()}
+    report['cache'] = {key: usage.get('cache:' + key, 0) for key in ('hits', 'misses')}
+    report['extraction'] = {key: usage.get('extraction:' + key, 0) for key in EXTRACTION_STATS}
+    report['rules'] = {key[5:]: count for key, count in usage.items() if key.startswith('rule:') and count}
+    report['time_to_verdict'] = trace.latency('verdict').summary(latency_marks['verdict'])
+    report['prompt_eval'] = trace.latency('prompt_eval').summary(latency_marks['prompt_eval'])
     
+    results.sort_by_row()
+    return results
+
+# ============================================================================
+# Détection des doublons
+# ============================================================================
+
+DUPLICATE_EDGE_BLOCK = 4096
+DUPLICATE_READ_BUFFER = 1024 * 1024
+
+def _edge_hash(path: str, size: int) -> Optional[str]:
+    """Hash des premiers et derniers blocs (couvre tout le fichier s'il est petit)"""
+    try:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            digest.update(f.read(DUPLICATE_EDGE_BLOCK))
+            if size > DUPLICATE_EDGE_BLOCK:
+                f.seek(max(DUPLICATE_EDGE_BLOCK, size - DUPLICATE_EDGE_BLOCK))
+                digest.update(f.read(DUPLICATE_EDGE_BLOCK))
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+def _full_hash(path: str) -> Optional[str]:
+    """Hash du contenu complet, lu par blocs de 1MB dans un tampon réutilisé"""
+    try:
+        digest = hashlib.blake2b(digest_size=32)
+        buffer = bytearray(DUPLICATE_READ_BUFFER)
+        view = memoryview(buffer)
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                digest.update(view[:n])
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+def _hash_stage(groups: Dict, hash_fn, cancel_event, workers: int, stage: str, progress=None) -> Dict:
+    """Affine des groupes {clé: [(chemin, taille)]} avec hash_fn, en parallèle"""
+    items = [(key, path, size) for key, members in groups.items() for path, size in members]
+    refined = defaultdict(list)
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dupes') as executor:
+        futures = {executor.submit(hash_fn, path, size): (key, path, size) for key, path, size in items}
+        try:
+            for future in as_completed(futures):
+                if cancel_event.is_set():
+                    break
+                key, path, size = futures[future]
+                digest = future.result()
+                if digest is not None:
+                    refined[(key[0], digest)].append((path, size))
+                done += 1
+                if progress and done % 200 == 0:
+                    progress(stage, done, len(items))
+        finally:
+            for future in futures:
+                future.cancel()
+    if progress:
+        progress(stage, done, len(items))
+    return {key: members for key, members in refined.items() if len(members) > 1}
+
+def find_duplicates(files: List[Dict], cancel_event, workers: Optional[int] = None, progress=None) -> Dict:
+    """Doublons exacts par étapes : taille, puis premiers/derniers blocs, puis contenu complet.
+
+    Les fichiers de taille unique ne sont jamais ouverts ; seuls les survivants
+    de l'étape précédente sont relus. Les fichiers vides sont ignorés.
+    """
+    workers = max(1, int(workers or DUPLICATE_WORKERS))
+    started = time.monotonic()
+
+    # Regroupement par taille sur les indices : chemins construits pour les seuls groupes > 1
+    size_of, path_of = column_of(files, 'size'), column_of(files, 'path')
+    by_size = defaultdict(list)
+    for i in range(len(files)):
+        if size_of(i) > 0:
+            by_size[size_of(i)].append(i)
+    size_groups = {(size,): [(path_of(i), size) for i in rows] for size, rows in by_size.items() if len(rows) > 1}
+    size_matched = sum(len(m) for m in size_groups.values())
+
+    groups = _hash_stage(size_groups, _edge_hash, cancel_event, workers, 'edges', progress)
+    edge_matched = sum(len(m) for m in groups.values())
+
+    # Au-delà de deux blocs, le hash des extrémités ne couvre pas tout le contenu
+    small = {key: m for key, m in groups.items() if key[0] <= 2 * DUPLICATE_EDGE_BLOCK}
+    large = {key: m for key, m in groups.items() if key[0] > 2 * DUPLICATE_EDGE_BLOCK}
+    full_hashed = sum(len(m) for m in large.values())
+    if cancel_event.is_set():
+        large = {}  # extrémités identiques seulement : pas encore des doublons prouvés
+    else:
+        large = _hash_stage(large, lambda path, size: _full_hash(path), cancel_event, workers, 'content', progress)
+
+    result_groups = []
+    for (key, digest), members in list(small.items()) + list(large.items()):
+        size = members[0][1]
+        result_groups.append({
+            'hash': digest,
+            'size': size,
+            'size_h': human_size(size),
+            'files': sorted(path for path, _ in members),
+            'wasted': size * (len(members) - 1)
+        })
+    result_groups.sort(key=lambda g: g['wasted'], reverse=True)
+
     return {
-        'total_files': total,
-        'stats': dict(stats),
-        'candidates': candidates,
-        'protected': protected_files
+        'groups': result_groups,
+        'files_considered': len(files),
+        'size_matched': size_matched,
+        'edge_matched': edge_matched,
+        'full_hashed': full_hashed,
+        'wasted': sum(g['wasted'] for g in result_groups),
+        'cancelled': cancel_event.is_set(),
+        'elapsed': round(time.monotonic() - started, 3)
     }
 
-def analyze_batch(candidates, model="llama3:8b"):
-    """Analyse par lot avec gestion d'erreurs"""
-    results = []
-    
-    # Vérification Ollama au début
-    ollama_ok = check_ollama_availability()
-    if not ollama_ok:
-        socketio.emit('log', {'msg': '⚠️ Ollama non disponible - Utilisation des règles automatiques', 'type': 'warn'})
-    
-    for i, candidate in enumerate(candidates):
-        if analyze_cancel_event.is_set():
+def _delete_chunk(paths: List[str], classifier, cancel_event, remove) -> Dict:
+    """Supprime un paquet de fichiers (un worker) ; l'absence se détecte à l'unlink, sans stat préalable"""
+    outcome = {'deleted': [], 'protected': [], 'missing': [], 'errors': [], 'bytes': 0}
+    for path in paths:
+        if cancel_event.is_set():
             break
-        
-        try:
-            analysis = analyze_file_with_fallback(candidate, model)
-            if analysis:
-                decision = 'DELETE' if analysis.get('can_delete') else 'KEEP'
-                if analysis.get('importance') == 'unknown':
-                    decision = 'REVIEW'
-                
-                record = {
-                    'file': candidate['path'],
-                    'name': candidate['name'],
-                    'size': candidate['size'],
-                    'size_h': human_size(candidate['size']),
-                    'age_days': candidate['age'],
-                    'category': candidate['category'],
-                    'decision': decision,
-                    'reason': analysis.get('reason', 'N/A'),
-                    'importance': analysis.get('importance', 'unknown')
-                }
-                results.append(record)
-                
-                state['analyzed_files'] = i + 1
-                socketio.emit('analyze_update', {
-                    'analyzed_files': state['analyzed_files'],
-                    'total_candidates': len(candidates),
-                    'current_file': candidate['name']
-                })
-                
-        except Exception as e:
-            socketio.emit('log', {'msg': f'❌ Erreur analyse {candidate["name"]}: {e}', 'type': 'error'})
+        if classifier.classify(os.path.basename(path)).protected:
+            outcome['protected'].append(path)
             continue
-    
-    return results
+        try:
+            size = os.lstat(path).st_size
+            remove(path)
+            outcome['deleted'].append(path)
+            outcome['bytes'] += size
+        except FileNotFoundError:
+            outcome['missing'].append(path)
+        except OSError as e:
+            outcome['errors'].append((path, str(e)))
+    return outcome
 
-def remove_empty_folders(path):
-    """Supprime les dossiers vides"""
-    deleted_count = 0
-    if not os.path.isdir(path): 
-        return 0
-    
-    try:
-        for root, dirs, files in os.walk(path, topdown=False):
-            for name in dirs:
-                try:
-                    folder_path = os.path.join(root, name)
-                    if not os.listdir(folder_path):
-                        os.rmdir(folder_path)
-                        deleted_count += 1
-                except Exception:
-                    continue
-    except Exception as e:
-        print(f"Erreur nettoyage dossiers: {e}")
-        
-    return deleted_count
+def delete_files(paths: List[str], cancel_event, workers: Optional[int] = None,
+                 on_deleted=None, progress=None, remove=os.unlink) -> Dict:
+    """Suppression parallèle par paquets : ``on_deleted(paths)`` reçoit chaque paquet supprimé,
+    ``progress(done, total)`` l'avancement. Les fichiers protégés ne sont jamais touchés.
+    ``remove`` retire un fichier (os.unlink, ou Quarantine.add pour une suppression réversible).
+    """
+    workers = max(1, int(workers or DELETE_WORKERS))
+    classifier = refresh_classifier()
+    total = len(paths)
+    summary = {'deleted': [], 'protected': [], 'missing': [], 'errors': [], 'bytes': 0}
+    chunk_size = max(1, min(DELETE_CHUNK_SIZE, -(-total // workers)))
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='delete') as pool:
+        futures = [pool.submit(_delete_chunk, paths[i:i + chunk_size], classifier, cancel_event, remove)
+                   for i in range(0, total, chunk_size)]
+        for future in as_completed(futures):
+            outcome = future.result()
+            summary['bytes'] += outcome.pop('bytes')
+            for key in outcome:
+                summary[key].extend(outcome[key])
+            done += sum(len(outcome[key]) for key in outcome)
+            if on_deleted and outcome['deleted']:
+                on_deleted(outcome['deleted'])
+            if progress:
+                progress(done, total)
+    summary['cancelled'] = cancel_event.is_set()
+    return summary
+
+def remove_empty_parents(deleted_paths: List[str], root) -> int:
+    """Supprime les dossiers devenus vides, en ne visitant que les ancêtres des fichiers supprimés.
+
+    Les dossiers sont essayés du plus profond au moins profond, jusqu'à ``root``
+    exclu ; rmdir échoue de lui-même sur un dossier non vide (pas de listdir),
+    et un échec rend inutile l'essai de ses propres ancêtres.
+    """
+    root = os.path.abspath(root)
+    prefix = os.path.join(root, '')
+    candidates = set()
+    for path in deleted_paths:
+        folder = os.path.dirname(os.path.abspath(path))
+        while folder.startswith(prefix) and folder not in candidates:
+            candidates.add(folder)
+            folder = os.path.dirname(folder)
+
+    removed = 0
+    kept = set()
+    for folder in sorted(candidates, key=lambda f: f.count(os.sep), reverse=True):
+        if folder not in kept:
+            try:
+                os.rmdir(folder)
+                removed += 1
+                continue
+            except OSError:
+                pass
+        kept.add(os.path.dirname(folder))
+    return removed
 
 def run_native_picker() -> Optional[str]:
     """Sélecteur de dossier natif multi-plateforme"""
@@ -590,6 +3594,436 @@ sys.exit(1)
         print(f"Erreur sélecteur natif: {e}")
         return None
 
+# ============================================================================
+# Quarantaine (suppression différée et réversible)
+# ============================================================================
+
+class Quarantine:
+    """Mise en quarantaine par rename sur le même système de fichiers, avec manifeste SQLite.
+
+    Chaque périphérique a son propre dossier de quarantaine (le plus haut dossier
+    inscriptible du périphérique) : déplacer et restaurer un fichier ne touche
+    que les métadonnées. Un fichier sans dossier utilisable sur son périphérique
+    (ou un rename refusé en EXDEV) est copié dans ``default_dir``. La place
+    n'est récupérée qu'à la purge, sous un budget d'I/O.
+    """
+
+    def __init__(self, db_path, default_dir):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.default_dir = Path(default_dir)
+        self.default_dir.mkdir(parents=True, exist_ok=True)
+        self.renamed = 0
+        self.copied = 0
+        self._dirs: Dict[int, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self._purge_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id TEXT PRIMARY KEY,
+                original TEXT NOT NULL,
+                stored TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                quarantined_at REAL NOT NULL,
+                copied INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS entries_age ON entries(quarantined_at);
+            CREATE INDEX IF NOT EXISTS entries_original ON entries(original);
+        """)
+        self._conn.commit()
+
+    def _dir_for_device(self, path: str, device: int) -> Optional[str]:
+        """Dossier de quarantaine du périphérique (mis en cache), None si aucun n'est inscriptible"""
+        with self._lock:
+            if device in self._dirs:
+                return self._dirs[device]
+        if device == os.stat(self.default_dir).st_dev:
+            chosen = str(self.default_dir)
+        else:
+            # Ancêtres sur le même périphérique, du point de montage vers le fichier
+            ancestors = []
+            folder = os.path.dirname(os.path.abspath(path))
+            while True:
+                ancestors.append(folder)
+                parent = os.path.dirname(folder)
+                try:
+                    if parent == folder or os.stat(parent).st_dev != device:
+                        break
+                except OSError:
+                    break
+                folder = parent
+            chosen = None
+            for folder in reversed(ancestors):
+                candidate = os.path.join(folder, QUARANTINE_DIRNAME)
+                try:
+                    os.makedirs(candidate, exist_ok=True)
+                except OSError:
+                    continue
+                if os.access(candidate, os.W_OK) and os.stat(candidate).st_dev == device:
+                    chosen = candidate
+                    break
+        with self._lock:
+            self._dirs[device] = chosen
+        return chosen
+
+    def add(self, path: str) -> Dict:
+        """Met un fichier en quarantaine (FileNotFoundError s'il a disparu)"""
+        st = os.lstat(path)
+        entry_id = uuid.uuid4().hex
+        base = self._dir_for_device(path, st.st_dev)
+        name = f'{entry_id}-{os.path.basename(path)}'
+        stored = os.path.join(base or str(self.default_dir), entry_id[:2], name)
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        copied = False
+        try:
+            if base is None:
+                raise OSError(errno.EXDEV, 'aucun dossier de quarantaine sur ce périphérique')
+            os.rename(path, stored)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Repli inter-périphériques : copie vers la quarantaine par défaut puis unlink
+            stored = os.path.join(str(self.default_dir), entry_id[:2], name)
+            os.makedirs(os.path.dirname(stored), exist_ok=True)
+            shutil.move(path, stored)
+            copied = True
+        entry = {'id': entry_id, 'original': os.path.abspath(path), 'stored': stored,
+                 'size': st.st_size, 'quarantined_at': time.time(), 'copied': copied}
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO entries(id, original, stored, size, quarantined_at, copied) VALUES (?, ?, ?, ?, ?, ?)',
+                (entry_id, entry['original'], stored, st.st_size, entry['quarantined_at'], int(copied))
+            )
+            self._conn.commit()
+            if copied:
+                self.copied += 1
+            else:
+                self.renamed += 1
+        return entry
+
+    def entries(self, ids: Optional[List[str]] = None, originals: Optional[List[str]] = None,
+                offset: int = 0, limit: int = -1) -> List[Dict]:
+        """Entrées du manifeste, des plus récentes aux plus anciennes (ou filtrées par identifiant / chemin d'origine)"""
+        query = 'SELECT id, original, stored, size, quarantined_at, copied FROM entries'
+        with self._lock:
+            if ids is None and originals is None:
+                rows = self._conn.execute(query + ' ORDER BY quarantined_at DESC LIMIT ? OFFSET ?',
+                                          (limit, offset)).fetchall()
+            else:
+                rows = []
+                for column, values in (('id', ids or []), ('original', originals or [])):
+                    for start in range(0, len(values), 500):
+                        chunk = values[start:start + 500]
+                        rows.extend(self._conn.execute(
+                            f'{query} WHERE {column} IN ({",".join("?" * len(chunk))})', chunk
+                        ).fetchall())
+        return [{'id': r[0], 'original': r[1], 'stored': r[2], 'size': r[3],
+                 'quarantined_at': r[4], 'copied': bool(r[5])} for r in rows]
+
+    def _forget(self, entry_id: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM entries WHERE id = ?', (entry_id,))
+            self._conn.commit()
+
+    def restore(self, entries: List[Dict]) -> Dict:
+        """Remet les fichiers à leur emplacement d'origine (jamais par-dessus un fichier existant)"""
+        summary = {'restored': [], 'conflicts': [], 'missing': [], 'errors': []}
+        for entry in entries:
+            original = entry['original']
+            if os.path.lexists(original):
+                summary['conflicts'].append(original)
+                continue
+            try:
+                os.makedirs(os.path.dirname(original), exist_ok=True)
+                try:
+                    os.rename(entry['stored'], original)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.move(entry['stored'], original)
+            except FileNotFoundError:
+                self._forget(entry['id'])
+                summary['missing'].append(original)
+                continue
+            except OSError as e:
+                summary['errors'].append((original, str(e)))
+                continue
+            self._forget(entry['id'])
+            summary['restored'].append(original)
+        return summary
+
+    def purge(self, older_than: float = 0.0, cancel_event=None, budget_mbps: Optional[float] = None) -> Dict:
+        """Supprime définitivement les entrées plus vieilles que ``older_than`` secondes.
+
+        Le débit est limité à ``budget_mbps`` Mo/s (chaque fichier compte au moins
+        QUARANTINE_PURGE_MIN_COST pour ses métadonnées) ; 0 = sans limite.
+        """
+        budget = QUARANTINE_PURGE_MBPS if budget_mbps is None else budget_mbps
+        rate = budget * 1024 * 1024 if budget and budget > 0 else None
+        cutoff = time.time() - older_than
+        summary = {'purged': 0, 'bytes': 0, 'cancelled': False}
+        with self._purge_lock:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT id, stored, size FROM entries WHERE quarantined_at <= ? ORDER BY quarantined_at',
+                    (cutoff,)
+                ).fetchall()
+            started = time.monotonic()
+            spent = 0
+            for entry_id, stored, size in rows:
+                if cancel_event is not None and cancel_event.is_set():
+                    summary['cancelled'] = True
+                    break
+                try:
+                    os.unlink(stored)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Erreur purge quarantaine {stored}: {e}")
+                    continue
+                self._forget(entry_id)
+                try:
+                    os.rmdir(os.path.dirname(stored))
+                except OSError:
+                    pass
+                summary['purged'] += 1
+                summary['bytes'] += size
+                quarantine_purged_bytes_total.inc(size)
+                if rate:
+                    spent += max(size, QUARANTINE_PURGE_MIN_COST)
+                    delay = spent / rate - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+        return summary
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+            return {'entries': count, 'bytes': total, 'renamed': self.renamed, 'copied': self.copied}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_quarantine: Optional[Quarantine] = None
+_quarantine_lock = threading.Lock()
+
+def get_quarantine() -> Quarantine:
+    """Quarantaine partagée, ouverte à la première utilisation"""
+    global _quarantine
+    with _quarantine_lock:
+        if _quarantine is None:
+            _quarantine = Quarantine(QUARANTINE_DB_PATH, DATA_DIR / QUARANTINE_DIRNAME)
+        return _quarantine
+
+def _purge_quarantine(older_than: float) -> Optional[Dict]:
+    """Purge en tâche de fond avec journalisation (None si une purge tourne déjà)"""
+    if state['purging']:
+        return None
+    state['purging'] = True
+    try:
+        summary = get_quarantine().purge(older_than, cancel_event=purge_cancel_event)
+    finally:
+        state['purging'] = False
+        purge_cancel_event.clear()
+    if summary['purged']:
+        socketio.emit('quarantine_purged', summary)
+        socketio.emit('log', {'msg': f'🧹 Quarantaine purgée: {summary["purged"]} fichiers ({human_size(summary["bytes"])} libérés)', 'type': 'success'})
+    return summary
+
+def quarantine_purger():
+    """Boucle du purgeur : vide régulièrement les entrées plus vieilles que la rétention"""
+    while True:
+        try:
+            _purge_quarantine(QUARANTINE_RETENTION_DAYS * 86400)
+        except Exception as e:
+            print(f"Erreur purge quarantaine: {e}")
+        time.sleep(QUARANTINE_PURGE_INTERVAL)
+
+# ============================================================================
+# Jobs : scans et analyses concurrents
+# ============================================================================
+
+class Job:
+    """Travail sur un dossier (scan, analyse, pipeline) avec ses propres candidats et résultats
+
+    Chaque job a son jeton d'annulation et sa room Socket.IO (``job:<id>``) : tous
+    ses événements y partent, avec ``job_id``. Un scan puis une analyse du même
+    dossier restent dans le même job.
+    """
+
+    def __init__(self, path: str, kind: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.kind = kind
+        self.room = f'job:{self.id}'
+        self.cancel_event = threading.Event()
+        self.status = 'pending'
+        self.error: Optional[str] = None
+        self.scanning = False
+        self.analyzing = False
+        self.created = time.time()
+        self.total_files = 0
+        self.analyzed_files = 0
+        self.generations: Dict[str, int] = {}
+        self.candidates = CandidateStore()
+        self.results = ResultStore(self.candidates)
+        self.protected_files = CandidateStore()
+        self.stats: Dict[str, int] = {}
+
+    # Chaque affectation change la génération : le cache de pagination ne sert jamais une ancienne liste
+    @property
+    def candidates(self):
+        return self._candidates
+
+    @candidates.setter
+    def candidates(self, items):
+        self._candidates = items
+        self.generations['candidates'] = next(_page_generations)
+
+    @property
+    def results(self):
+        return self._results
+
+    @results.setter
+    def results(self, items):
+        self._results = items
+        self.generations['results'] = next(_page_generations)
+
+    @property
+    def busy(self) -> bool:
+        return self.scanning or self.analyzing
+
+    def emit(self, event: str, payload):
+        if isinstance(payload, dict):
+            payload = dict(payload, job_id=self.id)
+        socketio.emit(event, payload, to=self.room)
+
+    def log(self, msg: str, type: str = 'info'):
+        self.emit('log', {'msg': msg, 'type': type})
+
+    def subscribe(self, sid: Optional[str]):
+        """Abonne un client Socket.IO (``sid``) à la room avant le démarrage : aucun événement perdu"""
+        if not sid:
+            return
+        try:
+            socketio.server.enter_room(sid, self.room, namespace='/')
+        except (KeyError, ValueError):
+            pass
+
+    def start(self, kind: str):
+        self.kind = kind
+        self.status = 'running'
+        self.error = None
+        self.cancel_event.clear()
+        socketio.emit('job_update', self.describe())
+
+    def finish(self, error: Optional[str] = None):
+        self.scanning = self.analyzing = False
+        self.error = error
+        self.status = 'error' if error else 'cancelled' if self.cancel_event.is_set() else 'done'
+        socketio.emit('job_update', self.describe())
+
+    def describe(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'path': self.path,
+            'kind': self.kind,
+            'status': self.status,
+            'error': self.error,
+            'scanning': self.scanning,
+            'analyzing': self.analyzing,
+            'total_files': self.total_files,
+            'candidates': len(self.candidates),
+            'results': len(self.results),
+            'analyzed_files': self.analyzed_files,
+            'created': self.created
+        }
+
+def _paths_overlap(a: str, b: str) -> bool:
+    a, b = os.path.join(a, ''), os.path.join(b, '')
+    return a.startswith(b) or b.startswith(a)
+
+class JobManager:
+    """Registre des jobs et budget global de workers partagé équitablement
+
+    Chaque job actif reçoit ``worker_budget // nombre de jobs actifs`` workers
+    (au moins un), relu à chaque soumission : un job qui démarre réduit la part
+    des autres dès leur prochaine unité de travail. Au-delà de ``history`` jobs
+    terminés, les plus anciens sont oubliés (candidats, résultats, capture).
+    """
+
+    def __init__(self, worker_budget: int, history: int):
+        self.worker_budget = max(1, worker_budget)
+        self.history = max(1, history)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def create(self, path: str, kind: str) -> Job:
+        """Nouveau job, marqué en scan ; RuntimeError si un scan en cours couvre le même dossier (index partagé)"""
+        path = os.path.abspath(path)
+        with self._lock:
+            for job in self._jobs.values():
+                if job.scanning and _paths_overlap(job.path, path):
+                    raise RuntimeError(f'Scan déjà en cours sur {job.path} (job {job.id})')
+            job = Job(path, kind)
+            job.scanning = True
+            self._jobs[job.id] = job
+            self._evict()
+        return job
+
+    def claim_analysis(self, job: Job) -> bool:
+        """Marque le job en analyse ; False s'il est déjà occupé"""
+        with self._lock:
+            if job.busy:
+                return False
+            job.analyzing = True
+            return True
+
+    def _evict(self):
+        idle = [job for job in self._jobs.values() if job.status in ('done', 'error', 'cancelled')]
+        for job in idle[:max(0, len(idle) - self.history)]:
+            del self._jobs[job.id]
+            task_traces.pop(job.id, None)
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def latest(self, predicate=None) -> Optional[Job]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in reversed(jobs):
+            if predicate is None or predicate(job):
+                return job
+        return None
+
+    def resolve(self, job_id: Optional[str], predicate=None) -> Optional[Job]:
+        """Job demandé, sinon le plus récent qui satisfait ``predicate``"""
+        return self.get(job_id) if job_id else self.latest(predicate)
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active(self) -> List[Job]:
+        return [job for job in self.jobs() if job.busy]
+
+    def worker_share(self) -> int:
+        return max(1, self.worker_budget // max(1, len(self.active())))
+
+    def cancel(self, job_id: Optional[str] = None) -> List[Job]:
+        targets = [self.get(job_id)] if job_id else self.active()
+        targets = [job for job in targets if job is not None and job.busy]
+        for job in targets:
+            job.cancel_event.set()
+        return targets
+
+job_manager = JobManager(JOB_WORKER_BUDGET, JOB_HISTORY)
+
 # ============================================================================
 # API Routes - Version robuste
 # ============================================================================
@@ -608,13 +4042,14 @@ def index():
 @app.route('/api/health')
 def api_health():
     """Endpoint de santé"""
-    ollama_status = check_ollama_availability()
+    ollama_status = ollama_health.snapshot()
     return jsonify({
         'ok': True,
-        'ollama_available': ollama_status,
+        'ollama_available': ollama_status['available'],
+        'ollama': ollama_status,
         'pdf_support': PDF_AVAILABLE,
-        'scanning': state['scanning'],
-        'analyzing': state['analyzing']
+        'scanning': any(job.scanning for job in job_manager.jobs()),
+        'analyzing': any(job.analyzing for job in job_manager.jobs())
     })
 
 @app.route('/api/select_folder', methods=['POST'])
@@ -639,154 +4074,479 @@ def api_select_folder():
     except Exception as e:
         return jsonify({'ok': False, 'error': f'Erreur sélection: {e}'}), 500
 
+def _finish_scan(job: Job, result: Dict, profile: Optional[Dict] = None) -> Dict:
+    """Range le résultat du scan dans le job et publie scan_complete"""
+    job.total_files = result['total_files']
+    job.candidates = result['candidates']
+    job.protected_files = result['protected']
+    job.stats = result['stats']
+    job.scanning = False
+    
+    # Préparation résultats
+    payload = {
+        'total_files': result['total_files'],
+        'candidates_count': len(result['candidates']),
+        'protected_count': len(result['protected']),
+        'stats': result['stats'],
+        'reused_dirs': result['reused_dirs'],
+        'rescanned_dirs': result['rescanned_dirs'],
+        'elapsed': result['elapsed'],
+        'files_per_sec': result['files_per_sec'],
+        'spans': result.get('spans'),
+        'profile': profile,
+        'cancelled': job.cancel_event.is_set()
+    }
+    
+    job.emit('scan_complete', payload)
+    job.log(f'♻️ Index: {result["reused_dirs"]} dossiers inchangés, {result["rescanned_dirs"]} relus')
+    job.log(f'⚡ {result["files_per_sec"]} fichiers/s ({result["workers"]} workers)')
+    job.log(f'✅ Scan terminé: {len(result["candidates"])} candidats', 'success')
+    return payload
+
+def _warm_for_run(job: Job, model: str) -> Dict:
+    """Préchauffe le modèle au début d'une analyse et publie le temps de démarrage à froid"""
+    info = warm_model(model)
+    job.emit('model_warmup', info)
+    if info['ok']:
+        job.log(f'🔥 Modèle {model} prêt en {info["elapsed_ms"] / 1000:.1f}s (chargement {info["load_ms"] / 1000:.1f}s)')
+    else:
+        job.log(f'⚠️ Préchauffage {model} impossible: {info.get("error")}', 'warn')
+    return info
+
+def _profile_option(data: Dict) -> Optional[str]:
+    """Profilage demandé dès le lancement (``profile`` : "cprofile" ou "sampling")"""
+    mode = data.get('profile') or None
+    if mode is not None and mode not in PROFILE_MODES:
+        raise ValueError(f'Mode de profilage inconnu: {mode}')
+    return mode
+
+def _analysis_options(data: Dict) -> Dict:
+    """Ordre et budgets d'une analyse depuis le JSON de la requête (0 = illimité)"""
+    order = data.get('order') or ANALYSIS_ORDER
+    if order not in ('priority', 'scan'):
+        raise ValueError(f"Ordre d'analyse inconnu: {order}")
+    return {
+        'order': order,
+        'time_budget': float(data.get('time_budget_s') or ANALYSIS_TIME_BUDGET) or None,
+        'llm_budget': int(data.get('llm_budget') or ANALYSIS_LLM_BUDGET) or None
+    }
+
+def _finish_analysis(job: Job, results: List[Dict], batch_size: int, started: float,
+                     warmup: Optional[Dict] = None, report: Optional[Dict] = None) -> Dict:
+    """Range les résultats dans le job et publie analyze_complete"""
+    report = report or {}
+    elapsed = time.monotonic() - started
+    job.results = results
+    job.analyzing = False
+    
+    # Statistiques
+    decisions = {'DELETE': 0, 'KEEP': 0, 'REVIEW': 0}
+    total_deletable = 0
+    decision_of, size_of = column_of(results, 'decision'), column_of(results, 'size')
+    for i in range(len(results)):
+        decision = decision_of(i) or 'REVIEW'
+        decisions[decision] = decisions.get(decision, 0) + 1
+        if decision == 'DELETE':
+            total_deletable += size_of(i) or 0
+
+    cache = get_verdict_cache()
+    cache_stats = report.get('cache') or {'hits': 0, 'misses': 0}
+    rule_stats = report.get('rules') or {}
+    
+    payload = {
+        'total': len(results),
+        'counts': decisions,
+        'space_recoverable': human_size(total_deletable),
+        'cache': cache_stats,
+        'extraction': report.get('extraction'),
+        'rules': rule_stats,
+        'time_to_verdict': report.get('time_to_verdict') or {'count': 0},
+        'prompt_eval': report.get('prompt_eval') or {'count': 0},
+        'warmup': warmup,
+        'batch_size': batch_size,
+        'files_per_min': round(len(results) / elapsed * 60, 1) if elapsed > 0 else 0.0,
+        'coverage': report.get('coverage'),
+        'budget_exhausted': report.get('budget_exhausted'),
+        'llm_calls': report.get('llm_calls'),
+        'spans': report.get('spans'),
+        'profile': report.get('profile'),
+        'cancelled': job.cancel_event.is_set()
+    }
+    
+    job.emit('analyze_complete', payload)
+    if cache:
+        job.log(f'💾 Cache IA: {cache_stats["hits"]} hits / {cache_stats["misses"]} misses')
+    if rule_stats:
+        job.log(f'📏 Règles: {sum(rule_stats.values())}/{len(results)} fichiers tranchés sans IA')
+    coverage = report.get('coverage')
+    if coverage and coverage['ratio'] < 1.0:
+        job.log(f'📊 Couverture: {human_size(coverage["bytes"])} / {human_size(coverage["bytes_total"])} '
+                f'({coverage["ratio"]:.0%}) en {coverage["files"]}/{coverage["files_total"]} fichiers')
+    job.log(f'✅ Analyse terminée: {decisions["DELETE"]} à supprimer', 'success')
+    return payload
+
+def _scan_request(data: Dict) -> Dict:
+    """Paramètres de scan communs à /api/scan et /api/pipeline"""
+    cats = set(data.get('categories') or [])
+    return {
+        'path': data.get('path') or state['last_scan_path'],
+        'min_age': int(data.get('min_age_days', 30)),
+        'min_size': float(data.get('min_size_mb', 0)),
+        'allowed_categories': cats if cats else set(CATEGORIES.keys()) | {'Autres'},
+        'full': bool(data.get('full_rescan', False))
+    }
+
+def _scan_job(job: Job, params: Dict, on_candidates, trace: TaskTrace) -> Dict:
+    """Scan du dossier du job, événements dans sa room et part du budget de workers"""
+    with EventAggregator(emit=job.emit) as events:
+        return scan_directory(
+            job.path, params['min_age'], params['min_size'],
+            cancel_event=job.cancel_event,
+            allowed_categories=params['allowed_categories'],
+            full=params['full'],
+            on_candidates=on_candidates,
+            events=events,
+            trace=trace,
+            max_parallel=job_manager.worker_share
+        )
+
+def _analyze_job(job: Job, source, model: str, concurrency: int, batch_size: int, options: Dict,
+                 report: Dict, trace: TaskTrace) -> List[Dict]:
+    """Analyse des candidats du job (liste ou CandidateQueue du pipeline)"""
+    streamer = ChunkStreamer('analyze_results', emit=job.emit)
+
+    def on_results(items):
+        job.analyzed_files += len(items)
+        streamer.add(items)
+
+    job.analyzed_files = 0
+    with EventAggregator(emit=job.emit) as events:
+        results = analyze_batch(source, model=model, concurrency=concurrency, batch_size=batch_size,
+                                on_results=on_results, events=events, report=report, trace=trace,
+                                cancel_event=job.cancel_event, max_parallel=job_manager.worker_share,
+                                **options)
+    streamer.flush()
+    return results
+
 @app.route('/api/scan', methods=['POST'])
 def api_scan():
-    """Lancement du scan"""
-    if state['scanning']:
-        return jsonify({'error': 'Scan déjà en cours'}), 409
-    
+    """Lancement du scan (un job par dossier ; plusieurs dossiers en parallèle)"""
     try:
         data = request.get_json(silent=True) or {}
-        path = data.get('path') or state['last_scan_path']
-        min_age = int(data.get('min_age_days', 30))
-        min_size = float(data.get('min_size_mb', 0))
-        cats = set(data.get('categories') or [])
+        params = _scan_request(data)
+        profile = _profile_option(data)
         
-        if not path or not Path(path).is_dir():
+        if not params['path'] or not Path(params['path']).is_dir():
             return jsonify({'ok': False, 'error': 'Dossier invalide'}), 400
 
-        scan_path = Path(path)
-        allowed_categories = set(cats) if cats else set(CATEGORIES.keys()) | {'Autres'}
+        job = job_manager.create(params['path'], 'scan')
+        job.subscribe(data.get('sid'))
+        state['last_scan_path'] = job.path
 
         def scan_task():
-            state['scanning'] = True
-            state['scanned_files'] = 0
-            state['total_files'] = 0
-            scan_cancel_event.clear()
+            job.start('scan')
+            trace = start_trace(job.id, profile)
+            token = trace.attach()
             
-            socketio.emit('scan_started', {'path': str(scan_path)})
-            socketio.emit('log', {'msg': '🔍 Démarrage du scan...', 'type': 'info'})
+            job.emit('scan_started', {'path': job.path})
+            job.log('🔍 Démarrage du scan...')
             
+            streamer = ChunkStreamer('scan_candidates', emit=job.emit)
             try:
-                result = scan_directory(
-                    str(scan_path), min_age, min_size, 
-                    cancel_event=scan_cancel_event,
-                    allowed_categories=allowed_categories
-                )
+                result = _scan_job(job, params, streamer.add, trace)
+                streamer.flush()
             except Exception as exc:
-                state['scanning'] = False
-                socketio.emit('scan_error', {'error': str(exc)})
-                socketio.emit('log', {'msg': f'❌ Erreur scan: {exc}', 'type': 'error'})
-                scan_cancel_event.clear()
+                trace.detach(token)
+                trace.finish()
+                job.finish(str(exc))
+                job.emit('scan_error', {'error': str(exc)})
+                job.log(f'❌ Erreur scan: {exc}', 'error')
                 return
 
-            # Mise à jour état global
-            state.update({
-                'total_files': result['total_files'],
-                'candidates': result['candidates'],
-                'protected_files': result['protected'],
-                'stats': result['stats']
-            })
-            state['scanning'] = False
-            
-            # Préparation résultats
-            payload = {
-                'total_files': result['total_files'],
-                'candidates_count': len(result['candidates']),
-                'protected_count': len(result['protected']),
-                'stats': result['stats'],
-                'candidates': result['candidates'],
-                'cancelled': scan_cancel_event.is_set()
-            }
-            
-            socketio.emit('scan_complete', payload)
-            socketio.emit('log', {'msg': f'✅ Scan terminé: {len(result["candidates"])} candidats', 'type': 'success'})
-            scan_cancel_event.clear()
+            trace.detach(token)
+            finished = trace.finish()
+            result['spans'] = finished['spans']
+            _finish_scan(job, result, finished['profile'])
+            job.finish()
 
         thread = threading.Thread(target=scan_task, daemon=True)
         thread.start()
         
-        return jsonify({'ok': True, 'message': 'Scan démarré'})
+        return jsonify({'ok': True, 'message': 'Scan démarré', 'job_id': job.id})
         
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 409
     except Exception as e:
         return jsonify({'ok': False, 'error': f'Erreur démarrage scan: {e}'}), 500
 
 @app.route('/api/analyze', methods=['POST'])
 def api_analyze():
-    """Lancement analyse IA"""
-    if state['analyzing']:
-        return jsonify({'error': 'Analyse déjà en cours'}), 409
-    
-    candidates = state.get('candidates', [])
+    """Lancement analyse IA des candidats d'un job (``job_id``, défaut : dernier job scanné)"""
+    data = request.get_json(silent=True) or {}
+    job = job_manager.resolve(data.get('job_id'), lambda j: j.candidates and not j.busy)
+    candidates = job.candidates if job else []
     if not candidates:
         return jsonify({'ok': False, 'error': 'Aucun candidat à analyser'}), 400
+    if not job_manager.claim_analysis(job):
+        return jsonify({'error': 'Job déjà en cours'}), 409
     
     try:
-        data = request.get_json(silent=True) or {}
         model = data.get('model', 'llama3:8b')
+        concurrency = int(data.get('concurrency') or OLLAMA_CONCURRENCY)
+        batch_size = int(data.get('batch_size') or ANALYSIS_BATCH_SIZE)
+        options = _analysis_options(data)
+        profile = _profile_option(data)
+        job.subscribe(data.get('sid'))
 
         def analyze_task():
-            state['analyzing'] = True
-            state['analyzed_files'] = 0
-            analyze_cancel_event.clear()
+            job.start('analyze')
+            trace = start_trace(job.id, profile)
             
-            socketio.emit('analyze_started', {'total_candidates': len(candidates), 'model': model})
+            job.emit('analyze_started', {'total_candidates': len(candidates), 'model': model})
             
-            # Vérification Ollama
-            ollama_ok = check_ollama_availability()
+            # Vérification Ollama (sonde fraîche, puis cache pour le reste de l'analyse)
+            ollama_health.start()
+            ollama_ok = ollama_health.refresh()
             if ollama_ok:
-                socketio.emit('log', {'msg': f'🧠 Analyse IA démarrée ({len(candidates)} fichiers)', 'type': 'info'})
+                job.log(f'🧠 Analyse IA démarrée ({len(candidates)} fichiers)')
             else:
-                socketio.emit('log', {'msg': '⚠️ Ollama indisponible - Règles automatiques activées', 'type': 'warn'})
+                job.log('⚠️ Ollama indisponible - Règles automatiques activées', 'warn')
             
+            warmup = _warm_for_run(job, model) if ollama_ok else None
+            started = time.monotonic()
+
+            report = {}
+            token = trace.attach()
             try:
-                results = analyze_batch(candidates, model=model)
+                results = _analyze_job(job, candidates, model, concurrency, batch_size, options, report, trace)
             except Exception as exc:
-                state['analyzing'] = False
-                socketio.emit('analyze_error', {'error': str(exc)})
-                socketio.emit('log', {'msg': f'❌ Erreur analyse: {exc}', 'type': 'error'})
-                analyze_cancel_event.clear()
+                trace.detach(token)
+                trace.finish()
+                job.finish(str(exc))
+                job.emit('analyze_error', {'error': str(exc)})
+                job.log(f'❌ Erreur analyse: {exc}', 'error')
                 return
-                
-            state['results'] = results
-            state['analyzing'] = False
-            
-            # Statistiques
-            decisions = {'DELETE': 0, 'KEEP': 0, 'REVIEW': 0}
-            total_deletable = 0
-            for result in results:
-                decision = result.get('decision', 'REVIEW')
-                decisions[decision] = decisions.get(decision, 0) + 1
-                if decision == 'DELETE':
-                    total_deletable += result.get('size', 0)
-            
-            payload = {
-                'results': results,
-                'total': len(results),
-                'counts': decisions,
-                'space_recoverable': human_size(total_deletable),
-                'cancelled': analyze_cancel_event.is_set()
-            }
-            
-            socketio.emit('analyze_complete', payload)
-            socketio.emit('log', {'msg': f'✅ Analyse terminée: {decisions["DELETE"]} à supprimer', 'type': 'success'})
-            analyze_cancel_event.clear()
+
+            trace.detach(token)
+            report.update(trace.finish())
+            _finish_analysis(job, results, batch_size, started, warmup, report)
+            job.finish()
 
         thread = threading.Thread(target=analyze_task, daemon=True)
         thread.start()
         
-        return jsonify({'ok': True, 'message': 'Analyse démarrée'})
+        return jsonify({'ok': True, 'message': 'Analyse démarrée', 'job_id': job.id})
         
+    except ValueError as e:
+        job.analyzing = False
+        return jsonify({'ok': False, 'error': str(e)}), 400
     except Exception as e:
+        job.analyzing = False
         return jsonify({'ok': False, 'error': f'Erreur démarrage analyse: {e}'}), 500
 
+@app.route('/api/pipeline', methods=['POST'])
+def api_pipeline():
+    """Scan et analyse enchaînés : les candidats passent à l'analyse dès leur découverte"""
+    try:
+        data = request.get_json(silent=True) or {}
+        params = _scan_request(data)
+        model = data.get('model', 'llama3:8b')
+        concurrency = int(data.get('concurrency') or OLLAMA_CONCURRENCY)
+        batch_size = int(data.get('batch_size') or ANALYSIS_BATCH_SIZE)
+        options = _analysis_options(data)
+        profile = _profile_option(data)
+        queue_size = int(data.get('queue_size') or PIPELINE_QUEUE_SIZE)
+        
+        if not params['path'] or not Path(params['path']).is_dir():
+            return jsonify({'ok': False, 'error': 'Dossier invalide'}), 400
+
+        job = job_manager.create(params['path'], 'pipeline')
+        job.subscribe(data.get('sid'))
+        job.analyzing = True
+        state['last_scan_path'] = job.path
+
+        def pipeline_task():
+            job.start('pipeline')
+            trace = start_trace(job.id, profile)
+            # Un arrêt du job (ou une erreur d'un étage) arrête les deux étages
+            pipe = CandidateQueue(queue_size, cancel_events=(job.cancel_event,))
+            scan_outcome = {}
+            errors = []
+
+            job.emit('pipeline_started', {'path': job.path, 'model': model, 'queue_size': queue_size})
+            job.emit('scan_started', {'path': job.path})
+            job.emit('analyze_started', {'total_candidates': None, 'model': model})
+            job.log('🔁 Démarrage du scan + analyse en continu...')
+            ollama_health.start()
+            ollama_ok = ollama_health.refresh()
+            if not ollama_ok:
+                job.log('⚠️ Ollama indisponible - Règles automatiques activées', 'warn')
+
+            def scan_stage():
+                streamer = ChunkStreamer('scan_candidates', emit=job.emit)
+
+                def on_candidates(items):
+                    streamer.add(items)
+                    pipe.put(items)  # bloque si l'analyse est en retard
+
+                try:
+                    result = _scan_job(job, params, on_candidates, trace)
+                    streamer.flush()
+                    scan_outcome['summary'] = _finish_scan(job, result)
+                except Exception as exc:
+                    job.scanning = False
+                    scan_outcome['summary'] = None
+                    errors.append(str(exc))
+                    job.cancel_event.set()
+                    job.emit('scan_error', {'error': str(exc)})
+                    job.log(f'❌ Erreur scan: {exc}', 'error')
+                finally:
+                    pipe.close()
+
+            scan_thread = threading.Thread(target=trace.run, args=(scan_stage,), name='pipeline-scan', daemon=True)
+            scan_thread.start()
+            token = trace.attach()
+
+            # Le chargement du modèle se fait pendant que le scan démarre
+            warmup = _warm_for_run(job, model) if ollama_ok else None
+            started = time.monotonic()
+            report = {}
+            analyze_error = None
+            try:
+                results = _analyze_job(job, pipe, model, concurrency, batch_size, options, report, trace)
+            except Exception as exc:
+                analyze_error = exc
+                results = []
+                errors.append(str(exc))
+                job.cancel_event.set()
+            scan_thread.join()
+            trace.detach(token)
+            finished = trace.finish()
+
+            if analyze_error is not None:
+                job.analyzing = False
+                job.emit('analyze_error', {'error': str(analyze_error)})
+                job.log(f'❌ Erreur analyse: {analyze_error}', 'error')
+                analysis_summary = None
+            else:
+                analysis_summary = _finish_analysis(job, results, batch_size, started, warmup, report)
+
+            job.emit('pipeline_complete', {
+                'scan': scan_outcome.get('summary'),
+                'analysis': analysis_summary,
+                'spans': finished['spans'],
+                'profile': finished['profile'],
+                'cancelled': job.cancel_event.is_set() and not errors
+            })
+            job.finish(errors[0] if errors else None)
+
+        thread = threading.Thread(target=pipeline_task, daemon=True)
+        thread.start()
+        
+        return jsonify({'ok': True, 'message': 'Scan + analyse démarrés', 'job_id': job.id})
+        
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'ok': False, 'error': f'Erreur démarrage pipeline: {e}'}), 500
+
+@app.route('/api/rules', methods=['GET'])
+def api_rules():
+    """Règles actives et nombre de fichiers tranchés par chacune depuis le démarrage"""
+    engine = refresh_rules()
+    return jsonify({'source': engine.source, 'path': str(RULES_PATH), 'rules': engine.describe()})
+
+@app.route('/api/candidates', methods=['GET'])
+def api_candidates():
+    """Candidats d'un job (``job_id``, défaut : dernier scan), paginés (offset/limit, sort/order, category, ext, q)"""
+    job = job_manager.resolve(request.args.get('job_id'), lambda j: j.candidates)
+    try:
+        return jsonify(paginate(job.candidates if job else [], request.args,
+                                sort_fields={'name', 'size', 'age', 'category', 'ext', 'path'},
+                                filter_fields={'category', 'ext'},
+                                generation=job.generations['candidates'] if job else None))
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+
+@app.route('/api/results', methods=['GET'])
+def api_results():
+    """Résultats d'un job (défaut : dernière analyse), paginés (offset/limit, sort/order, decision, category, importance, q)"""
+    job = job_manager.resolve(request.args.get('job_id'), lambda j: j.results)
+    try:
+        return jsonify(paginate(job.results if job else [], request.args,
+                                sort_fields={'name', 'size', 'age_days', 'category', 'decision', 'importance', 'file'},
+                                filter_fields={'decision', 'category', 'importance'},
+                                generation=job.generations['results'] if job else None))
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+
+@app.route('/api/duplicates', methods=['POST'])
+def api_find_duplicates():
+    """Lancement de la recherche de doublons parmi les candidats d'un job (défaut : dernier scan)"""
+    if state['finding_duplicates']:
+        return jsonify({'error': 'Recherche de doublons déjà en cours'}), 409
+
+    data = request.get_json(silent=True) or {}
+    job = job_manager.resolve(data.get('job_id'), lambda j: j.candidates)
+    candidates = job.candidates if job else []
+    if not candidates:
+        return jsonify({'ok': False, 'error': 'Aucun candidat à comparer'}), 400
+
+    def duplicates_task():
+        state['finding_duplicates'] = True
+        duplicates_cancel_event.clear()
+        socketio.emit('duplicates_started', {'total_candidates': len(candidates)})
+
+        try:
+            with EventAggregator() as events:
+                def progress(stage, done, total):
+                    events.update('duplicates_update', {'stage': stage, 'done': done, 'total': total})
+
+                result = find_duplicates(candidates, duplicates_cancel_event, progress=progress)
+        except Exception as exc:
+            state['finding_duplicates'] = False
+            socketio.emit('duplicates_error', {'error': str(exc)})
+            socketio.emit('log', {'msg': f'❌ Erreur doublons: {exc}', 'type': 'error'})
+            duplicates_cancel_event.clear()
+            return
+
+        state['duplicates'] = result
+        state['finding_duplicates'] = False
+        socketio.emit('duplicates_complete', result)
+        socketio.emit('log', {'msg': f'👯 {len(result["groups"])} groupes de doublons ({human_size(result["wasted"])} récupérables)', 'type': 'success'})
+        duplicates_cancel_event.clear()
+
+    thread = threading.Thread(target=duplicates_task, daemon=True)
+    thread.start()
+    return jsonify({'ok': True, 'message': 'Recherche de doublons démarrée'})
+
+@app.route('/api/duplicates', methods=['GET'])
+def api_get_duplicates():
+    """Derniers groupes de doublons trouvés"""
+    result = state.get('duplicates')
+    if result is None:
+        return jsonify({'ok': True, 'groups': [], 'running': state['finding_duplicates']})
+    return jsonify({'ok': True, 'running': state['finding_duplicates'], **result})
+
 @app.route('/api/stop', methods=['POST'])
 def api_stop():
-    """Arrêt des opérations"""
+    """Arrêt des opérations (``job_id`` : ce job seulement)"""
     try:
-        if state['scanning'] or state['analyzing']:
-            scan_cancel_event.set()
-            analyze_cancel_event.set()
+        data = request.get_json(silent=True) or {}
+        if data.get('job_id'):
+            if not job_manager.cancel(data['job_id']):
+                return jsonify({'ok': True, 'message': 'Aucune opération en cours'})
+            socketio.emit('log', {'msg': f'🛑 Arrêt du job {data["job_id"]} demandé...', 'type': 'warn'})
+            return jsonify({'ok': True, 'message': 'Arrêt demandé'})
+        stopped = job_manager.cancel()
+        if stopped or state['finding_duplicates'] or state['deleting'] or state['purging']:
+            duplicates_cancel_event.set()
+            delete_cancel_event.set()
+            purge_cancel_event.set()
             socketio.emit('log', {'msg': '🛑 Arrêt demandé...', 'type': 'warn'})
             return jsonify({'ok': True, 'message': 'Arrêt demandé'})
         
@@ -796,53 +4556,216 @@ def api_stop():
 
 @app.route('/api/delete', methods=['POST'])
 def api_delete():
-    """Suppression de fichiers"""
+    """Lancement de la suppression de fichiers en tâche de fond"""
+    if state['deleting']:
+        return jsonify({'error': 'Suppression déjà en cours'}), 409
+
     try:
-        files_to_delete = request.get_json().get('files', [])
-        deleted_count = 0
-        
+        data = request.get_json(silent=True) or {}
+        files_to_delete = list(dict.fromkeys(data.get('files') or []))
         if not files_to_delete:
             return jsonify({'ok': False, 'message': 'Aucun fichier sélectionné'}), 400
+        mode = data.get('mode') or DELETE_MODE
+        if mode not in ('quarantine', 'delete'):
+            return jsonify({'ok': False, 'error': f'Mode de suppression inconnu: {mode}'}), 400
+        job = job_manager.get(data.get('job_id'))
+        scan_root = job.path if job else state['last_scan_path']
 
-        socketio.emit('log', {'msg': f'🗑️ Suppression de {len(files_to_delete)} fichiers...', 'type': 'info'})
+        def delete_task():
+            state['deleting'] = True
+            delete_cancel_event.clear()
+            socketio.emit('delete_started', {'total': len(files_to_delete), 'mode': mode})
+            verb = 'Mise en quarantaine' if mode == 'quarantine' else 'Suppression'
+            socketio.emit('log', {'msg': f'🗑️ {verb} de {len(files_to_delete)} fichiers...', 'type': 'info'})
 
-        for f in files_to_delete:
+            streamer = ChunkStreamer('files_deleted')
             try:
-                file_path = Path(f)
-                if not is_protected(file_path.name)[0] and file_path.exists():
-                    file_path.unlink()
-                    deleted_count += 1
-                    socketio.emit('file_deleted', {'path': f})
-                else:
-                    socketio.emit('log', {'msg': f'🛡️ Fichier protégé ou absent: {file_path.name}', 'type': 'warn'})
-            except Exception as e: 
-                socketio.emit('log', {'msg': f'❌ Erreur suppression {Path(f).name}: {e}', 'type': 'error'})
-
-        # Nettoyage dossiers vides
-        folders_cleaned = 0
-        if state['last_scan_path']:
-            folders_cleaned = remove_empty_folders(state['last_scan_path'])
+                quarantine = get_quarantine() if mode == 'quarantine' else None
+                copied_before = quarantine.stats()['copied'] if quarantine else 0
+                with EventAggregator() as events:
+                    def progress(done, total):
+                        events.update('delete_update', {'done': done, 'total': total})
+
+                    summary = delete_files(files_to_delete, delete_cancel_event,
+                                           on_deleted=streamer.add, progress=progress,
+                                           remove=quarantine.add if quarantine else os.unlink)
+                    streamer.flush()
+                    for path in summary['protected'] + summary['missing']:
+                        events.log(f'🛡️ Fichier protégé ou absent: {Path(path).name}', 'warn')
+                    for path, error in summary['errors']:
+                        events.log(f'❌ Erreur suppression {Path(path).name}: {error}', 'error')
+
+                deleted_files_total.inc(len(summary['deleted']), mode)
+                deleted_bytes_total.inc(summary['bytes'], mode)
+                if summary['deleted']:
+                    get_scan_index().forget_files(summary['deleted'])
+                # Nettoyage des dossiers vides, limité aux ancêtres des fichiers supprimés
+                folders_cleaned = remove_empty_parents(summary['deleted'], scan_root) if scan_root else 0
+                copied = quarantine.stats()['copied'] - copied_before if quarantine else 0
+            except Exception as exc:
+                state['deleting'] = False
+                socketio.emit('delete_error', {'error': str(exc)})
+                socketio.emit('log', {'msg': f'❌ Erreur suppression: {exc}', 'type': 'error'})
+                delete_cancel_event.clear()
+                return
+
+            state['deleting'] = False
+            socketio.emit('delete_complete', {
+                'deleted': len(summary['deleted']),
+                'bytes': summary['bytes'],
+                'protected': len(summary['protected']),
+                'missing': len(summary['missing']),
+                'errors': len(summary['errors']),
+                'folders_cleaned': folders_cleaned,
+                'mode': mode,
+                'copied': copied,
+                'cancelled': summary['cancelled']
+            })
+            if copied:
+                socketio.emit('log', {'msg': f'📦 {copied} fichiers copiés en quarantaine (autre périphérique)', 'type': 'warn'})
             if folders_cleaned > 0:
                 socketio.emit('log', {'msg': f'📁 {folders_cleaned} dossiers vides nettoyés', 'type': 'success'})
+            done_msg = 'mis en quarantaine' if mode == 'quarantine' else 'supprimés'
+            socketio.emit('log', {'msg': f'✅ {len(summary["deleted"])} fichiers {done_msg}', 'type': 'success'})
+            delete_cancel_event.clear()
+
+        thread = threading.Thread(target=delete_task, daemon=True)
+        thread.start()
+        return jsonify({'ok': True, 'message': 'Suppression démarrée', 'total': len(files_to_delete), 'mode': mode})
 
-        socketio.emit('log', {'msg': f'✅ {deleted_count} fichiers supprimés', 'type': 'success'})
-        
-        return jsonify({'ok': True, 'deleted': deleted_count, 'folders_cleaned': folders_cleaned})
-        
     except Exception as e:
         return jsonify({'ok': False, 'error': f'Erreur suppression: {e}'}), 500
 
+@app.route('/api/quarantine', methods=['GET'])
+def api_quarantine():
+    """Contenu de la quarantaine, paginé"""
+    try:
+        offset = max(0, int(request.args.get('offset', request.args.get('cursor', 0)) or 0))
+        limit = min(MAX_PAGE_SIZE, max(1, int(request.args.get('limit', DEFAULT_PAGE_SIZE))))
+    except (TypeError, ValueError):
+        return jsonify({'ok': False, 'error': 'offset/limit invalides'}), 400
+    quarantine = get_quarantine()
+    stats = quarantine.stats()
+    items = quarantine.entries(offset=offset, limit=limit)
+    next_offset = offset + len(items) if offset + len(items) < stats['entries'] else None
+    return jsonify({'ok': True, 'purging': state['purging'], **stats,
+                    'items': items, 'total': stats['entries'], 'next_offset': next_offset})
+
+@app.route('/api/quarantine/restore', methods=['POST'])
+def api_quarantine_restore():
+    """Restauration de fichiers en quarantaine (par identifiant ou chemin d'origine)"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids') or []
+    files = data.get('files') or []
+    if not ids and not files:
+        return jsonify({'ok': False, 'error': 'Aucun fichier à restaurer'}), 400
+    try:
+        quarantine = get_quarantine()
+        entries = quarantine.entries(ids=ids, originals=files)
+        # Un même chemin mis en quarantaine plusieurs fois : on restaure la version la plus récente
+        latest = {}
+        for entry in sorted(entries, key=lambda e: e['quarantined_at']):
+            latest[entry['original']] = entry
+        summary = quarantine.restore(list(latest.values()))
+    except Exception as e:
+        return jsonify({'ok': False, 'error': f'Erreur restauration: {e}'}), 500
+
+    for path, error in summary['errors']:
+        socketio.emit('log', {'msg': f'❌ Erreur restauration {Path(path).name}: {error}', 'type': 'error'})
+    if summary['conflicts']:
+        socketio.emit('log', {'msg': f'⚠️ {len(summary["conflicts"])} fichiers non restaurés (un fichier existe déjà à cet emplacement)', 'type': 'warn'})
+    socketio.emit('log', {'msg': f'♻️ {len(summary["restored"])} fichiers restaurés', 'type': 'success'})
+    return jsonify({'ok': True, 'restored': summary['restored'], 'conflicts': summary['conflicts'],
+                    'missing': summary['missing'], 'errors': len(summary['errors'])})
+
+@app.route('/api/quarantine/purge', methods=['POST'])
+def api_quarantine_purge():
+    """Purge immédiate (en tâche de fond) des entrées plus vieilles que ``older_than_days``"""
+    if state['purging']:
+        return jsonify({'error': 'Purge déjà en cours'}), 409
+    data = request.get_json(silent=True) or {}
+    try:
+        older_than = float(data.get('older_than_days') or 0) * 86400
+    except (TypeError, ValueError):
+        return jsonify({'ok': False, 'error': 'older_than_days invalide'}), 400
+
+    thread = threading.Thread(target=_purge_quarantine, args=(older_than,), daemon=True)
+    thread.start()
+    return jsonify({'ok': True, 'message': 'Purge démarrée'})
+
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """Métriques au format texte Prometheus"""
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/profile/start', methods=['POST'])
+def api_profile_start():
+    """Active le profilage d'un job en cours (``job_id``)"""
+    data = request.get_json(silent=True) or {}
+    trace = task_traces.get(data.get('job_id'))
+    if trace is None or not trace.running:
+        return jsonify({'ok': False, 'error': 'Aucun job en cours avec cet identifiant'}), 404
+    try:
+        interval = float(data['interval_ms']) / 1000 if data.get('interval_ms') else None
+        profiler = trace.start_profile(data.get('mode') or 'sampling', interval)
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 409
+    job = job_manager.get(trace.task)
+    if job:
+        job.log(f'🔬 Profilage {profiler.mode} activé')
+    return jsonify({'ok': True, 'job_id': trace.task, 'mode': profiler.mode})
+
+@app.route('/api/profile/stop', methods=['POST'])
+def api_profile_stop():
+    """Arrête la capture d'un job et retourne le lien de téléchargement"""
+    data = request.get_json(silent=True) or {}
+    trace = task_traces.get(data.get('job_id'))
+    profile = trace.stop_profile() if trace else None
+    if profile is None:
+        return jsonify({'ok': False, 'error': 'Aucun profilage pour ce job'}), 404
+    return jsonify({'ok': True, 'job_id': trace.task, 'profile': profile, 'spans': trace.spans()})
+
+@app.route('/api/profile/<job_id>', methods=['GET'])
+def api_profile_download(job_id):
+    """Dernière capture du job : pstats (.prof) ou speedscope (.speedscope.json)"""
+    trace = task_traces.get(job_id)
+    path = trace.last_capture if trace else None
+    if path is None or not path.exists():
+        return jsonify({'ok': False, 'error': 'Aucune capture disponible'}), 404
+    mimetype = 'application/json' if path.suffix == '.json' else 'application/octet-stream'
+    return send_file(str(path), mimetype=mimetype, as_attachment=True, download_name=path.name)
+
+@app.route('/api/jobs', methods=['GET'])
+def api_jobs():
+    """Jobs connus (en cours et derniers terminés) et part de workers de chaque job actif"""
+    return jsonify({'ok': True, 'jobs': [job.describe() for job in job_manager.jobs()],
+                    'worker_budget': job_manager.worker_budget, 'worker_share': job_manager.worker_share()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'ok': False, 'error': 'Job inconnu'}), 404
+    return jsonify({'ok': True, **job.describe(), 'stats': job.stats})
+
 @app.route('/api/status', methods=['GET'])
 def api_status():
-    """Statut de l'application"""
+    """Statut de l'application (compteurs du dernier job, ``jobs`` : jobs en cours)"""
+    jobs = job_manager.jobs()
+    latest = jobs[-1] if jobs else None
     return jsonify({
         'ok': True,
-        'scanning': state['scanning'],
-        'analyzing': state['analyzing'],
-        'total_files': state['total_files'],
-        'candidates': len(state['candidates']),
-        'results': len(state['results']),
-        'ollama_available': check_ollama_availability()
+        'scanning': any(job.scanning for job in jobs),
+        'analyzing': any(job.analyzing for job in jobs),
+        'deleting': state['deleting'],
+        'total_files': latest.total_files if latest else 0,
+        'candidates': len(latest.candidates) if latest else 0,
+        'results': len(latest.results) if latest else 0,
+        'jobs': [job.describe() for job in jobs if job.busy],
+        'ollama_available': ollama_health.snapshot()['available'],
+        'warmups': _model_warmups
     })
 
 # ============================================================================
@@ -858,6 +4781,22 @@ def handle_connect():
 def handle_disconnect():
     print('❌ Client déconnecté')
 
+@socketio.on('join_job')
+def handle_join_job(data):
+    """Suit les événements d'un job (room ``job:<id>``)"""
+    job = job_manager.get((data or {}).get('job_id'))
+    if job is None:
+        emit('log', {'msg': '⚠️ Job inconnu', 'type': 'warn'})
+        return
+    join_room(job.room)
+    emit('job_update', job.describe())
+
+@socketio.on('leave_job')
+def handle_leave_job(data):
+    job = job_manager.get((data or {}).get('job_id'))
+    if job is not None:
+        leave_room(job.room)
+
 # ============================================================================
 # Lancement
 # ============================================================================
@@ -871,12 +4810,16 @@ if __name__ == '__main__':
 
 📊 Statut:
 • PDF Support: {'✅' if PDF_AVAILABLE else '❌'}
-• Ollama: {'✅ Connecté' if check_ollama_availability() else '❌ Non disponible'}
+• Ollama: {'✅ Connecté' if ollama_health.refresh() else '❌ Non disponible'}
 
 🚀 Serveur: http://localhost:5000
 💡 Conseil: Démarrez Ollama avec 'ollama serve' si non disponible
     """)
     
+    ollama_health.start()
+    if OLLAMA_WARMUP_MODEL:
+        threading.Thread(target=warm_model, args=(OLLAMA_WARMUP_MODEL,), daemon=True).start()
+    threading.Thread(target=quarantine_purger, daemon=True).start()
     try:
         socketio.run(
             app, 
@@ -78,6 +78,7 @@ const App = () => {
     const [activeTab, setActiveTab] = useState('delete');
 
     const logsEndRef = useRef(null);
+    const jobRef = useRef(null); // job courant : ses événements arrivent dans la room job:<id>
 
     const fmtSize = (b) => b < 1024 ? b + ' B' : b < 1024**2 ? (b/1024).toFixed(1) + ' KB' : (b/1024**2).toFixed(1) + ' MB';
     const addLog = (m, type = 'info') => setLogs(p => [...p, { time: new Date().toLocaleTimeString(), msg: m, type }]);
@@ -89,7 +90,11 @@ const App = () => {
     }, [logs]);
     
     useEffect(() => {
-        const handleConnect = () => addLog('✅ SYSTEM :: Connected', 'success');
+        const handleConnect = () => {
+            addLog('✅ SYSTEM :: Connected', 'success');
+            // Une reconnexion perd les rooms : réabonnement au job courant
+            if (jobRef.current) socket.emit('join_job', { job_id: jobRef.current });
+        };
         const handleScanStarted = () => { 
             setStatus('scanning'); 
             setFiles([]); 
@@ -99,10 +104,11 @@ const App = () => {
         
         const handleScanUpdate = (d) => setProgress(p => ({...p, val: d.total_files, txt: `Scanning: ${d.total_files} files` }));
         
-        // FIX: Correction de la réception des fichiers scannés
+        // Candidats reçus par paquets pendant le scan
+        const handleScanCandidates = (d) => setFiles(p => p.concat(d.items || []));
+        
         const handleScanComplete = (d) => { 
-            setStatus('idle'); 
-            setFiles(d.candidates || []); // FIX: Utilisation de candidates au lieu de files
+            setStatus(s => s === 'analyzing' ? s : 'idle'); // mode pipeline : l'analyse continue
             setProgress({val:0,max:0,txt:'Scan complete'});
             addLog(`✅ SCAN COMPLETE :: ${d.total_files} files found, ${d.candidates_count} candidates`, 'success');
         };
@@ -110,55 +116,87 @@ const App = () => {
         const handleAnalyzeStarted = (d) => { 
             setStatus('analyzing'); 
             setResults({delete:[],keep:[],review:[]}); 
-            setProgress({val:0, max:d.total_candidates, txt:'Neural analysis...'}); 
+            setProgress({val:0, max:d.total_candidates || 0, txt:'Neural analysis...'}); 
         };
         
         const handleAnalyzeUpdate = (d) => {
             setProgress({val: d.analyzed_files, max: d.total_candidates, txt: `Analyzing: ${d.analyzed_files}/${d.total_candidates}`});
         };
         
-        // FIX: Correction de la réception des résultats d'analyse
+        // Résultats d'analyse reçus par paquets
+        const handleAnalyzeResults = (d) => {
+            const items = d.items || [];
+            setResults(p => ({
+                delete: p.delete.concat(items.filter(r => r.decision === 'DELETE')),
+                keep: p.keep.concat(items.filter(r => r.decision === 'KEEP')),
+                review: p.review.concat(items.filter(r => r.decision === 'REVIEW'))
+            }));
+        };
+        
         const handleAnalyzeComplete = (d) => { 
             setStatus('idle'); 
             setAiThinking(null);
-            if (d.results) {
-                const deleteFiles = d.results.filter(r => r.decision === 'DELETE');
-                const keepFiles = d.results.filter(r => r.decision === 'KEEP');
-                const reviewFiles = d.results.filter(r => r.decision === 'REVIEW');
-                setResults({ delete: deleteFiles, keep: keepFiles, review: reviewFiles });
-            }
             addLog(d.cancelled ? '🛑 Analysis stopped' : '✅ ANALYSIS COMPLETE', d.cancelled ? 'warn' : 'success');
         };
         
         const handleAiThinking = (d) => setAiThinking(d);
         const handleAiResult = () => setAiThinking(null);
-        const handleFileDeleted = (d) => addLog(`🗑️ REMOVED :: ${d.path.split('/').pop()}`, 'warn');
+        const handleFilesDeleted = (d) => {
+            const removed = new Set(d.items || []);
+            setResults(p => ({...p, delete: p.delete.filter(f => !removed.has(f.file))}));
+            setSelected(p => {
+                const next = {...p};
+                removed.forEach(f => delete next[f]);
+                return next;
+            });
+        };
+        const handleDeleteUpdate = (d) => setProgress({val: d.done, max: d.total, txt: `Deleting ${d.done}/${d.total}`});
+        const handleDeleteComplete = (d) => {
+            setProgress({val:0,max:0,txt:'Delete complete'});
+            addLog(`✅ Deleted ${d.deleted} files${d.cancelled ? ' (stopped)' : ''}`, d.cancelled ? 'warn' : 'success');
+        };
         const handleLog = (data) => addLog(data.msg, data.type);
+        const handleLogBatch = (data) => {
+            const time = new Date().toLocaleTimeString();
+            const entries = data.entries.map(e => ({ time, msg: e.msg, type: e.type }));
+            if (data.dropped) entries.unshift({ time, msg: `… ${data.dropped} messages ignorés`, type: 'warn' });
+            setLogs(p => [...p, ...entries]);
+        };
 
         socket.on('connect', handleConnect);
         socket.on('scan_started', handleScanStarted);
         socket.on('scan_update', handleScanUpdate);
+        socket.on('scan_candidates', handleScanCandidates);
         socket.on('scan_complete', handleScanComplete); // FIX: Changé de scan_finished à scan_complete
         socket.on('analyze_started', handleAnalyzeStarted);
         socket.on('analyze_update', handleAnalyzeUpdate);
+        socket.on('analyze_results', handleAnalyzeResults);
         socket.on('analyze_complete', handleAnalyzeComplete);
         socket.on('ai_thinking', handleAiThinking);
         socket.on('ai_result', handleAiResult);
-        socket.on('file_deleted', handleFileDeleted);
+        socket.on('files_deleted', handleFilesDeleted);
+        socket.on('delete_update', handleDeleteUpdate);
+        socket.on('delete_complete', handleDeleteComplete);
         socket.on('log', handleLog);
+        socket.on('log_batch', handleLogBatch);
 
         return () => {
             socket.off('connect', handleConnect);
             socket.off('scan_started', handleScanStarted);
             socket.off('scan_update', handleScanUpdate);
+            socket.off('scan_candidates', handleScanCandidates);
             socket.off('scan_complete', handleScanComplete);
             socket.off('analyze_started', handleAnalyzeStarted);
             socket.off('analyze_update', handleAnalyzeUpdate);
+            socket.off('analyze_results', handleAnalyzeResults);
             socket.off('analyze_complete', handleAnalyzeComplete);
             socket.off('ai_thinking', handleAiThinking);
             socket.off('ai_result', handleAiResult);
-            socket.off('file_deleted', handleFileDeleted);
+            socket.off('files_deleted', handleFilesDeleted);
+            socket.off('delete_update', handleDeleteUpdate);
+            socket.off('delete_complete', handleDeleteComplete);
             socket.off('log', handleLog);
+            socket.off('log_batch', handleLogBatch);
         };
     }, []);
 
@@ -194,11 +232,14 @@ const App = () => {
                     path: config.path, 
                     categories: cats,
                     min_age_days: 30,
-                    min_size_mb: 0
+                    min_size_mb: 0,
+                    sid: socket.id
                 }) 
             });
             const data = await response.json();
-            if (!data.ok) {
+            if (data.ok) {
+                jobRef.current = data.job_id;
+            } else {
                 addLog(`❌ Scan error: ${data.error}`, 'error');
             }
         } catch (e) {
@@ -215,7 +256,7 @@ const App = () => {
             const response = await apiFetch('/api/analyze', { 
                 method: 'POST', 
                 headers: {'Content-Type':'application/json'},
-                body: JSON.stringify({ model: 'llama3:8b' }) 
+                body: JSON.stringify({ model: 'llama3:8b', job_id: jobRef.current, sid: socket.id }) 
             });
             const data = await response.json();
             if (!data.ok) {
@@ -244,15 +285,13 @@ const App = () => {
                 const response = await apiFetch('/api/delete', { 
                     method: 'POST', 
                     headers: {'Content-Type':'application/json'},
-                    body: JSON.stringify({ files: toDelete }) 
+                    body: JSON.stringify({ files: toDelete, job_id: jobRef.current }) 
                 });
                 const data = await response.json();
                 if (data.ok) {
-                    setResults(p => ({...p, delete: p.delete.filter(f => !selected[f.file])}));
-                    const nextSel = {...selected};
-                    toDelete.forEach(f => delete nextSel[f]);
-                    setSelected(nextSel);
-                    addLog(`✅ Deleted ${data.deleted} files`, 'success');
+                    addLog(`🗑️ Deleting ${data.total} files...`, 'info'); // progression via delete_update / files_deleted
+                } else {
+                    addLog(`❌ Delete failed: ${data.error || data.message}`, 'error');
                 }
             } catch (e) {
                 addLog(`❌ Delete failed: ${e.message}`, 'error');
@@ -0,0 +1,11 @@
+"""Configuration pytest commune"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Les données persistantes (index, caches) ne doivent pas toucher ~/.ai_cleaner
+os.environ.setdefault('AI_CLEANER_DATA_DIR', tempfile.mkdtemp(prefix='ai_cleaner_tests_'))
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -67,6 +67,14 @@ def test_api_scan_invalid_path(client):
     assert response.status_code == 400
 
 
+def test_api_pipeline_invalid_path(client):
+    """Test /api/pipeline avec chemin invalide"""
+    response = client.post('/api/pipeline',
+                          json={'path': '/invalid/path/that/does/not/exist'})
+    
+    assert response.status_code == 400
+
+
 def test_api_analyze_no_candidates(client):
     """Test /api/analyze sans candidats"""
     response = client.post('/api/analyze')
@@ -76,6 +84,143 @@ def test_api_analyze_no_candidates(client):
     assert data['ok'] == False
 
 
+def test_api_candidates_pagination(client):
+    """Test /api/candidates : tri, filtre et pages"""
+    import server
+
+    items = [{'path': f'/d/f{i}', 'name': f'f{i}.jpg' if i % 2 else f'f{i}.txt', 'size': i,
+              'age': 40, 'ext': '.jpg' if i % 2 else '.txt',
+              'category': 'Images' if i % 2 else 'Documents'} for i in range(25)]
+    manager = server.JobManager(4, 4)
+    job = manager.create('/d', 'scan')
+    job.candidates, job.scanning = items, False
+    with patch.object(server, 'job_manager', manager):
+        data = client.get('/api/candidates?limit=10&sort=size&order=desc').get_json()
+        assert data['total'] == 25
+        assert [c['size'] for c in data['items']] == list(range(24, 14, -1))
+        assert data['next_offset'] == 10
+
+        data = client.get('/api/candidates?offset=20&limit=10&sort=size&order=desc').get_json()
+        assert len(data['items']) == 5
+        assert data['next_offset'] is None
+
+        data = client.get('/api/candidates?category=Images&limit=100').get_json()
+        assert data['total'] == 12
+
+        assert client.get('/api/candidates?sort=password').status_code == 400
+        assert client.get(f'/api/candidates?job_id={job.id}&limit=1').get_json()['total'] == 25
+        assert client.get('/api/candidates?job_id=inconnu').get_json()['total'] == 0
+
+        # Fichier sans extension (Makefile) trié avec les autres ; nouvelle liste de même taille
+        assert client.get('/api/candidates?sort=ext&limit=1').get_json()['items'][0]['name'] == 'f1.jpg'
+        job.candidates = [dict(item, ext='', name='Makefile') if i == 3 else item for i, item in enumerate(items)]
+        data = client.get('/api/candidates?sort=ext&limit=100').get_json()
+        assert data['items'][0]['name'] == 'Makefile'
+        data = client.get('/api/candidates?sort=ext&order=desc&limit=100').get_json()
+        assert data['items'][-1]['name'] == 'Makefile'
+
+
+def test_api_results_empty(client):
+    """Test /api/results sans analyse"""
+    data = client.get('/api/results?decision=DELETE').get_json()
+    assert data['ok'] == True
+    assert data['items'] == []
+
+
+def test_api_duplicates_no_candidates(client):
+    """Test /api/duplicates sans candidats"""
+    response = client.post('/api/duplicates')
+    assert response.status_code == 400
+
+    response = client.get('/api/duplicates')
+    assert response.status_code == 200
+    assert response.get_json()['groups'] == []
+
+
+def test_api_metrics(client, tmp_path):
+    """Test /api/metrics : format Prometheus et compteurs du scan"""
+    import threading
+    import server
+
+    for i in range(3):
+        (tmp_path / f'file_{i}.txt').write_text('x')
+    before = server.files_scanned_total.value()
+    server.scan_directory(str(tmp_path), 0, 0, threading.Event(), set(server.CATEGORIES) | {'Autres'},
+                          index=server.ScanIndex(tmp_path / 'index.sqlite3'))
+    assert server.files_scanned_total.value() - before >= 3
+
+    server.ollama_request_seconds.observe(0.3, 'test-model', 'ok')
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE ai_cleaner_files_scanned_total counter' in text
+    assert 'ai_cleaner_ollama_request_duration_seconds_bucket{model="test-model",outcome="ok",le="0.25"} 0' in text
+    assert 'ai_cleaner_ollama_request_duration_seconds_bucket{model="test-model",outcome="ok",le="+Inf"} 1' in text
+    assert 'ai_cleaner_queue_depth{queue="preview_prefetch"}' in text
+
+
+def test_api_profile(client, tmp_path, monkeypatch):
+    """Test /api/profile : activation sur tâche en cours et téléchargement"""
+    import server
+
+    monkeypatch.setattr(server, 'PROFILE_DIR', tmp_path)
+    monkeypatch.setattr(server, 'task_traces', {})
+    assert client.post('/api/profile/start', json={'job_id': 'scan'}).status_code == 404
+    assert client.get('/api/profile/scan').status_code == 404
+    assert client.post('/api/scan', json={'path': str(tmp_path), 'profile': 'perf'}).status_code == 400
+
+    trace = server.start_trace('scan')
+    assert client.post('/api/profile/start', json={'job_id': 'scan', 'mode': 'gprof'}).status_code == 400
+    response = client.post('/api/profile/start', json={'job_id': 'scan', 'mode': 'sampling', 'interval_ms': 2})
+    assert response.status_code == 200
+    assert client.post('/api/profile/start', json={'job_id': 'scan'}).status_code == 409
+
+    data = client.post('/api/profile/stop', json={'job_id': 'scan'}).get_json()
+    assert data['profile']['mode'] == 'sampling'
+    assert data['profile']['file'].endswith('.speedscope.json')
+    trace.finish()
+
+    response = client.get('/api/profile/scan')
+    assert response.status_code == 200
+    assert response.get_json()['exporter'] == 'ai-cleaner'
+
+
+def test_api_concurrent_jobs(client, tmp_path, monkeypatch):
+    """Test des jobs : deux dossiers scannés en parallèle, résultats séparés, 409 si dossiers imbriqués"""
+    import time
+    import server
+
+    monkeypatch.setattr(server, 'job_manager', server.JobManager(4, 4))
+    monkeypatch.setattr(server, '_scan_index', server.ScanIndex(tmp_path / 'index.sqlite3'))
+    roots = []
+    for name, count in (('a', 3), ('b', 5)):
+        root = tmp_path / name
+        root.mkdir()
+        for i in range(count):
+            (root / f'{name}_{i}.bin').write_bytes(b'x')
+        roots.append(root)
+
+    busy = server.job_manager.create(str(roots[0]), 'scan')
+    assert client.post('/api/scan', json={'path': str(roots[0] / '..' / 'a')}).status_code == 409
+    assert server.job_manager.worker_share() == 4
+    busy.scanning, busy.status = False, 'done'
+
+    job_ids = [client.post('/api/scan', json={'path': str(root), 'min_age_days': 0}).get_json()['job_id']
+               for root in roots]
+    assert len(set(job_ids)) == 2
+    deadline = time.time() + 10
+    while time.time() < deadline and any(job.busy for job in server.job_manager.jobs()):
+        time.sleep(0.02)
+
+    for job_id, count in zip(job_ids, (3, 5)):
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        assert job['status'] == 'done' and job['candidates'] == count
+        assert client.get(f'/api/candidates?job_id={job_id}').get_json()['total'] == count
+    assert client.get('/api/jobs/inconnu').status_code == 404
+    assert len(client.get('/api/jobs').get_json()['jobs']) == 3
+
+
 @patch('server.check_ollama_availability')
 def test_check_ollama_unavailable(mock_check):
     """Test détection Ollama indisponible"""
@@ -9,6 +9,15 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 
+@pytest.fixture(autouse=True)
+def reset_ollama_health():
+    """Disjoncteur fermé et cache vide pour chaque test"""
+    from server import ollama_health
+    ollama_health.reset()
+    yield
+    ollama_health.reset()
+
+
 @patch('server.requests.Session.post')
 def test_call_ollama_success(mock_post):
     """Test appel Ollama réussi"""
@@ -83,6 +92,82 @@ def test_call_ollama_invalid_json(mock_post):
     assert 'JSON invalide' in error
 
 
+@patch('server.requests.Session.post')
+def test_call_ollama_streaming_stops_at_complete_verdict(mock_post):
+    """Test du streaming : requête fermée dès que l'objet JSON est complet"""
+    from server import call_ollama, VERDICT_SCHEMA
+
+    fragments = ['{"can_delete": ', 'false, "reason": "Contrat {signé}', ' \\"v2\\"", ',
+                 '"importance": "high"}', '\n\n', ' bavardage', ' inutile']
+    consumed = []
+
+    def lines():
+        for fragment in fragments:
+            consumed.append(fragment)
+            yield json.dumps({'response': fragment, 'done': False}).encode()
+        yield json.dumps({'response': '', 'done': True}).encode()
+
+    mock_response = MagicMock(status_code=200, headers={'Content-Type': 'application/x-ndjson'})
+    mock_response.iter_lines.return_value = lines()
+    mock_post.return_value = mock_response
+
+    timings = {}
+    result, error = call_ollama("Test prompt", timings=timings)
+
+    assert error is None
+    assert result == {'can_delete': False, 'reason': 'Contrat {signé} "v2"', 'importance': 'high'}
+    assert len(consumed) == 4
+    mock_response.close.assert_called()
+    assert timings['stopped_early'] is True
+    assert timings['time_to_verdict'] >= 0
+    sent = mock_post.call_args.kwargs
+    assert sent['stream'] is True
+    assert sent['json']['format'] == VERDICT_SCHEMA
+
+
+@patch('server.requests.Session.post')
+def test_warm_model_and_shared_system_prompt(mock_post):
+    """Test du préchauffage (keep_alive, temps de chargement) et du prompt system commun"""
+    import server
+
+    mock_post.return_value = MagicMock(status_code=200)
+    mock_post.return_value.json.return_value = {'response': '', 'done': True, 'load_duration': 2_500_000_000}
+    info = server.warm_model('llama3:8b', keep_alive='1h')
+    assert info['ok'] and info['load_ms'] == 2500.0
+    sent = mock_post.call_args.kwargs['json']
+    assert sent['prompt'] == '' and sent['keep_alive'] == '1h'
+
+    # Essai semi-ouvert : un 404 (modèle absent) ou un JSON invalide ne bloque pas le disjoncteur
+    server.ollama_health.reset()
+    try:
+        for _ in range(server.ollama_health.failure_threshold):
+            server.ollama_health.record_failure()
+        server.ollama_health._opened_at -= server.ollama_health.cooldown
+        mock_post.return_value = MagicMock(status_code=404, text='model not found')
+        assert not server.warm_model('absent:1b')['ok']
+        assert server.ollama_health.snapshot()['breaker'] == 'closed'
+        mock_post.return_value = MagicMock(status_code=200)
+        mock_post.return_value.json.side_effect = ValueError('pas du JSON')
+        assert 'JSON' in server.warm_model('llama3:8b')['error']
+    finally:
+        server.ollama_health.reset()
+
+    mock_post.return_value = MagicMock(status_code=200)
+
+    mock_post.return_value.json.return_value = {
+        'response': json.dumps({'can_delete': True, 'reason': 'tmp', 'importance': 'low'}),
+        'done': True, 'prompt_eval_duration': 40_000_000, 'prompt_eval_count': 12
+    }
+    timings = {}
+    result, error = server.call_ollama('Metadata...', timings=timings, system=server.ANALYSIS_SYSTEM_PROMPT)
+    assert error is None
+    assert timings['prompt_eval'] == pytest.approx(0.04)
+    sent = mock_post.call_args.kwargs['json']
+    assert sent['system'] == server.ANALYSIS_SYSTEM_PROMPT
+    assert sent['keep_alive'] == server.OLLAMA_KEEP_ALIVE
+    assert 'Rules:' not in sent['prompt']
+
+
 @patch('server.requests.Session.get')
 def test_check_ollama_available(mock_get):
     """Test Ollama disponible"""
@@ -108,5 +193,442 @@ def test_check_ollama_unavailable(mock_get):
     assert result == False
 
 
+@patch('server.requests.Session.get')
+def test_health_status_is_cached(mock_get):
+    """Test du cache TTL : une seule sonde /api/tags"""
+    from server import OllamaHealthMonitor
+
+    mock_get.return_value = MagicMock(status_code=200)
+    monitor = OllamaHealthMonitor(ttl=60, failure_threshold=3, cooldown=30)
+
+    assert all(monitor.is_available() for _ in range(20))
+    assert mock_get.call_count == 1
+
+
+@patch('server.requests.Session.post')
+def test_circuit_breaker_opens_and_recovers(mock_post):
+    """Test du disjoncteur : ouverture, échec rapide, essai semi-ouvert"""
+    import requests
+    from server import call_ollama, ollama_health
+
+    mock_post.side_effect = requests.exceptions.ConnectionError()
+    for _ in range(ollama_health.failure_threshold):
+        call_ollama("Test prompt")
+    assert ollama_health.snapshot()['breaker'] == 'open'
+
+    mock_post.reset_mock()
+    result, error = call_ollama("Test prompt")
+    assert result is None
+    assert 'non disponible' in error
+    mock_post.assert_not_called()
+
+    # Fin du délai : une requête d'essai passe et referme le disjoncteur
+    ollama_health._opened_at -= ollama_health.cooldown
+    mock_post.side_effect = None
+    mock_post.return_value = MagicMock(status_code=200)
+    mock_post.return_value.json.return_value = {
+        'response': json.dumps({'can_delete': True, 'reason': 'tmp', 'importance': 'low'})
+    }
+    result, error = call_ollama("Test prompt")
+    assert error is None
+    assert ollama_health.snapshot()['breaker'] == 'closed'
+
+
+@patch('server.requests.Session.post')
+def test_circuit_breaker_trial_released_on_any_error(mock_post):
+    """Test du disjoncteur : un essai semi-ouvert terminé par une autre exception ne le bloque pas"""
+    import requests
+    from server import call_ollama, ollama_health, OllamaHealthMonitor
+
+    ollama_health.reset()
+    try:
+        mock_post.side_effect = requests.exceptions.ConnectionError()
+        for _ in range(ollama_health.failure_threshold):
+            call_ollama("Test prompt")
+        ollama_health._opened_at -= ollama_health.cooldown
+
+        # Essai sans réponse HTTP : échec, le disjoncteur se rouvre au lieu de rester semi-ouvert
+        mock_post.side_effect = requests.exceptions.TooManyRedirects()
+        assert call_ollama("Test prompt")[0] is None
+        assert ollama_health.snapshot()['breaker'] == 'open'
+        assert not ollama_health._trial_in_flight
+
+        # Essai qui échoue après la réponse : l'essai est libéré, le suivant peut passer
+        ollama_health._opened_at -= ollama_health.cooldown
+        mock_post.side_effect = None
+        mock_post.return_value = MagicMock(status_code=200, headers={})
+        mock_post.return_value.json.side_effect = RuntimeError('boom')
+        assert call_ollama("Test prompt")[0] is None
+        assert not ollama_health._trial_in_flight
+    finally:
+        ollama_health.reset()
+
+    # Une sonde réussie referme un disjoncteur semi-ouvert
+    monitor = OllamaHealthMonitor(ttl=60, failure_threshold=1, cooldown=0)
+    monitor.record_failure()
+    assert monitor.allow_request() and not monitor.allow_request()
+    monitor.release_trial()
+    assert monitor.allow_request() and monitor.snapshot()['breaker'] == 'half_open'
+    with patch.object(monitor, '_probe', return_value=True):
+        monitor.refresh()
+    assert monitor.snapshot()['breaker'] == 'closed'
+
+
+def test_verdict_cache_lru_and_prompt_version(tmp_path):
+    """Test du cache des verdicts : LRU et invalidation par version du prompt"""
+    from server import VerdictCache
+
+    cache = VerdictCache(tmp_path / 'v.sqlite3', max_entries=2, prompt_version='v1')
+    cache.put('a', 'llama3:8b', {'can_delete': True})
+    cache.put('b', 'llama3:8b', {'can_delete': False})
+    assert cache.get('a', 'llama3:8b') == {'can_delete': True}
+    assert cache.get('a', 'mistral') is None
+    cache._conn.execute("UPDATE verdicts SET last_used = 0 WHERE fingerprint = 'b'")
+    cache.put('c', 'llama3:8b', {'can_delete': True})
+
+    assert cache.get('b', 'llama3:8b') is None  # le moins récemment utilisé
+    assert cache.get('c', 'llama3:8b') is not None
+    assert cache.stats()['hits'] == 2
+    cache.close()
+
+    cache = VerdictCache(tmp_path / 'v.sqlite3', max_entries=2, prompt_version='v2')
+    assert cache.stats()['entries'] == 0
+    cache.close()
+
+
+def test_analyze_uses_verdict_cache(tmp_path):
+    """Test : un fichier inchangé n'est pas renvoyé à Ollama"""
+    import server
+
+    f = tmp_path / 'notes_reunion.txt'
+    f.write_text('ordre du jour')
+    info = {'path': str(f), 'name': f.name, 'size': 13, 'age': 40, 'ext': '.txt', 'category': 'Documents'}
+    verdict = {'can_delete': True, 'reason': 'obsolète', 'importance': 'low'}
+
+    cache = server.VerdictCache(tmp_path / 'v.sqlite3', max_entries=10)
+    with patch('server._verdict_cache', cache), \
+         patch.object(server.ollama_health, 'is_available', return_value=True), \
+         patch('server.call_ollama', return_value=(verdict, None)) as mock_call:
+        assert server.analyze_file_with_fallback(info, 'llama3:8b') == verdict
+        assert server.analyze_file_with_fallback(info, 'llama3:8b') == verdict
+        assert mock_call.call_count == 1
+
+        f.write_text('ordre du jour modifié')
+        server.analyze_file_with_fallback(info, 'llama3:8b')
+        assert mock_call.call_count == 2
+
+    # Réponse incomplète ou non-objet : règles de repli, rien dans le cache
+    f.write_text('ordre du jour reporté')
+    for reply in ({'reason': 'incomplet'}, ['pas', 'un', 'objet']):
+        with patch('server._verdict_cache', cache), \
+             patch.object(server.ollama_health, 'is_available', return_value=True), \
+             patch('server.call_ollama', return_value=(reply, None)):
+            decision = server.analyze_file_with_fallback(info, 'llama3:8b')
+        assert decision['importance'] == 'unknown' and 'Réponse IA invalide' in decision['reason']
+    assert cache.stats()['entries'] == 2
+    cache.close()
+
+
+def test_batched_analysis_maps_and_requeries(tmp_path):
+    """Test du mode par lot : réponse mappée par id, entrée manquante ré-interrogée seule"""
+    import server
+
+    infos = []
+    for i in range(3):
+        f = tmp_path / f'rapport_{i}.bin'
+        f.write_bytes(b'x')
+        infos.append({'path': str(f), 'name': f.name, 'size': 1, 'age': 40, 'ext': '.bin', 'category': 'Autres'})
+
+    batch_answer = [
+        {'id': 1, 'can_delete': True, 'reason': 'vieux', 'importance': 'low'},
+        {'id': 3, 'can_delete': 'maybe'},  # invalide
+    ]
+    single_answer = {'can_delete': False, 'reason': 'à garder', 'importance': 'high'}
+    prompts = []
+
+    def fake_call(prompt, model='llama3:8b', expect_list=False, timings=None, system=None):
+        prompts.append(((system or '') + prompt, expect_list))
+        return (batch_answer if expect_list else single_answer), None
+
+    with patch('server.VERDICT_CACHE_ENABLED', False), \
+         patch.object(server.ollama_health, 'is_available', return_value=True), \
+         patch('server.call_ollama', side_effect=fake_call):
+        decisions = server.analyze_group_batched(infos, 'llama3:8b')
+
+    assert decisions[0]['can_delete'] is True
+    assert decisions[1] == single_answer
+    assert decisions[2] == single_answer
+    assert [expect for _, expect in prompts] == [True, False, False]
+    assert prompts[0][0].count('Rules:') == 1
+    assert all(info['name'] in prompts[0][0] for info in infos)
+
+
+def test_pack_batches_respects_token_budget():
+    """Test du découpage des lots selon le budget de tokens"""
+    from server import _pack_batches, _estimate_tokens, BATCH_PROMPT_TEMPLATE
+
+    contexts = [(i, {'file_info': {'path': f'/d/f{i}.txt', 'name': f'f{i}.txt', 'age': 1, 'size': 1,
+                                   'category': 'Documents'},
+                     'preview': 'x' * 300}) for i in range(10)]
+    budget = _estimate_tokens(BATCH_PROMPT_TEMPLATE) + 250
+    batches = _pack_batches(contexts, budget)
+
+    assert len(batches) > 1
+    assert sum(len(b) for b in batches) == 10
+    assert [i for b in batches for i, _ in b] == list(range(10))
+
+
+def _candidates(n):
+    return [{'path': f'/tmp/f{i}.bin', 'name': f'f{i}.bin', 'size': i, 'age': 40,
+             'ext': '.bin', 'category': 'Autres'} for i in range(n)]
+
+
+def test_analyze_batch_concurrent_preserves_order():
+    """Test de l'analyse concurrente : requêtes en parallèle, ordre conservé"""
+    import threading
+    import time
+    import server
+
+    lock = threading.Lock()
+    active = {'now': 0, 'max': 0}
+
+    def fake_analyze(candidate, model, events=None):
+        with lock:
+            active['now'] += 1
+            active['max'] = max(active['max'], active['now'])
+        time.sleep(0.02 if candidate['size'] % 2 else 0.05)
+        with lock:
+            active['now'] -= 1
+        return {'can_delete': True, 'reason': candidate['name'], 'importance': 'low'}
+
+    with patch('server.analyze_file_with_fallback', side_effect=fake_analyze), \
+         patch('server.check_ollama_availability', return_value=True):
+        report = {}
+        results = server.analyze_batch(_candidates(12), concurrency=4, report=report)
+
+    assert [r['name'] for r in results] == [f'f{i}.bin' for i in range(12)]
+    assert 1 < active['max'] <= 4
+    assert report['coverage']['files'] == 12
+
+
+def test_analyze_batch_cancel_stops_queued_work():
+    """Test de l'annulation : les fichiers en attente ne sont pas analysés"""
+    import threading
+    import time
+    import server
+
+    calls = []
+    cancel_event = threading.Event()
+
+    def fake_analyze(candidate, model, events=None):
+        calls.append(candidate['name'])
+        if len(calls) == 2:
+            cancel_event.set()
+        time.sleep(0.01)
+        return {'can_delete': False, 'reason': 'ok', 'importance': 'low'}
+
+    with patch('server.analyze_file_with_fallback', side_effect=fake_analyze), \
+         patch('server.check_ollama_availability', return_value=True):
+        results = server.analyze_batch(_candidates(50), concurrency=2, cancel_event=cancel_event)
+
+    assert len(calls) < 10
+    assert len(results) <= len(calls)
+
+
+def test_analyze_batch_rules_before_llm():
+    """Test de la passe de règles en bloc : les fichiers tranchés ne vont pas au LLM"""
+    import server
+
+    calls = []
+
+    def fake_analyze(candidate, model, events=None):
+        calls.append(candidate['name'])
+        return {'can_delete': False, 'reason': 'ia', 'importance': 'medium'}
+
+    candidates = _candidates(4)
+    candidates[1]['name'] = 'Screenshot 2020.png'
+    candidates[3]['name'] = 'brouillon_tmp.txt'
+    with patch('server.analyze_file_with_fallback', side_effect=fake_analyze), \
+         patch('server.check_ollama_availability', return_value=True):
+        results = server.analyze_batch(candidates, concurrency=2)
+
+    assert sorted(calls) == ['f0.bin', 'f2.bin']
+    assert [r['rule'] for r in results] == [None, 'screenshot', None, 'old-temporary']
+
+
+def test_analyze_batch_reports_are_per_run():
+    """Test des compteurs d'analyse : deux analyses simultanées ne mélangent pas cache, règles et latences"""
+    import threading
+    import time
+    import server
+
+    def fake_analyze(candidate, model, events=None):
+        if candidate['path'].startswith('/a/'):
+            server.count_usage('cache:hits')
+            server.observe_latency('verdict', 0.05)
+        time.sleep(0.01)
+        return {'can_delete': False, 'reason': 'ia', 'importance': 'medium'}
+
+    def run(prefix, screenshots):
+        candidates = [dict(c, path=f'/{prefix}/{c["name"]}') for c in _candidates(6)]
+        for c in candidates[:screenshots]:
+            c['name'] = c['path'].rsplit('/', 1)[1] + ' Screenshot 2020.png'
+        reports[prefix] = {}
+        server.analyze_batch(candidates, concurrency=2, report=reports[prefix])
+
+    reports = {}
+    with patch('server.analyze_file_with_fallback', side_effect=fake_analyze), \
+         patch('server.check_ollama_availability', return_value=True):
+        threads = [threading.Thread(target=run, args=args) for args in (('a', 2), ('b', 0))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+    assert reports['a']['rules'] == {'screenshot': 2} and reports['b']['rules'] == {}
+    assert reports['a']['cache'] == {'hits': 4, 'misses': 0} and reports['b']['cache']['hits'] == 0
+    assert reports['a']['time_to_verdict']['count'] == 4 and reports['b']['time_to_verdict'] == {'count': 0}
+
+
+def test_analyze_batch_priority_and_llm_budget():
+    """Test de l'ordonnancement : gros fichiers anciens d'abord, arrêt propre au budget de requêtes"""
+    import server
+
+    calls = []
+
+    def fake_analyze(candidate, model, events=None):
+        server.count_usage('llm_calls')
+        calls.append(candidate['name'])
+        return {'can_delete': True, 'reason': 'ia', 'importance': 'low'}
+
+    candidates = _candidates(5)
+    for candidate, size in zip(candidates, (10, 500, 20, 300, 350)):
+        candidate['size'] = size
+    candidates[4]['age'] = 1  # plus gros que f3, mais récent : moins probablement supprimable
+    report = {}
+    with patch('server.analyze_file_with_fallback', side_effect=fake_analyze), \
+         patch('server.check_ollama_availability', return_value=True):
+        results = server.analyze_batch(candidates, concurrency=1, llm_budget=3, report=report)
+
+    assert calls == ['f1.bin', 'f3.bin', 'f4.bin']
+    assert [r['name'] for r in results] == ['f1.bin', 'f3.bin', 'f4.bin']
+    assert report['budget_exhausted'] == 'llm'
+    assert report['llm_calls'] == 3
+    assert report['coverage'] == {'files': 3, 'files_total': 5, 'bytes': 1150, 'bytes_total': 1180,
+                                  'ratio': round(1150 / 1180, 4)}
+
+    calls.clear()
+    with patch('server.analyze_file_with_fallback', side_effect=fake_analyze), \
+         patch('server.check_ollama_availability', return_value=True):
+        server.analyze_batch(candidates, concurrency=1, order='scan')
+    assert calls == ['f0.bin', 'f1.bin', 'f2.bin', 'f3.bin', 'f4.bin']
+
+    # Deux analyses simultanées : chacune consomme son propre budget, pas celui de l'autre
+    import threading
+    import time
+
+    def slow_analyze(candidate, model, events=None):
+        time.sleep(0.01)
+        return fake_analyze(candidate, model, events)
+
+    reports = [{}, {}]
+    with patch('server.analyze_file_with_fallback', side_effect=slow_analyze), \
+         patch('server.check_ollama_availability', return_value=True):
+        threads = [threading.Thread(target=server.analyze_batch, args=([dict(c) for c in candidates],),
+                                    kwargs={'concurrency': 1, 'llm_budget': 3, 'report': r})
+                   for r in reports]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+    assert [r['llm_calls'] for r in reports] == [3, 3]
+    assert [r['coverage']['files'] for r in reports] == [3, 3]
+
+
+def test_analyze_batch_against_fake_ollama_server():
+    """Test HTTP réel contre le faux Ollama : concurrence bornée, lots, JSON invalide, timeout"""
+    import server
+    from benchmarks.fake_ollama import FakeOllama
+
+    def isolated(fake):
+        return (patch('server.OLLAMA_URL', fake.url),
+                patch('server.ollama_health', server.OllamaHealthMonitor(10, 100, 30)),
+                patch('server.get_verdict_cache', return_value=None))
+
+    verdicts = {'f3.bin': {'can_delete': True, 'reason': 'copie', 'importance': 'low'}}
+    with FakeOllama(latency='uniform:0.02,0.05', max_parallel=2, verdicts=verdicts, seed=1) as fake:
+        cache_off, health, url = isolated(fake)
+        with cache_off, health, url:
+            results = server.analyze_batch(_candidates(8), concurrency=4)
+            assert [r['decision'] for r in results] == ['KEEP'] * 3 + ['DELETE'] + ['KEEP'] * 4
+            assert fake.requests == 8 and fake.stats['max_active'] == 2
+
+            batched = server.analyze_batch(_candidates(8), concurrency=2, batch_size=4)
+            assert [r['decision'] for r in batched] == [r['decision'] for r in results]
+            assert fake.requests == 8 + 2
+
+    with FakeOllama(malformed_rate=1.0) as fake:
+        cache_off, health, url = isolated(fake)
+        with cache_off, health, url:
+            result, error = server.call_ollama('Test prompt')
+            assert result is None and error
+
+    with FakeOllama(timeout_rate=1.0, hang_seconds=5) as fake:
+        cache_off, health, url = isolated(fake)
+        with cache_off, health, url, patch('server.OLLAMA_TIMEOUT', 0.3):
+            result, error = server.call_ollama('Test prompt')
+            assert result is None and 'Timeout' in error
+            assert fake.stats['timeouts'] == 1
+
+
+def test_analyze_batch_pipeline_backpressure():
+    """Test du mode pipeline : file bornée entre scan et analyse, un arrêt stoppe les deux étages"""
+    import threading
+    import time
+    import server
+
+    scan_cancel = threading.Event()
+    pipe = server.CandidateQueue(3, cancel_events=(scan_cancel,))
+    produced = []
+    max_backlog = []
+
+    def producer():
+        for candidate in _candidates(20):
+            pipe.put([candidate])
+            produced.append(candidate['name'])
+            max_backlog.append(len(produced) - analyzed_count())
+        pipe.close()
+
+    calls = []
+
+    def analyzed_count():
+        return len(calls)
+
+    def fake_analyze(candidate, model, events=None):
+        calls.append(candidate['name'])
+        time.sleep(0.01)
+        return {'can_delete': True, 'reason': 'ok', 'importance': 'low'}
+
+    thread = threading.Thread(target=producer)
+    with patch('server.analyze_file_with_fallback', side_effect=fake_analyze), \
+         patch('server.check_ollama_availability', return_value=True), \
+         patch.object(server.preview_extractor, 'prefetch_depth', 0):
+        thread.start()
+        results = server.analyze_batch(pipe, concurrency=2)
+    thread.join(timeout=5)
+
+    assert [r['name'] for r in results] == [f'f{i}.bin' for i in range(20)]
+    # Le producteur n'a jamais pris plus d'avance que la file + les requêtes en vol
+    assert max(max_backlog) <= 3 + 2 + 1
+
+    # Arrêt côté scan : l'analyse s'arrête aussi, le producteur ne bloque plus
+    pipe = server.CandidateQueue(2, cancel_events=(scan_cancel,))
+    scan_cancel.set()
+    pipe.put(_candidates(10))
+    with patch('server.analyze_file_with_fallback', side_effect=fake_analyze), \
+         patch('server.check_ollama_availability', return_value=True):
+        assert server.analyze_batch(pipe, concurrency=2) == []
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
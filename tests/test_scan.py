@@ -0,0 +1,310 @@
+"""Tests du scan et de l'index persistant"""
+
+import os
+import threading
+import time
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+ALL_CATEGORIES = {'Images', 'Videos', 'Audio', 'Documents', 'Archives', 'Code', 'Installers', 'Autres'}
+
+
+def _touch(path, content=b'x', age_days=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    if age_days:
+        old = time.time() - age_days * 86400
+        os.utime(path, (old, old))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Arborescence de test"""
+    root = tmp_path / 'root'
+    _touch(root / 'old_notes.txt', b'hello', age_days=100)
+    _touch(root / 'facture_2020.pdf', b'%PDF', age_days=400)
+    _touch(root / 'sub' / 'photo.jpg', b'jpg' * 10, age_days=60)
+    _touch(root / 'sub' / 'recent.png', b'png')
+    _touch(root / 'sub' / 'debug.log', b'skipped')
+    _touch(root / 'node_modules' / 'dep.js', b'ignored', age_days=100)
+    return root
+
+
+@pytest.fixture
+def index(tmp_path):
+    from server import ScanIndex
+    idx = ScanIndex(tmp_path / 'index.sqlite3')
+    yield idx
+    idx.close()
+
+
+def _scan(root, index, **kwargs):
+    from server import scan_directory
+    return scan_directory(str(root), 30, 0, threading.Event(), ALL_CATEGORIES, index=index, **kwargs)
+
+
+def test_scan_directory_results(tree, index):
+    """Test du scan complet"""
+    result = _scan(tree, index)
+
+    names = sorted(c['name'] for c in result['candidates'])
+    assert names == ['old_notes.txt', 'photo.jpg']
+    assert [p['name'] for p in result['protected']] == ['facture_2020.pdf']
+    assert result['total_files'] == 5  # node_modules ignoré, .log compté
+    assert result['stats']['Documents'] == 2
+    assert result['rescanned_dirs'] == 2
+
+
+def test_rescan_reuses_unchanged_dirs(tree, index):
+    """Test du rescan incrémental"""
+    first = _scan(tree, index)
+    second = _scan(tree, index)
+
+    assert second['reused_dirs'] == 2
+    assert second['rescanned_dirs'] == 0
+    assert sorted(c['path'] for c in second['candidates']) == sorted(c['path'] for c in first['candidates'])
+    assert second['stats'] == first['stats']
+
+
+def test_rescan_detects_changes(tree, index):
+    """Test de la détection des ajouts et suppressions"""
+    _scan(tree, index)
+
+    _touch(tree / 'sub' / 'new_video.mp4', b'v', age_days=90)
+    os.utime(tree / 'sub', None)
+    (tree / 'old_notes.txt').unlink()
+
+    result = _scan(tree, index)
+    names = sorted(c['name'] for c in result['candidates'])
+    assert names == ['new_video.mp4', 'photo.jpg']
+
+
+def test_rescan_restats_files_edited_in_place(tree, index):
+    """Test d'un fichier modifié sur place : le dossier est réutilisé mais le candidat est re-stat"""
+    _scan(tree, index)
+    root_times = os.stat(tree).st_atime, os.stat(tree).st_mtime
+    sub_times = os.stat(tree / 'sub').st_atime, os.stat(tree / 'sub').st_mtime
+    (tree / 'old_notes.txt').write_bytes(b'rewritten today')
+    _touch(tree / 'sub' / 'photo.jpg', b'jpg' * 50, age_days=60)
+    os.utime(tree, root_times)
+    os.utime(tree / 'sub', sub_times)
+
+    result = _scan(tree, index)
+    assert result['reused_dirs'] == 2
+    assert [(c['name'], c['size']) for c in result['candidates']] == [('photo.jpg', 150)]
+    assert [r[:2] for r in index.files_in(str(tree / 'sub')) if r[0] == 'photo.jpg'] == [('photo.jpg', 150)]
+
+
+def test_removed_subdir_purged(tree, index):
+    """Test de la purge d'un sous-dossier supprimé"""
+    _scan(tree, index)
+    for f in (tree / 'sub').iterdir():
+        f.unlink()
+    (tree / 'sub').rmdir()
+
+    result = _scan(tree, index)
+    assert index.files_in(str(tree / 'sub')) == []
+    assert [c['name'] for c in result['candidates']] == ['old_notes.txt']
+
+
+def test_parallel_walker_matches_single_thread(tmp_path, index):
+    """Test du parcours parallèle : mêmes résultats quel que soit le nombre de workers"""
+    from server import ScanIndex
+    root = tmp_path / 'wide'
+    for d in range(6):
+        for f in range(5):
+            _touch(root / f'd{d}' / f'sub{f % 2}' / f'file_{d}_{f}.txt', b'data', age_days=45)
+
+    single = _scan(root, index, workers=1)
+    other = ScanIndex(tmp_path / 'other.sqlite3')
+    parallel = _scan(root, other, workers=4)
+    other.close()
+
+    assert parallel['workers'] == 4
+    assert parallel['total_files'] == single['total_files'] == 30
+    assert sorted(c['path'] for c in parallel['candidates']) == sorted(c['path'] for c in single['candidates'])
+    assert parallel['stats'] == single['stats']
+    assert parallel['rescanned_dirs'] == single['rescanned_dirs'] == 19
+
+
+def test_scan_cancelled(tree, index):
+    """Test de l'annulation du scan"""
+    from server import scan_directory
+    cancel = threading.Event()
+    cancel.set()
+
+    result = scan_directory(str(tree), 30, 0, cancel, ALL_CATEGORIES, index=index)
+    assert result['candidates'] == []
+    assert index.get_dir(str(tree)) is None
+
+
+def test_find_duplicates_stages(tmp_path):
+    """Test des doublons : seuls les fichiers de même taille sont lus"""
+    from unittest.mock import patch
+    import server
+
+    big = os.urandom(50000)
+    same_edges = bytearray(big)
+    same_edges[25000] ^= 0xFF  # mêmes extrémités, contenu différent
+    files = {
+        'a.bin': big, 'b.bin': big, 'c.bin': bytes(same_edges),
+        'small1.txt': b'hello', 'small2.txt': b'hello', 'small3.txt': b'world',
+        'unique.dat': b'u' * 1234, 'empty1': b'', 'empty2': b'',
+    }
+    infos = []
+    for name, content in files.items():
+        _touch(tmp_path / name, content)
+        infos.append({'path': str(tmp_path / name), 'size': len(content)})
+
+    opened = []
+    real_edge = server._edge_hash
+
+    def tracking_edge(path, size):
+        opened.append(os.path.basename(path))
+        return real_edge(path, size)
+
+    with patch('server._edge_hash', side_effect=tracking_edge):
+        result = server.find_duplicates(infos, threading.Event(), workers=3)
+
+    groups = sorted([os.path.basename(p) for p in g['files']] for g in result['groups'])
+    assert groups == [['a.bin', 'b.bin'], ['small1.txt', 'small2.txt']]
+    assert 'unique.dat' not in opened and 'empty1' not in opened
+    assert result['full_hashed'] == 3
+    assert result['wasted'] == 50000 + 5
+
+
+def test_delete_files_and_empty_parents(tmp_path):
+    """Test de la suppression parallèle : protégés conservés, seuls les ancêtres vidés sont retirés"""
+    import server
+
+    _touch(tmp_path / 'a' / 'b' / 'c' / 'old.tmp')
+    _touch(tmp_path / 'a' / 'b' / 'other.tmp')
+    _touch(tmp_path / 'a' / 'keep' / 'x.tmp')
+    _touch(tmp_path / 'd' / 'e' / 'f.tmp')
+    _touch(tmp_path / 'd' / 'facture_2020.pdf')
+    (tmp_path / 'unrelated' / 'empty').mkdir(parents=True)
+    targets = [str(tmp_path / p) for p in ('a/b/c/old.tmp', 'a/b/other.tmp', 'd/e/f.tmp',
+                                           'd/facture_2020.pdf', 'missing.tmp')]
+
+    batches = []
+    summary = server.delete_files(targets, threading.Event(), workers=3, on_deleted=batches.append)
+
+    assert sorted(summary['deleted']) == sorted(targets[:3])
+    assert sorted(p for batch in batches for p in batch) == sorted(targets[:3])
+    assert summary['protected'] == [targets[3]]
+    assert summary['missing'] == [targets[4]]
+    assert (tmp_path / 'd' / 'facture_2020.pdf').exists()
+
+    assert server.remove_empty_parents(summary['deleted'], str(tmp_path)) == 3
+    assert not (tmp_path / 'a' / 'b').exists()
+    assert (tmp_path / 'a' / 'keep').exists()
+    assert not (tmp_path / 'd' / 'e').exists() and (tmp_path / 'd').exists()
+    assert (tmp_path / 'unrelated' / 'empty').exists()
+
+
+def test_quarantine_rename_restore_and_purge(tmp_path):
+    """Test de la quarantaine : rename réversible, repli par copie hors périphérique, purge différée"""
+    import errno
+    from unittest.mock import patch
+    import server
+
+    quarantine = server.Quarantine(tmp_path / 'q.sqlite3', tmp_path / 'data' / server.QUARANTINE_DIRNAME)
+    _touch(tmp_path / 'docs' / 'a.tmp', b'a' * 100)
+    _touch(tmp_path / 'docs' / 'b.tmp', b'b' * 10)
+    a, b = str(tmp_path / 'docs' / 'a.tmp'), str(tmp_path / 'docs' / 'b.tmp')
+    inode = os.stat(a).st_ino
+
+    entry = quarantine.add(a)
+    assert not os.path.exists(a) and os.stat(entry['stored']).st_ino == inode  # rename, pas de copie
+    real_rename = os.rename
+
+    def cross_device(src, dst):
+        if src == b:
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        return real_rename(src, dst)
+
+    with patch('server.os.rename', side_effect=cross_device):
+        copied = quarantine.add(b)
+    assert copied['copied'] and not os.path.exists(b)
+    with pytest.raises(FileNotFoundError):
+        quarantine.add(str(tmp_path / 'docs' / 'missing.tmp'))
+    assert quarantine.stats() == {'entries': 2, 'bytes': 110, 'renamed': 1, 'copied': 1}
+
+    summary = quarantine.restore(quarantine.entries(originals=[a]))
+    assert summary['restored'] == [a] and os.stat(a).st_ino == inode
+
+    assert quarantine.purge(older_than=3600, budget_mbps=0)['purged'] == 0
+    assert quarantine.purge(older_than=0, budget_mbps=0) == {'purged': 1, 'bytes': 10, 'cancelled': False}
+    assert not os.path.exists(copied['stored']) and quarantine.entries() == []
+    quarantine.close()
+
+
+def test_synthetic_tree_is_reproducible(tmp_path, index):
+    """Test du générateur des benchmarks : même graine, même arborescence"""
+    from benchmarks.synthetic_fs import build_tree
+
+    params = {'depth': 2, 'fanout': 2, 'files_per_dir': 15, 'seed': 7, 'protected_ratio': 0.2}
+    first = build_tree(tmp_path / 'a', **params)
+    second = build_tree(tmp_path / 'b', **params)
+
+    def listing(root):
+        return sorted((os.path.relpath(os.path.join(d, f), root), os.path.getsize(os.path.join(d, f)))
+                      for d, _, files in os.walk(root) for f in files)
+
+    assert listing(tmp_path / 'a') == listing(tmp_path / 'b')
+    assert {k: v for k, v in first.items() if k != 'root'} == {k: v for k, v in second.items() if k != 'root'}
+    assert first['files'] == 7 * 15 and first['dirs'] == 7
+    assert first['protected'] > 0
+
+    result = _scan(tmp_path / 'a', index)
+    assert result['total_files'] == first['files']
+    assert len(result['protected']) >= first['protected']
+
+
+def test_phase_spans_and_profiles(tree, index, tmp_path, monkeypatch):
+    """Test des traces de phases et des captures cProfile / échantillonnage"""
+    import json
+    import pstats
+    import server
+
+    monkeypatch.setattr(server, 'PROFILE_DIR', tmp_path / 'profiles')
+    trace = server.start_trace('scan', 'cprofile')
+    result = _scan(tree, index, trace=trace)
+    assert {'walk', 'classify'} <= set(result['spans'])
+    assert result['spans']['walk']['count'] == 2
+
+    capture = trace.finish()['profile']
+    assert capture['mode'] == 'cprofile' and capture['download'] == '/api/profile/scan'
+    stats = pstats.Stats(str(trace.last_capture))
+    assert any(func[2] == '_list_directory' for func in stats.stats)
+
+    def busy():
+        deadline = time.monotonic() + 0.1
+        while time.monotonic() < deadline:
+            sum(range(1000))
+
+    sampled = server.start_trace('analyze')
+    sampled.start_profile('sampling', interval=0.002)
+    sampled.run(busy)
+    capture = sampled.finish()['profile']
+    assert capture['samples'] > 0
+    speedscope = json.loads(sampled.last_capture.read_text())
+    frames = [frame['name'] for frame in speedscope['shared']['frames']]
+    assert 'busy' in frames and speedscope['profiles'][0]['type'] == 'sampled'
+
+    with pytest.raises(ValueError):
+        server.start_trace('scan', 'perf')
+
+
+def test_index_reset_on_rules_change(index):
+    """Test de l'invalidation quand les règles changent"""
+    assert index.ensure_signature('a') is False
+    assert index.ensure_signature('a') is False
+    assert index.ensure_signature('b') is True
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -102,5 +102,253 @@ def test_apply_local_rules():
     assert result['can_delete'] == True
 
 
+def test_rule_engine_compiled_rules(tmp_path):
+    """Test du moteur de règles : ordre, conditions, étapes, aperçu différé et compteurs"""
+    import json
+    from server import RuleEngine, load_rules, _PREVIEW_UNKNOWN
+
+    rules_file = tmp_path / 'rules.json'
+    rules_file.write_text(json.dumps({'rules': [
+        {'id': 'node-modules', 'when': {'path_glob': '*/node_modules/*'},
+         'decision': {'can_delete': True, 'reason': 'Dépendances ({ext})'}},
+        {'id': 'old-big-video', 'when': {'category': 'Videos', 'min_age_days': 365, 'min_size_mb': 100},
+         'decision': {'can_delete': True, 'importance': 'low'}},
+        {'id': 'invoice', 'when': {'name': ['facture', r'invoice\d+'], 'parent': 'compta'},
+         'decision': {'can_delete': False, 'importance': 'high'}},
+        {'id': 'empty-text', 'when': {'ext': ['.txt'], 'no_preview': True},
+         'decision': {'can_delete': True}},
+        {'id': 'old-iso', 'stage': 'fallback', 'when': {'ext': '.iso', 'min_age_days': 30},
+         'decision': {'can_delete': True}},
+    ]}))
+    engine = load_rules(rules_file)
+
+    def info(path, size=1, age=1):
+        name = path.rsplit('/', 1)[-1]
+        return {'path': path, 'name': name, 'ext': '.' + name.rsplit('.', 1)[-1], 'size': size, 'age': age}
+
+    assert engine.decide(info('/p/node_modules/a.js'))['reason'] == 'Dépendances (.js)'
+    assert engine.decide(info('/v/film.mp4', 200 * 1024 * 1024, 400))['rule'] == 'old-big-video'
+    assert engine.decide(info('/v/film.mp4', 200 * 1024 * 1024, 10)) is None
+    assert engine.decide(info('/docs/Compta/Facture_2023.pdf'))['can_delete'] is False
+    assert engine.decide(info('/docs/perso/facture.pdf')) is None
+    # Règle dépendant de l'aperçu : différée tant qu'il n'est pas extrait
+    assert engine.decide(info('/t/vide.txt'), _PREVIEW_UNKNOWN) is None
+    assert engine.decide(info('/t/vide.txt'), None)['rule'] == 'empty-text'
+    assert engine.decide(info('/t/plein.txt'), 'contenu') is None
+    # Étape fallback séparée
+    assert engine.decide(info('/i/os.iso', age=60)) is None
+    assert engine.decide(info('/i/os.iso', age=60), stage='fallback')['rule'] == 'old-iso'
+
+    counts = engine.stats()
+    assert counts == {'node-modules': 1, 'old-big-video': 1, 'invoice': 1, 'empty-text': 1, 'old-iso': 1}
+
+    with pytest.raises(ValueError):
+        RuleEngine([{'id': 'x', 'when': {'colour': 'red'}, 'decision': {'can_delete': True}}])
+    rules_file.write_text('{pas du json')
+    assert load_rules(rules_file).source == 'défaut'
+
+
+@pytest.mark.parametrize('when', [
+    {'name': 'fact(ure'},
+    {'min_age_days': '30'},
+    {'max_size_mb': True},
+    {'ext': ['.tmp', 3]},
+])
+def test_invalid_rules_fall_back_to_defaults(tmp_path, when):
+    """Test des règles invalides (regex, types) : refusées au chargement, règles par défaut"""
+    import json
+    from server import RuleEngine, load_rules
+
+    with pytest.raises(ValueError):
+        RuleEngine([{'id': 'x', 'when': when, 'decision': {'can_delete': True}}])
+    rules_file = tmp_path / 'rules.json'
+    rules_file.write_text(json.dumps([{'id': 'x', 'when': when, 'decision': {'can_delete': True}}]))
+    engine = load_rules(rules_file)
+    assert engine.source == 'défaut'
+    engine.decide({'path': '/d/facture.txt', 'name': 'facture.txt', 'ext': '.txt', 'size': 1, 'age': 40})
+
+
+def test_classifier_matches_keyword_scan():
+    """Test du classifieur compilé contre le parcours naïf des mots-clés"""
+    from server import (FileClassifier, _normalize, PROTECTED_KEYWORDS, SCREENSHOT_PATTERNS,
+                        TEMPORARY_FILE_HINTS, CATEGORIES)
+
+    classifier = FileClassifier(PROTECTED_KEYWORDS, SCREENSHOT_PATTERNS, TEMPORARY_FILE_HINTS, CATEGORIES)
+    names = [
+        'Capture d’écran 2024.png', 'Screen Shot copy.png', 'facture_temp.pdf', 'Mon CV.docx',
+        'RÉSERVATION billet.pdf', 'untitled draft.txt', 'contestation.doc', 'photo.JPG',
+        'archive.tar.gz', 'README', 'password_test.txt', 'screencap-important.mov',
+    ]
+    for name in names:
+        normalized = _normalize(name)
+        protected = [k for k in PROTECTED_KEYWORDS if _normalize(k) in normalized]
+        result = classifier.classify(name)
+        assert result.protected == bool(protected), name
+        assert result.keyword == (protected[0] if protected else None), name
+        assert result.screenshot == any(p in normalized for p in SCREENSHOT_PATTERNS), name
+        assert result.temporary == any(_normalize(h) in normalized for h in TEMPORARY_FILE_HINTS), name
+
+    assert classifier.classify('photo.JPG').category == 'Images'
+    assert classifier.classify('README').category == 'Autres'
+
+
+def test_classifier_rebuilt_on_config_change(monkeypatch):
+    """Test de la reconstruction du classifieur quand la config change"""
+    import server
+
+    before = server.refresh_classifier()
+    assert server.refresh_classifier() is before
+    assert server.is_protected('rapport_fiscal.pdf')[0] == False
+
+    monkeypatch.setattr(server, 'PROTECTED_KEYWORDS', server.PROTECTED_KEYWORDS + ['fiscal'])
+    assert server.refresh_classifier() is not before
+    assert server.is_protected('rapport_fiscal.pdf') == (True, 'fiscal')
+
+    monkeypatch.undo()
+    server.refresh_classifier()
+
+
+def test_candidate_and_result_stores():
+    """Test des stores en colonnes : dicts identiques à la lecture, tri et filtres sans dicts"""
+    import server
+
+    candidates = [{'path': f'/data/{d}/f{i}.txt', 'name': f'f{i}.txt', 'size': 10 * i, 'age': 40 + i,
+                   'ext': '.txt', 'category': 'Documents' if i % 2 else 'Autres'}
+                  for d in ('a', 'b') for i in range(3)]
+    candidates.append({'path': '/data/c/réel.bin', 'name': 'affiché.bin', 'size': 1, 'age': 0,
+                       'ext': '.bin', 'category': 'Autres'})
+    store = server.CandidateStore(candidates)
+    assert store == candidates and store[-1]['path'] == '/data/c/réel.bin'
+    assert len(store.dirs) == 3 and store[1:3] == candidates[1:3]
+    assert store.column('category')(1) == 'Documents'
+
+    results = server.ResultStore(store)
+    results.add(2, {'can_delete': True, 'reason': 'règle', 'importance': 'low', 'rule': 'temp'})
+    results.add(0, {'can_delete': False, 'reason': 'ia', 'importance': 'medium', 'time_to_verdict_ms': 12.5})
+    results.add(1, {'can_delete': True, 'reason': 'indisponible', 'importance': 'unknown'})
+    results.sort_by_row()
+    assert [r['name'] for r in results] == ['f0.txt', 'f1.txt', 'f2.txt']
+    assert results[0] == server._make_record(candidates[0], {'can_delete': False, 'reason': 'ia',
+                                                              'importance': 'medium', 'time_to_verdict_ms': 12.5})
+    assert [r['decision'] for r in results] == ['KEEP', 'REVIEW', 'DELETE']
+    assert results[2]['rule'] == 'temp' and results[2]['time_to_verdict_ms'] is None
+
+    page = server.paginate(results, {'sort': 'size', 'order': 'desc', 'decision': 'DELETE'},
+                           {'size'}, {'decision'})
+    assert [r['file'] for r in page['items']] == ['/data/a/f2.txt'] and page['total'] == 1
+    page = server.paginate(store, {'sort': 'size', 'q': 'F1', 'limit': 1}, {'size'}, set())
+    assert page['items'] == [candidates[1]] and page['next_offset'] == 1
+
+
+def test_chunk_streamer():
+    """Test de la diffusion par paquets"""
+    from unittest.mock import patch
+    from server import ChunkStreamer
+
+    with patch('server.socketio.emit') as mock_emit:
+        streamer = ChunkStreamer('scan_candidates', chunk_size=4)
+        streamer.add([{'i': i} for i in range(3)])
+        assert mock_emit.call_count == 0
+        streamer.add([{'i': i} for i in range(3, 10)])
+        streamer.flush()
+
+    payloads = [call.args[1] for call in mock_emit.call_args_list]
+    assert [len(p['items']) for p in payloads] == [4, 4, 2]
+    assert [p['offset'] for p in payloads] == [0, 4, 8]
+
+
+def test_event_aggregator_coalesces():
+    """Test du regroupement des événements de progression et des logs"""
+    from unittest.mock import patch
+    from server import EventAggregator
+
+    with patch('server.socketio.emit') as mock_emit:
+        with EventAggregator(rate_hz=0.1, max_logs=3) as events:
+            for i in range(1000):
+                events.update('scan_update', {'total_files': i})
+            for i in range(5):
+                events.log(f'ligne {i}', 'info')
+
+    emitted = [(call.args[0], call.args[1]) for call in mock_emit.call_args_list]
+    assert emitted == [
+        ('log_batch', {'entries': [{'msg': f'ligne {i}', 'type': 'info'} for i in (2, 3, 4)], 'dropped': 2}),
+        ('scan_update', {'total_files': 999}),
+    ]
+
+
+def test_extract_preview_bounded_io(tmp_path):
+    """Test des extracteurs : texte début/fin, PDF et docx sans lire le fichier entier"""
+    import zipfile
+    import zlib
+    from server import extract_preview, PREVIEW_MAX_BYTES
+
+    small = tmp_path / 'notes.txt'
+    small.write_text('bonjour')
+    assert extract_preview(str(small), '.txt') == ('bonjour', 7)
+
+    big = tmp_path / 'big.csv'
+    big.write_text('id,nom\n' + 'x,y\n' * 500000 + 'fin,derniere\n')
+    preview = extract_preview(str(big), '.csv')
+    assert preview.text.startswith('id,nom')
+    assert preview.text.endswith('fin,derniere\n')
+    assert preview.bytes_read < 10000
+
+    content = zlib.compress(b'BT /F1 12 Tf 72 700 Td (Facture n\\260 42) Tj T* [(Mon)-20(tant)] TJ ET')
+    pdf = tmp_path / 'doc.pdf'
+    pdf.write_bytes(b'%%PDF-1.4\n1 0 obj\n<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content)
+                    + content + b'\nendstream\nendobj\n' + b'%' * (2 * PREVIEW_MAX_BYTES))
+    preview = extract_preview(str(pdf), '.pdf')
+    assert preview.text == 'Facture n\u00b0 42 Montant'
+    assert preview.bytes_read == PREVIEW_MAX_BYTES
+
+    docx = tmp_path / 'lettre.docx'
+    with zipfile.ZipFile(docx, 'w', zipfile.ZIP_DEFLATED) as archive:
+        body = ''.join(f'<w:p><w:r><w:t>Cher client {i}</w:t></w:r></w:p>' for i in range(100000))
+        archive.writestr('word/document.xml', f'<w:document><w:body>{body}</w:body></w:document>')
+    preview = extract_preview(str(docx), '.docx')
+    assert preview.text.startswith('Cher client 0 Cher client 1')
+    assert preview.bytes_read < docx.stat().st_size / 10
+
+    # Chaîne hexadécimale de longueur impaire : dernier chiffre complété par 0, le reste est conservé
+    content = zlib.compress(b'BT (Rapport) Tj T* <48656C6C6F7> Tj T* (annuel) Tj ET')
+    odd = tmp_path / 'odd.pdf'
+    odd.write_bytes(b'%%PDF-1.4\n1 0 obj\n<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content)
+                    + content + b'\nendstream\nendobj\n')
+    assert extract_preview(str(odd), '.pdf').text == 'Rapport Hellop annuel'
+
+    assert extract_preview(str(tmp_path / 'absent.pdf'), '.pdf') == (None, 0)
+    assert extract_preview(str(small), '.bin') == (None, 0)
+
+
+def _slow_preview(path, ext):
+    """Extracteur factice exécuté dans le pool (doit être importable)"""
+    import time
+    from server import Preview
+    if 'hang' in path:
+        time.sleep(60)
+    return Preview(f'texte de {path}', 42)
+
+
+def test_preview_extractor_timeout_and_prefetch():
+    """Test du timeout dur par fichier et du préchargement"""
+    from server import PreviewExtractor
+
+    extractor = PreviewExtractor(workers=1, timeout=2, extensions={'.pdf'}, target=_slow_preview)
+    try:
+        # Fichier bloqué : abandonné au timeout, le pool est recyclé
+        assert extractor.extract('/tmp/hang.pdf', '.pdf') is None
+        # Le fichier suivant passe dans un pool neuf, via le préchargement
+        extractor.prefetch('/tmp/ok.pdf', '.pdf')
+        assert extractor.extract('/tmp/ok.pdf', '.pdf') == 'texte de /tmp/ok.pdf'
+        stats = extractor.stats()
+        assert stats['timeouts'] == 1
+        assert stats['prefetch_hits'] == 1
+        assert stats['bytes_read'] == 42
+        # Les formats simples restent lus en ligne
+        assert not extractor.handles('.txt')
+    finally:
+        extractor.shutdown()
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])